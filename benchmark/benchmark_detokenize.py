@@ -0,0 +1,112 @@
+# Copyright 2022-2025 XProbe Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import random
+import time
+
+from utils import get_tokenizer
+
+from xinference.model.llm.transformers.utils import IncrementalDetokenizer
+
+DECODE_KWARGS = dict(
+    skip_special_tokens=True,
+    spaces_between_special_tokens=False,
+    clean_up_tokenization_spaces=True,
+)
+
+
+def full_decode(tokenizer, token_ids, last_output_length):
+    # the way to decode stream chunks before the incremental detokenizer
+    output = tokenizer.decode(token_ids, **DECODE_KWARGS).strip("�")
+    return output[last_output_length:]
+
+
+def bench_full(tokenizer, token_ids, checkpoints):
+    costs = {}
+    last_output_length = 0
+    s = time.perf_counter()
+    for i in range(1, len(token_ids) + 1):
+        output = full_decode(tokenizer, token_ids[:i], last_output_length)
+        last_output_length += len(output)
+        if i in checkpoints:
+            costs[i] = (time.perf_counter() - s) / checkpoints[i]
+            s = time.perf_counter()
+    return costs
+
+
+def bench_incremental(tokenizer, token_ids, checkpoints):
+    costs = {}
+    detokenizer = IncrementalDetokenizer(tokenizer)
+    s = time.perf_counter()
+    for i in range(1, len(token_ids) + 1):
+        detokenizer.decode(token_ids[:i])
+        if i in checkpoints:
+            costs[i] = (time.perf_counter() - s) / checkpoints[i]
+            s = time.perf_counter()
+    return costs
+
+
+def main(args: argparse.Namespace):
+    print(args)
+    random.seed(args.seed)
+
+    tokenizer = get_tokenizer(args.tokenizer, trust_remote_code=args.trust_remote_code)
+    special_ids = set(tokenizer.all_special_ids)
+    vocab = [i for i in range(len(tokenizer)) if i not in special_ids]
+    token_ids = [random.choice(vocab) for _ in range(args.output_len)]
+
+    # measure the average cost of the tokens in each window
+    checkpoints = {}
+    prev = 0
+    step = args.output_len // args.num_windows
+    for i in range(1, args.num_windows + 1):
+        end = args.output_len if i == args.num_windows else i * step
+        checkpoints[end] = end - prev
+        prev = end
+
+    full_costs = bench_full(tokenizer, token_ids, checkpoints)
+    incremental_costs = bench_incremental(tokenizer, token_ids, checkpoints)
+
+    print(f"{'output tokens':>15}{'full (us/token)':>20}{'incremental (us/token)':>25}")
+    for end in checkpoints:
+        print(
+            f"{end:>15}{full_costs[end] * 1e6:>20.1f}{incremental_costs[end] * 1e6:>25.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the per-token cost of detokenizing stream outputs."
+    )
+    parser.add_argument(
+        "--tokenizer", type=str, required=True, help="Name or path of the tokenizer."
+    )
+    parser.add_argument(
+        "--output-len", type=int, default=8192, help="Number of generated tokens."
+    )
+    parser.add_argument(
+        "--num-windows",
+        type=int,
+        default=8,
+        help="Number of windows to report the per-token cost.",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--trust-remote-code",
+        action="store_true",
+        help="Trust remote code from huggingface.",
+    )
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,172 @@
+# Copyright 2022-2025 XProbe Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import asyncio
+import random
+import tempfile
+import time
+from concurrent.futures import Future
+
+import torch
+from utils import get_tokenizer
+
+from xinference.model.llm.llm_family import LLMFamilyV2, PytorchLLMSpecV2
+from xinference.model.llm.transformers.core import PytorchModel
+
+
+def create_tiny_model(tokenizer, args, path: str):
+    from transformers import LlamaConfig, LlamaForCausalLM
+
+    config = LlamaConfig(
+        vocab_size=len(tokenizer),
+        hidden_size=args.hidden_size,
+        intermediate_size=args.hidden_size * 2,
+        num_hidden_layers=args.num_layers,
+        num_attention_heads=args.num_heads,
+        num_key_value_heads=args.num_heads,
+        max_position_embeddings=8192,
+        eos_token_id=tokenizer.eos_token_id,
+    )
+    LlamaForCausalLM(config).save_pretrained(path)
+    tokenizer.padding_side = "left"
+    tokenizer.save_pretrained(path)
+
+
+def load_model(path: str, batching_mode: str, max_num_seqs: int) -> PytorchModel:
+    spec = PytorchLLMSpecV2(
+        model_format="pytorch",
+        model_size_in_billions=1,
+        quantization="none",
+        model_id="tiny",
+    )
+    family = LLMFamilyV2(
+        version=2,
+        model_name="tiny",
+        model_lang=["en"],
+        model_ability=["generate"],
+        model_specs=[spec],
+    )
+    model = PytorchModel(
+        "tiny-0",
+        family,
+        path,
+        {
+            "device": "cpu",
+            "torch_dtype": "float32",
+            "max_num_seqs": max_num_seqs,
+            "batching_mode": batching_mode,
+        },
+    )
+    model.load()
+    return model
+
+
+async def run_workload(model: PytorchModel, requests):
+    scheduler = model._batch_scheduler
+    # (step to arrive, prompt, max_tokens)
+    pending = sorted(requests, key=lambda x: x[0])
+    futures = []
+    step = 0
+    step_time = 0.0
+    while pending or scheduler._running_queue or scheduler._waiting_queue:
+        while pending and pending[0][0] <= step:
+            _, prompt, max_tokens = pending.pop(0)
+            future: Future = Future()
+            await scheduler.add_request(
+                prompt,
+                future,
+                "generate",
+                {"max_tokens": max_tokens, "temperature": 0},
+            )
+            futures.append(future)
+        s = time.perf_counter()
+        await scheduler.step()
+        step_time += time.perf_counter() - s
+        step += 1
+    for future in futures:
+        future.result()
+    return step_time
+
+
+def main(args: argparse.Namespace):
+    print(args)
+    random.seed(args.seed)
+
+    tokenizer = get_tokenizer(args.tokenizer, trust_remote_code=args.trust_remote_code)
+    words = ["hello", "world", "model", "serving", "cache", "batch", "token"]
+    requests = []
+    for i in range(args.num_prompts):
+        prompt_len = random.randint(args.prompt_len // 2, args.prompt_len)
+        prompt = " ".join(random.choice(words) for _ in range(prompt_len))
+        max_tokens = random.randint(args.output_len // 2, args.output_len)
+        # a new request arrives every `arrival_interval` steps
+        requests.append((i * args.arrival_interval, prompt, max_tokens))
+
+    with tempfile.TemporaryDirectory() as path:
+        create_tiny_model(tokenizer, args, path)
+        results = {}
+        for mode in ["default", "kv_arena"]:
+            torch.manual_seed(args.seed)
+            model = load_model(path, mode, args.max_num_seqs)
+            merge_time = 0.0
+
+            def _timed(fn):
+                def _wrapper(*a, **kw):
+                    nonlocal merge_time
+                    s = time.perf_counter()
+                    try:
+                        return fn(*a, **kw)
+                    finally:
+                        merge_time += time.perf_counter() - s
+
+                return _wrapper
+
+            model.merge_kv_cache = _timed(model.merge_kv_cache)
+            model.build_reduced_kv_cache = _timed(model.build_reduced_kv_cache)
+            arena = model.get_kv_arena()
+            if arena is not None:
+                arena.admit = _timed(arena.admit)
+                arena.release_stopped = _timed(arena.release_stopped)
+            step_time = asyncio.run(run_workload(model, requests))
+            results[mode] = (step_time, merge_time)
+
+    print(f"{'mode':>10}{'total (s)':>12}{'admit + retire (s)':>22}")
+    for mode, (step_time, merge_time) in results.items():
+        print(f"{mode:>10}{step_time:>12.2f}{merge_time:>22.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the KV cache merging of continuous batching on a tiny model on CPU."
+    )
+    parser.add_argument(
+        "--tokenizer", type=str, required=True, help="Name or path of the tokenizer."
+    )
+    parser.add_argument("--num-prompts", type=int, default=64)
+    parser.add_argument("--prompt-len", type=int, default=512)
+    parser.add_argument("--output-len", type=int, default=128)
+    parser.add_argument("--arrival-interval", type=int, default=1)
+    parser.add_argument("--max-num-seqs", type=int, default=16)
+    parser.add_argument("--hidden-size", type=int, default=256)
+    parser.add_argument("--num-layers", type=int, default=8)
+    parser.add_argument("--num-heads", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--trust-remote-code",
+        action="store_true",
+        help="Trust remote code from huggingface.",
+    )
+    args = parser.parse_args()
+    main(args)
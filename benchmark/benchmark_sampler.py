@@ -0,0 +1,104 @@
+# Copyright 2022-2025 XProbe Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import time
+
+import torch
+
+from xinference.model.llm.transformers.utils import (
+    _get_token_from_logits,
+    _get_tokens_from_logits,
+)
+from xinference.model.scheduler.request import InferenceRequest
+
+# (temperature, repetition_penalty, top_p, top_k)
+SAMPLING_PARAMS = {
+    # the default values of the generate config
+    "default": (0.8, 1.1, 0.95, 40),
+    "greedy": (0.0, 1.0, 1.0, -1),
+    "greedy+penalty": (0.0, 1.1, 1.0, -1),
+    "top_p": (0.7, 1.0, 0.8, -1),
+}
+
+
+def make_requests(batch_size: int, vocab_size: int, prompt_len: int, output_len: int):
+    reqs = []
+    for _ in range(batch_size):
+        r = InferenceRequest("", None, False, "generate", None)
+        r.prompt_tokens = torch.randint(0, vocab_size, (prompt_len,)).tolist()
+        for token in torch.randint(0, vocab_size, (output_len,)).tolist():
+            r.append_new_token(token)
+        reqs.append(r)
+    return reqs
+
+
+def bench_per_request(reqs, logits, params, num_iters):
+    s = time.perf_counter()
+    for _ in range(num_iters):
+        for i, r in enumerate(reqs):
+            temperature, repetition_penalty, top_p, top_k = params
+            if temperature < 1e-5 and repetition_penalty <= 1.0:
+                # no logits processors, the per-request path only supports one row here
+                torch.argmax(logits[i, -1, :]).item()
+            else:
+                _get_token_from_logits(
+                    r, i, logits, temperature, repetition_penalty, top_p, top_k
+                )
+    return (time.perf_counter() - s) / num_iters
+
+
+def bench_batched(reqs, logits, params, num_iters):
+    configs = [(0, 0, False, None, set(), *params)] * len(reqs)
+    s = time.perf_counter()
+    for _ in range(num_iters):
+        _get_tokens_from_logits(reqs, logits, configs)
+    return (time.perf_counter() - s) / num_iters
+
+
+def main(args: argparse.Namespace):
+    print(args)
+    torch.manual_seed(args.seed)
+    torch.set_num_threads(args.num_threads)
+
+    print(
+        f"{'params':>16}{'batch size':>12}{'per-request (ms)':>20}{'batched (ms)':>16}{'speedup':>10}"
+    )
+    for name, params in SAMPLING_PARAMS.items():
+        for batch_size in args.batch_sizes:
+            reqs = make_requests(
+                batch_size, args.vocab_size, args.prompt_len, args.output_len
+            )
+            logits = torch.randn(batch_size, 1, args.vocab_size)
+            per_request = bench_per_request(reqs, logits, params, args.num_iters)
+            batched = bench_batched(reqs, logits, params, args.num_iters)
+            print(
+                f"{name:>16}{batch_size:>12}{per_request * 1e3:>20.2f}"
+                f"{batched * 1e3:>16.2f}{per_request / batched:>10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark sampling the next tokens for a batch of requests on CPU."
+    )
+    parser.add_argument("--vocab-size", type=int, default=151936)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 16, 32])
+    parser.add_argument("--prompt-len", type=int, default=512)
+    parser.add_argument("--output-len", type=int, default=256)
+    parser.add_argument("--num-iters", type=int, default=20)
+    parser.add_argument("--num-threads", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    main(args)
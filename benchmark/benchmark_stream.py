@@ -0,0 +1,150 @@
+# Copyright 2022-2025 XProbe Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import asyncio
+import json
+import time
+
+import sse_starlette.sse
+import xoscar as xo
+
+from xinference.core.model import ModelActor
+
+
+class MockModelFamily:
+    def to_description(self) -> dict:
+        return {}
+
+
+class MockStreamModel:
+    """
+    Streams chat completion chunks as fast as the consumer takes them.
+    """
+
+    def __init__(self, num_chunks: int):
+        self.model_family = MockModelFamily()
+        self.num_chunks = num_chunks
+
+    async def generate(self, prompt, **kwargs):
+        for i in range(self.num_chunks):
+            yield {
+                "id": "chatcmpl-benchmark",
+                "object": "chat.completion.chunk",
+                "created": 0,
+                "model": "benchmark",
+                "choices": [
+                    {
+                        "index": 0,
+                        "delta": {"content": f"tok{i} "},
+                        "finish_reason": None,
+                    }
+                ],
+            }
+            # give the other streams a turn
+            await asyncio.sleep(0)
+
+
+class BenchmarkModelActor(ModelActor):
+    def __init__(self, num_chunks: int, flush_interval: float):
+        super().__init__(
+            supervisor_address="benchmark:0",
+            worker_address="benchmark:0",
+            model=MockStreamModel(num_chunks),  # type: ignore
+            replica_model_uid="benchmark",
+        )
+        self._lock = None
+        self._stream_flush_interval = flush_interval
+
+    async def __pre_destroy__(self):
+        pass
+
+    async def record_metrics(self, name, op, kwargs):
+        pass
+
+
+class ThreadedModelActor(BenchmarkModelActor):
+    async def _to_async_gen(self, output_type, gen):
+        # the way to encode stream chunks before the inline fast path,
+        # two thread hops per chunk
+        async for v in gen:
+            v = await asyncio.to_thread(json.dumps, v, ensure_ascii=False)
+            yield await asyncio.to_thread(
+                sse_starlette.sse.ensure_bytes, dict(data=v), None
+            )
+
+
+async def bench(actor_cls, args: argparse.Namespace, flush_interval: float) -> float:
+    pool = await xo.create_actor_pool("127.0.0.1", n_process=0)
+    async with pool:
+        actor = await xo.create_actor(
+            actor_cls,
+            args.num_chunks,
+            flush_interval,
+            address=pool.external_address,
+            uid=f"{actor_cls.__name__}-{flush_interval}",
+        )
+
+        async def stream() -> int:
+            gen = await actor.generate("prompt")
+            num_chunks = 0
+            async for data in gen:
+                num_chunks += data.count(b"data: ")
+            return num_chunks
+
+        start = time.perf_counter()
+        counts = await asyncio.gather(*[stream() for _ in range(args.num_streams)])
+        cost = time.perf_counter() - start
+        assert sum(counts) == args.num_streams * args.num_chunks
+        await xo.destroy_actor(actor)
+    return sum(counts) / cost
+
+
+async def main(args: argparse.Namespace):
+    print(args)
+    results = [
+        ("thread hops", await bench(ThreadedModelActor, args, 0)),
+        ("inline", await bench(BenchmarkModelActor, args, 0)),
+    ]
+    for interval in args.flush_intervals:
+        results.append(
+            (
+                f"inline, flush {interval * 1000:g}ms",
+                await bench(BenchmarkModelActor, args, interval),
+            )
+        )
+    print(f"{'mode':>25}{'chunks/s per actor':>22}")
+    for mode, throughput in results:
+        print(f"{mode:>25}{throughput:>22.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the chunks per second a model actor streams."
+    )
+    parser.add_argument(
+        "--num-streams", type=int, default=100, help="Number of concurrent streams."
+    )
+    parser.add_argument(
+        "--num-chunks", type=int, default=200, help="Number of chunks of a stream."
+    )
+    parser.add_argument(
+        "--flush-intervals",
+        type=float,
+        nargs="*",
+        default=[0.005, 0.02],
+        help="Seconds the chunks are coalesced into one message.",
+    )
+    args = parser.parse_args()
+    asyncio.run(main(args))
@@ -22,7 +22,7 @@ import pprint
 import sys
 import time
 import warnings
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 import gradio as gr
 import xoscar as xo
@@ -60,7 +60,7 @@ from ..constants import (
 )
 from ..core.event import Event, EventCollectorActor, EventType
 from ..core.supervisor import SupervisorActor
-from ..core.utils import CancelMixin, json_dumps
+from ..core.utils import CancelMixin, json_dumps, parse_replica_model_uid
 from ..types import (
     ChatCompletion,
     Completion,
@@ -74,6 +74,8 @@ from ..types import (
 )
 from .oauth2.auth_service import AuthService
 from .oauth2.types import LoginUserForm
+from .routing_cache import ModelRoutingCache
+from .sse import coalesce_stream, pop_coalesce_options
 
 logger = logging.getLogger(__name__)
 
@@ -99,6 +101,19 @@ class CreateEmbeddingRequest(BaseModel):
         str, List[str], List[int], List[List[int]], Dict[str, str], List[Dict[str, str]]
     ] = Field(description="The input to embed.")
     user: Optional[str] = None
+    encoding_format: Optional[str] = Field(
+        default=None,
+        description="`float`, `base64` or `binary`, "
+        "the binary embeddings are returned as an octet stream.",
+    )
+    dimensions: Optional[int] = Field(
+        default=None,
+        description="The dimensions of the embeddings truncated, for Matryoshka models.",
+    )
+    embedding_dtype: Optional[str] = Field(
+        default=None,
+        description="`float32` or `float16`, the dtype of the base64 or binary embeddings.",
+    )
 
     class Config:
         schema_extra = {
@@ -226,6 +241,7 @@ class RESTfulAPI(CancelMixin):
         self._port = port
         self._supervisor_ref = None
         self._event_collector_ref = None
+        self._routing_cache = ModelRoutingCache(self._get_supervisor_ref)
         self._auth_service = AuthService(auth_config_file)
         self._router = APIRouter()
         self._app = FastAPI()
@@ -521,6 +537,26 @@ class RESTfulAPI(CancelMixin):
                 else None
             ),
         )
+        self._router.add_api_route(
+            "/v1/models/{model_uid}/sleep",
+            self.sleep_model,
+            methods=["POST"],
+            dependencies=(
+                [Security(self._auth_service, scopes=["models:stop"])]
+                if self.is_authenticated()
+                else None
+            ),
+        )
+        self._router.add_api_route(
+            "/v1/models/{model_uid}/wake",
+            self.wake_model,
+            methods=["POST"],
+            dependencies=(
+                [Security(self._auth_service, scopes=["models:start"])]
+                if self.is_authenticated()
+                else None
+            ),
+        )
         self._router.add_api_route(
             "/v1/completions",
             self.create_completion,
@@ -1152,6 +1188,31 @@ class RESTfulAPI(CancelMixin):
             raise HTTPException(status_code=500, detail=str(e))
         return JSONResponse(content=None)
 
+    async def sleep_model(self, model_uid: str) -> JSONResponse:
+        try:
+            await (await self._get_supervisor_ref()).sleep_model(model_uid)
+        except ValueError as ve:
+            logger.error(str(ve), exc_info=True)
+            raise HTTPException(status_code=400, detail=str(ve))
+        except RuntimeError as re:
+            logger.error(str(re), exc_info=True)
+            raise HTTPException(status_code=409, detail=str(re))
+        except Exception as e:
+            logger.error(str(e), exc_info=True)
+            raise HTTPException(status_code=500, detail=str(e))
+        return JSONResponse(content=None)
+
+    async def wake_model(self, model_uid: str) -> JSONResponse:
+        try:
+            await (await self._get_supervisor_ref()).wake_model(model_uid)
+        except ValueError as ve:
+            logger.error(str(ve), exc_info=True)
+            raise HTTPException(status_code=400, detail=str(ve))
+        except Exception as e:
+            logger.error(str(e), exc_info=True)
+            raise HTTPException(status_code=500, detail=str(e))
+        return JSONResponse(content=None)
+
     async def launch_model_by_version(
         self, request: Request, wait_ready: bool = Query(True)
     ) -> JSONResponse:
@@ -1327,6 +1388,10 @@ class RESTfulAPI(CancelMixin):
         if not isinstance(e, xo.ServerClosed):
             return e
         try:
+            # the model actor is down, which may be recreated
+            self._routing_cache.invalidate(
+                parse_replica_model_uid(replica_model_uid.decode("utf-8"))[0]
+            )
             model_status = await (await self._get_supervisor_ref()).get_model_status(
                 replica_model_uid.decode("utf-8")
             )
@@ -1336,6 +1401,14 @@ class RESTfulAPI(CancelMixin):
             return ex
         return e
 
+    @staticmethod
+    def _get_session_id(request: Request, raw_body: Dict) -> Optional[str]:
+        """
+        The session of a request, from the `X-Session-Id` header or the `user` field,
+        so that the requests of the session go to the same replica with session affinity.
+        """
+        return request.headers.get("X-Session-Id") or raw_body.get("user")
+
     async def create_completion(self, request: Request) -> Response:
         raw_body = await request.json()
         body = CreateCompletionRequest.parse_obj(raw_body)
@@ -1346,7 +1419,6 @@ class RESTfulAPI(CancelMixin):
             "best_of",
             "logit_bias",
             "logit_bias_type",
-            "user",
         }
         raw_kwargs = {k: v for k, v in raw_body.items() if k not in exclude}
         kwargs = body.dict(exclude_unset=True, exclude=exclude)
@@ -1361,10 +1433,15 @@ class RESTfulAPI(CancelMixin):
         if body.logit_bias is not None:
             raise HTTPException(status_code=501, detail="Not implemented")
 
+        coalesce_interval, coalesce_max_bytes = self._pop_coalesce_options(
+            kwargs, raw_kwargs
+        )
         model_uid = body.model
 
         try:
-            model = await (await self._get_supervisor_ref()).get_model(model_uid)
+            model = await self._routing_cache.get_model(
+                model_uid, self._get_session_id(request, raw_body)
+            )
         except ValueError as ve:
             logger.error(str(ve), exc_info=True)
             await self._report_error_event(model_uid, str(ve))
@@ -1386,6 +1463,10 @@ class RESTfulAPI(CancelMixin):
                         )
                     except RuntimeError as re:
                         self.handle_request_limit_error(re)
+                    if coalesce_interval > 0:
+                        iterator = coalesce_stream(
+                            iterator, coalesce_interval, coalesce_max_bytes
+                        )
                     async for item in iterator:
                         yield item
                 except asyncio.CancelledError:
@@ -1425,12 +1506,20 @@ class RESTfulAPI(CancelMixin):
             "model",
             "input",
             "user",
-            "encoding_format",
         }
         kwargs = {key: value for key, value in payload.items() if key not in exclude}
+        from ..model.embedding.encoding import (
+            pack_binary_embedding,
+            pop_encoding_format,
+        )
 
         try:
-            model = await (await self._get_supervisor_ref()).get_model(model_uid)
+            pop_encoding_format(dict(kwargs))
+        except ValueError as ve:
+            raise HTTPException(status_code=400, detail=str(ve))
+
+        try:
+            model = await self._routing_cache.get_model(model_uid)
         except ValueError as ve:
             logger.error(str(ve), exc_info=True)
             await self._report_error_event(model_uid, str(ve))
@@ -1443,6 +1532,13 @@ class RESTfulAPI(CancelMixin):
         try:
             kwargs["model_uid"] = model_uid
             embedding = await model.create_embedding(body.input, **kwargs)
+            if body.encoding_format == "binary":
+                content, headers = pack_binary_embedding(
+                    embedding, body.embedding_dtype or "float32"
+                )
+                return Response(
+                    content, media_type="application/octet-stream", headers=headers
+                )
             return Response(embedding, media_type="application/json")
         except Exception as e:
             e = await self._get_model_last_error(model.uid, e)
@@ -1463,7 +1559,7 @@ class RESTfulAPI(CancelMixin):
         kwargs = {key: value for key, value in payload.items() if key not in exclude}
 
         try:
-            model = await (await self._get_supervisor_ref()).get_model(model_uid)
+            model = await self._routing_cache.get_model(model_uid)
         except ValueError as ve:
             logger.error(str(ve), exc_info=True)
             await self._report_error_event(model_uid, str(ve))
@@ -1489,7 +1585,7 @@ class RESTfulAPI(CancelMixin):
         model_uid = body.model
 
         try:
-            model = await (await self._get_supervisor_ref()).get_model(model_uid)
+            model = await self._routing_cache.get_model(model_uid)
         except ValueError as ve:
             logger.error(str(ve), exc_info=True)
             await self._report_error_event(model_uid, str(ve))
@@ -1538,7 +1634,7 @@ class RESTfulAPI(CancelMixin):
             timestamp_granularities = [timestamp_granularities]
         model_uid = model
         try:
-            model_ref = await (await self._get_supervisor_ref()).get_model(model_uid)
+            model_ref = await self._routing_cache.get_model(model_uid)
         except ValueError as ve:
             logger.error(str(ve), exc_info=True)
             await self._report_error_event(model_uid, str(ve))
@@ -1587,7 +1683,7 @@ class RESTfulAPI(CancelMixin):
             timestamp_granularities = [timestamp_granularities]
         model_uid = model
         try:
-            model_ref = await (await self._get_supervisor_ref()).get_model(model_uid)
+            model_ref = await self._routing_cache.get_model(model_uid)
         except ValueError as ve:
             logger.error(str(ve), exc_info=True)
             await self._report_error_event(model_uid, str(ve))
@@ -1636,7 +1732,7 @@ class RESTfulAPI(CancelMixin):
         body = SpeechRequest.parse_obj(f)
         model_uid = body.model
         try:
-            model = await (await self._get_supervisor_ref()).get_model(model_uid)
+            model = await self._routing_cache.get_model(model_uid)
         except ValueError as ve:
             logger.error(str(ve), exc_info=True)
             await self._report_error_event(model_uid, str(ve))
@@ -1701,7 +1797,7 @@ class RESTfulAPI(CancelMixin):
         body = TextToImageRequest.parse_obj(await request.json())
         model_uid = body.model
         try:
-            model = await (await self._get_supervisor_ref()).get_model(model_uid)
+            model = await self._routing_cache.get_model(model_uid)
         except ValueError as ve:
             logger.error(str(ve), exc_info=True)
             await self._report_error_event(model_uid, str(ve))
@@ -1743,7 +1839,7 @@ class RESTfulAPI(CancelMixin):
         try:
             if not model_uid:
                 raise ValueError("Unknown model")
-            await (await self._get_supervisor_ref()).get_model(model_uid)
+            await self._routing_cache.get_model(model_uid)
             return Response()
         except ValueError as ve:
             logger.error(str(ve), exc_info=True)
@@ -1787,7 +1883,7 @@ class RESTfulAPI(CancelMixin):
         try:
             if not model_uid:
                 raise ValueError("Unknown model")
-            model = await (await self._get_supervisor_ref()).get_model(model_uid)
+            model = await self._routing_cache.get_model(model_uid)
         except ValueError as ve:
             logger.error(str(ve), exc_info=True)
             await self._report_error_event(model_uid, str(ve))
@@ -1818,7 +1914,7 @@ class RESTfulAPI(CancelMixin):
         try:
             if not model_uid:
                 raise ValueError("Unknown model")
-            model = await (await self._get_supervisor_ref()).get_model(model_uid)
+            model = await self._routing_cache.get_model(model_uid)
         except ValueError as ve:
             logger.error(str(ve), exc_info=True)
             await self._report_error_event(model_uid, str(ve))
@@ -1855,7 +1951,7 @@ class RESTfulAPI(CancelMixin):
     ) -> Response:
         model_uid = model
         try:
-            model_ref = await (await self._get_supervisor_ref()).get_model(model_uid)
+            model_ref = await self._routing_cache.get_model(model_uid)
         except ValueError as ve:
             logger.error(str(ve), exc_info=True)
             await self._report_error_event(model_uid, str(ve))
@@ -1909,7 +2005,7 @@ class RESTfulAPI(CancelMixin):
     ) -> Response:
         model_uid = model
         try:
-            model_ref = await (await self._get_supervisor_ref()).get_model(model_uid)
+            model_ref = await self._routing_cache.get_model(model_uid)
         except ValueError as ve:
             logger.error(str(ve), exc_info=True)
             await self._report_error_event(model_uid, str(ve))
@@ -1963,7 +2059,7 @@ class RESTfulAPI(CancelMixin):
     ) -> Response:
         model_uid = model
         try:
-            model_ref = await (await self._get_supervisor_ref()).get_model(model_uid)
+            model_ref = await self._routing_cache.get_model(model_uid)
         except ValueError as ve:
             logger.error(str(ve), exc_info=True)
             await self._report_error_event(model_uid, str(ve))
@@ -2009,7 +2105,7 @@ class RESTfulAPI(CancelMixin):
         kwargs = {key: value for key, value in payload.items() if key not in exclude}
 
         try:
-            model = await (await self._get_supervisor_ref()).get_model(model_uid)
+            model = await self._routing_cache.get_model(model_uid)
         except ValueError as ve:
             logger.error(str(ve), exc_info=True)
             await self._report_error_event(model_uid, str(ve))
@@ -2033,7 +2129,7 @@ class RESTfulAPI(CancelMixin):
         body = TextToVideoRequest.parse_obj(await request.json())
         model_uid = body.model
         try:
-            model = await (await self._get_supervisor_ref()).get_model(model_uid)
+            model = await self._routing_cache.get_model(model_uid)
         except ValueError as ve:
             logger.error(str(ve), exc_info=True)
             await self._report_error_event(model_uid, str(ve))
@@ -2077,7 +2173,7 @@ class RESTfulAPI(CancelMixin):
     ) -> Response:
         model_uid = model
         try:
-            model_ref = await (await self._get_supervisor_ref()).get_model(model_uid)
+            model_ref = await self._routing_cache.get_model(model_uid)
         except ValueError as ve:
             logger.error(str(ve), exc_info=True)
             await self._report_error_event(model_uid, str(ve))
@@ -2127,7 +2223,7 @@ class RESTfulAPI(CancelMixin):
     ) -> Response:
         model_uid = model
         try:
-            model_ref = await (await self._get_supervisor_ref()).get_model(model_uid)
+            model_ref = await self._routing_cache.get_model(model_uid)
         except ValueError as ve:
             logger.error(str(ve), exc_info=True)
             await self._report_error_event(model_uid, str(ve))
@@ -2176,7 +2272,6 @@ class RESTfulAPI(CancelMixin):
             "messages",
             "logit_bias",
             "logit_bias_type",
-            "user",
             "max_completion_tokens",
         }
 
@@ -2196,6 +2291,9 @@ class RESTfulAPI(CancelMixin):
         if body.logit_bias is not None:
             raise HTTPException(status_code=501, detail="Not implemented")
 
+        coalesce_interval, coalesce_max_bytes = self._pop_coalesce_options(
+            kwargs, raw_kwargs
+        )
         messages = body.messages and list(body.messages) or None
 
         if not messages or messages[-1].get("role") not in ["user", "system", "tool"]:
@@ -2207,18 +2305,8 @@ class RESTfulAPI(CancelMixin):
         model_uid = body.model
 
         try:
-            model = await (await self._get_supervisor_ref()).get_model(model_uid)
-        except ValueError as ve:
-            logger.error(str(ve), exc_info=True)
-            await self._report_error_event(model_uid, str(ve))
-            raise HTTPException(status_code=400, detail=str(ve))
-        except Exception as e:
-            logger.error(e, exc_info=True)
-            await self._report_error_event(model_uid, str(e))
-            raise HTTPException(status_code=500, detail=str(e))
-
-        try:
-            desc = await (await self._get_supervisor_ref()).describe_model(model_uid)
+            route = await self._routing_cache.get_route(model_uid)
+            model = await route.select_replica(self._get_session_id(request, raw_body))
         except ValueError as ve:
             logger.error(str(ve), exc_info=True)
             await self._report_error_event(model_uid, str(ve))
@@ -2234,7 +2322,7 @@ class RESTfulAPI(CancelMixin):
             TOOL_CALL_FAMILY,
         )
 
-        model_family = desc.get("model_family", "")
+        model_family = route.description.get("model_family", "")
 
         if model_family not in TOOL_CALL_FAMILY:
             if body.tools:
@@ -2248,8 +2336,8 @@ class RESTfulAPI(CancelMixin):
                     detail=f"Only {TOOL_CALL_FAMILY} support tool messages",
                 )
         if body.tools and body.stream:
-            is_vllm = await model.is_vllm_backend()
-            is_sglang = await model.is_sglang_backend()
+            is_vllm = route.is_vllm_backend
+            is_sglang = route.is_sglang_backend
             if not (
                 ((is_vllm or is_sglang) and model_family in QWEN_TOOL_CALL_FAMILY)
                 or (not is_vllm and model_family in GLM4_TOOL_CALL_FAMILY)
@@ -2259,7 +2347,7 @@ class RESTfulAPI(CancelMixin):
                     detail="Streaming support for tool calls is available only when using "
                     "Qwen models with vLLM backend or GLM4-chat models without vLLM backend.",
                 )
-        if "skip_special_tokens" in raw_kwargs and await model.is_vllm_backend():
+        if "skip_special_tokens" in raw_kwargs and route.is_vllm_backend:
             kwargs["skip_special_tokens"] = raw_kwargs["skip_special_tokens"]
         if body.stream:
 
@@ -2275,6 +2363,10 @@ class RESTfulAPI(CancelMixin):
                     except RuntimeError as re:
                         await self._report_error_event(model_uid, str(re))
                         self.handle_request_limit_error(re)
+                    if coalesce_interval > 0:
+                        iterator = coalesce_stream(
+                            iterator, coalesce_interval, coalesce_max_bytes
+                        )
                     async for item in iterator:
                         yield item
                     yield "[DONE]"
@@ -2556,6 +2648,22 @@ class RESTfulAPI(CancelMixin):
             logger.error(e, exc_info=True)
             raise HTTPException(status_code=500, detail=str(e))
 
+    @staticmethod
+    def _pop_coalesce_options(kwargs: dict, raw_kwargs: dict) -> Tuple[float, int]:
+        """
+        Pop the options to merge the deltas of a stream from `stream_options`,
+        which are not passed to the model.
+        """
+        try:
+            options = pop_coalesce_options(kwargs.get("stream_options"))
+            pop_coalesce_options(raw_kwargs.get("stream_options"))
+        except (TypeError, ValueError) as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        for d in (kwargs, raw_kwargs):
+            if d.get("stream_options") == {}:
+                d["stream_options"] = None
+        return options
+
     @staticmethod
     def extract_guided_params(raw_body: dict) -> dict:
         kwargs = {}
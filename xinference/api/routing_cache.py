@@ -0,0 +1,157 @@
+# Copyright 2022-2025 XProbe Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, Optional
+
+import xoscar as xo
+
+from ..core.replica_selector import ReplicaSelector, get_replica_selector
+
+if TYPE_CHECKING:
+    from ..core.model import ModelActor
+    from ..core.supervisor import SupervisorActor
+
+logger = logging.getLogger(__name__)
+
+# seconds a watch of routing changes waits on the supervisor
+ROUTING_WATCH_TIMEOUT = 30
+# seconds to wait before watching again after the supervisor is unreachable
+ROUTING_WATCH_RETRY_INTERVAL = 1
+
+
+@dataclass
+class ModelRoute:
+    description: Dict[str, Any]
+    replica_refs: List[xo.ActorRefType["ModelActor"]]
+    is_vllm_backend: bool
+    is_sglang_backend: bool
+    selector: ReplicaSelector = field(default_factory=get_replica_selector)
+
+    async def _get_load(self, index: int) -> Dict[str, Any]:
+        return await self.replica_refs[index].get_load()
+
+    async def select_replica(
+        self, session_id: Optional[str] = None
+    ) -> xo.ActorRefType["ModelActor"]:
+        index = await self.selector.select(
+            len(self.replica_refs), self._get_load, session_id
+        )
+        return self.replica_refs[index]
+
+
+class ModelRoutingCache:
+    """
+    Cache of what the RESTful API needs to route the requests of a model:
+    the model description, the backend and the refs of all the replicas.
+    So the requests to a running model make no RPC to the supervisor.
+
+    Entries are invalidated when the supervisor reports that the routing of their models changed,
+    e.g. terminated, relaunched, or some replicas recreated.
+    The changes are watched by long polling the supervisor in the background,
+    and the cache is bypassed while the supervisor cannot be watched.
+    """
+
+    def __init__(
+        self,
+        get_supervisor_ref: Callable[[], Awaitable[xo.ActorRefType["SupervisorActor"]]],
+    ):
+        self._get_supervisor_ref = get_supervisor_ref
+        self._routes: Dict[str, ModelRoute] = {}
+        # the routing version of the supervisor which the cache is consistent with,
+        # -1 to get the current version at once
+        self._version = -1
+        # the latest routing version when each model changes, or all the models change
+        self._change_versions: Dict[str, int] = {}
+        self._clear_version = 0
+        self._watching = False
+        self._watch_task = None
+
+    def __contains__(self, model_uid: str) -> bool:
+        return model_uid in self._routes
+
+    def _ensure_watching(self):
+        if self._watch_task is None or self._watch_task.done():
+            self._watch_task = asyncio.create_task(self._watch())
+
+    async def _watch(self):
+        while True:
+            try:
+                supervisor_ref = await self._get_supervisor_ref()
+                version, changed = await supervisor_ref.watch_routing_changes(
+                    self._version, ROUTING_WATCH_TIMEOUT
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self._watching:
+                    logger.warning(
+                        "Failed to watch routing changes, bypass the routing cache: %s",
+                        e,
+                    )
+                self._watching = False
+                self.clear()
+                await asyncio.sleep(ROUTING_WATCH_RETRY_INTERVAL)
+                continue
+            if changed is None:
+                # too many changes, or the supervisor restarted
+                self.clear()
+                self._clear_version = version
+            else:
+                for model_uid in changed:
+                    self._change_versions[model_uid] = version
+                    self.invalidate(model_uid)
+            self._version = version
+            self._watching = True
+
+    def invalidate(self, model_uid: str):
+        if self._routes.pop(model_uid, None) is not None:
+            logger.debug("Invalidate the routing cache of model %s", model_uid)
+
+    def clear(self):
+        self._routes.clear()
+        self._change_versions.clear()
+
+    async def get_route(self, model_uid: str) -> ModelRoute:
+        self._ensure_watching()
+        route = self._routes.get(model_uid)
+        if route is not None:
+            return route
+        supervisor_ref = await self._get_supervisor_ref()
+        routing = await supervisor_ref.get_model_routing(model_uid)
+        route = ModelRoute(
+            description=routing["description"],
+            replica_refs=routing["replica_refs"],
+            is_vllm_backend=routing["is_vllm_backend"],
+            is_sglang_backend=routing["is_sglang_backend"],
+            selector=get_replica_selector(
+                routing["routing_policy"], routing["session_affinity"]
+            ),
+        )
+        # do not cache the routing which changed during fetching it
+        if self._watching and routing["version"] >= max(
+            self._change_versions.get(model_uid, 0), self._clear_version
+        ):
+            self._routes[model_uid] = route
+        return route
+
+    async def get_model(
+        self, model_uid: str, session_id: Optional[str] = None
+    ) -> xo.ActorRefType["ModelActor"]:
+        """
+        A replica of the model, selected by the replica routing policy of the supervisor.
+        """
+        return await (await self.get_route(model_uid)).select_replica(session_id)
@@ -0,0 +1,146 @@
+# Copyright 2022-2025 XProbe Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, List, Optional, Tuple
+
+from ..constants import (
+    XINFERENCE_SSE_COALESCE_INTERVAL,
+    XINFERENCE_SSE_COALESCE_MAX_BYTES,
+)
+from ..core.utils import coalesce_chunks, encode_sse_data
+
+SSE_DATA_PREFIX = b"data: "
+SSE_EVENT_SEPARATOR = b"\r\n\r\n"
+# the text fields of a choice which are concatenated when merging chunks
+TEXT_FIELDS = ("content", "reasoning_content", "text")
+
+
+def pop_coalesce_options(
+    stream_options: Optional[Dict[str, Any]],
+) -> Tuple[float, int]:
+    """
+    Pop `coalesce_interval` (seconds) and `coalesce_max_bytes` of a request
+    from its `stream_options`, defaulting to the ones of the deployment.
+    """
+    interval = XINFERENCE_SSE_COALESCE_INTERVAL
+    max_bytes = XINFERENCE_SSE_COALESCE_MAX_BYTES
+    if isinstance(stream_options, dict):
+        interval = float(stream_options.pop("coalesce_interval", interval) or 0)
+        max_bytes = int(stream_options.pop("coalesce_max_bytes", max_bytes))
+    if interval < 0 or max_bytes <= 0:
+        raise ValueError(
+            "`coalesce_interval` must not be negative, "
+            "and `coalesce_max_bytes` must be positive."
+        )
+    return interval, max_bytes
+
+
+def _is_text_choice(choice: Any) -> bool:
+    if not isinstance(choice, dict) or choice.get("logprobs") is not None:
+        return False
+    if "delta" in choice:
+        delta = choice["delta"]
+        return isinstance(delta, dict) and all(
+            k in TEXT_FIELDS or (k == "role" and v is not None) or v is None
+            for k, v in delta.items()
+        )
+    return isinstance(choice.get("text"), str)
+
+
+def _can_merge(prev: Dict[str, Any], chunk: Dict[str, Any]) -> bool:
+    # only the text deltas of the same single choice are merged,
+    # chunks with tool calls, logprobs or usage are kept as they are
+    if any(prev.get(k) != chunk.get(k) for k in ("id", "object", "model")):
+        return False
+    if prev.get("usage") is not None or chunk.get("usage") is not None:
+        return False
+    prev_choices, choices = prev.get("choices"), chunk.get("choices")
+    if not (
+        isinstance(prev_choices, list)
+        and isinstance(choices, list)
+        and len(prev_choices) == len(choices) == 1
+    ):
+        return False
+    prev_choice, choice = prev_choices[0], choices[0]
+    return (
+        _is_text_choice(prev_choice)
+        and _is_text_choice(choice)
+        and prev_choice.get("index") == choice.get("index")
+        and prev_choice.get("finish_reason") is None
+        and "role" not in choice.get("delta", {})
+        and ("delta" in prev_choice) == ("delta" in choice)
+    )
+
+
+def _merge(prev: Dict[str, Any], chunk: Dict[str, Any]):
+    prev_choice, choice = prev["choices"][0], chunk["choices"][0]
+    prev_fields = prev_choice.get("delta", prev_choice)
+    for k, v in choice.get("delta", choice).items():
+        if k in TEXT_FIELDS and v is not None:
+            prev_fields[k] = (prev_fields.get(k) or "") + v
+    prev_choice["finish_reason"] = choice.get("finish_reason")
+
+
+def _parse_chunk(event: bytes) -> Optional[Dict[str, Any]]:
+    if not event.startswith(SSE_DATA_PREFIX):
+        return None
+    try:
+        chunk = json.loads(event[len(SSE_DATA_PREFIX) :])
+    except ValueError:
+        return None
+    return chunk if isinstance(chunk, dict) and "choices" in chunk else None
+
+
+def merge_chunk_events(data: bytes) -> bytes:
+    """
+    Merge the consecutive text deltas in the server-sent events of completion chunks,
+    so that each run of them becomes one valid chunk, keeping the other events as they are.
+    """
+    events = data.split(SSE_EVENT_SEPARATOR)
+    if events[-1]:
+        # not a whole event
+        return data
+    out: List[bytes] = []
+    pending: Optional[Dict[str, Any]] = None
+    num_merged = 0
+    for event in events[:-1]:
+        chunk = _parse_chunk(event)
+        if chunk is not None and pending is not None and _can_merge(pending, chunk):
+            _merge(pending, chunk)
+            num_merged += 1
+            continue
+        if pending is not None:
+            out.append(encode_sse_data(pending))
+            pending = None
+        if chunk is not None:
+            pending = chunk
+        else:
+            out.append(event + SSE_EVENT_SEPARATOR)
+    if num_merged == 0:
+        return data
+    if pending is not None:
+        out.append(encode_sse_data(pending))
+    return b"".join(out)
+
+
+async def coalesce_stream(
+    iterator: AsyncIterator[bytes], interval: float, max_bytes: int
+) -> AsyncGenerator[bytes, None]:
+    """
+    Merge the deltas of a completion stream which arrive within `interval` seconds
+    after the first of them, up to about `max_bytes`, into one event.
+    """
+    async for data in coalesce_chunks(iterator, interval, max_bytes):
+        yield merge_chunk_events(data)
@@ -0,0 +1,99 @@
+# Copyright 2022-2025 XProbe Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+
+import pytest
+
+from ...core.supervisor import SupervisorActor
+from ..routing_cache import ModelRoutingCache
+
+
+class MockSupervisor(SupervisorActor):
+    """
+    Only the routing of the supervisor, called in the same process.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.models = {}
+        self.num_fetches = 0
+
+    async def get_model_routing(self, model_uid: str):
+        self.num_fetches += 1
+        if model_uid not in self.models:
+            raise ValueError(f"Model not found in the model list, uid: {model_uid}")
+        return {
+            "version": self._routing_version,
+            "description": {"model_family": "qwen2.5-instruct"},
+            "replica_refs": self.models[model_uid],
+            "is_vllm_backend": False,
+            "is_sglang_backend": False,
+            "routing_policy": "round_robin",
+            "session_affinity": False,
+        }
+
+
+async def test_watch_routing_changes():
+    supervisor = MockSupervisor()
+    assert await supervisor.watch_routing_changes(-1, 1) == (0, None)
+    # no changes
+    assert await supervisor.watch_routing_changes(0, 0.01) == (0, [])
+
+    task = asyncio.create_task(supervisor.watch_routing_changes(0, 10))
+    await asyncio.sleep(0.01)
+    supervisor.notify_routing_change("a")
+    assert await asyncio.wait_for(task, 1) == (1, ["a"])
+    supervisor.notify_routing_change("b")
+    supervisor.notify_routing_change("a")
+    version, changed = await supervisor.watch_routing_changes(1, 1)
+    assert version == 3 and sorted(changed) == ["a", "b"]
+    # the supervisor restarted
+    assert await supervisor.watch_routing_changes(5, 1) == (3, None)
+
+
+async def test_routing_cache():
+    supervisor = MockSupervisor()
+    supervisor.models["a"] = ["a-0", "a-1"]
+
+    async def get_supervisor_ref():
+        return supervisor
+
+    cache = ModelRoutingCache(get_supervisor_ref)
+    with pytest.raises(ValueError):
+        await cache.get_model("b")
+    # wait for the watch to start
+    await asyncio.sleep(0.01)
+
+    assert [await cache.get_model("a") for _ in range(3)] == ["a-0", "a-1", "a-0"]
+    route = await cache.get_route("a")
+    assert route.description["model_family"] == "qwen2.5-instruct"
+    num_fetches = supervisor.num_fetches
+
+    # replicas are recreated
+    supervisor.models["a"] = ["a-2", "a-3"]
+    supervisor.notify_routing_change("a")
+    await asyncio.sleep(0.01)
+    assert "a" not in cache
+    assert await cache.get_model("a") == "a-2"
+    assert await cache.get_model("a") == "a-3"
+    assert supervisor.num_fetches == num_fetches + 1
+
+    # terminated
+    del supervisor.models["a"]
+    supervisor.notify_routing_change("a")
+    await asyncio.sleep(0.01)
+    with pytest.raises(ValueError):
+        await cache.get_model("a")
+    cache._watch_task.cancel()
@@ -0,0 +1,114 @@
+# Copyright 2022-2025 XProbe Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import json
+
+import pytest
+
+from ...core.utils import encode_sse_data
+from ..sse import coalesce_stream, merge_chunk_events, pop_coalesce_options
+
+
+def _chat_chunk(delta, finish_reason=None, **kwargs):
+    return dict(
+        id="chat-1",
+        object="chat.completion.chunk",
+        model="m",
+        choices=[dict(index=0, delta=delta, finish_reason=finish_reason)],
+        **kwargs,
+    )
+
+
+def _events(data: bytes):
+    return [json.loads(e[len(b"data: ") :]) for e in data.split(b"\r\n\r\n") if e]
+
+
+def test_merge_chunk_events():
+    data = b"".join(
+        encode_sse_data(c)
+        for c in [
+            _chat_chunk({"role": "assistant", "content": ""}),
+            _chat_chunk({"content": "Hello"}),
+            _chat_chunk({"content": ", world"}),
+            _chat_chunk({"content": ""}, finish_reason="stop"),
+            _chat_chunk({}, usage={"total_tokens": 3}),
+        ]
+    )
+    events = _events(merge_chunk_events(data))
+    assert len(events) == 2
+    assert events[0]["choices"][0] == {
+        "index": 0,
+        "delta": {"role": "assistant", "content": "Hello, world"},
+        "finish_reason": "stop",
+    }
+    # the usage chunk is kept
+    assert events[1]["usage"] == {"total_tokens": 3}
+
+    # tool calls and other choices are not merged
+    tool_call = _chat_chunk({"tool_calls": [{"index": 0}]})
+    data = b"".join(
+        encode_sse_data(c)
+        for c in [
+            _chat_chunk({"content": "a"}),
+            tool_call,
+            _chat_chunk({"content": "b"}),
+        ]
+    )
+    assert merge_chunk_events(data) == data
+
+    # completion chunks
+    data = b"".join(
+        encode_sse_data(
+            dict(
+                id="cmpl-1",
+                object="text_completion",
+                model="m",
+                choices=[dict(index=0, text=t, logprobs=None, finish_reason=None)],
+            )
+        )
+        for t in ["a", "b", "c"]
+    )
+    events = _events(merge_chunk_events(data))
+    assert [e["choices"][0]["text"] for e in events] == ["abc"]
+
+    # errors are kept
+    error = b'data: {"error": "failed"}\r\n\r\n'
+    assert merge_chunk_events(error) == error
+
+
+async def test_coalesce_stream():
+    async def stream():
+        for t in ["a", "b"]:
+            yield encode_sse_data(_chat_chunk({"content": t}))
+        await asyncio.sleep(0.3)
+        yield encode_sse_data(_chat_chunk({"content": "c"}))
+
+    items = [item async for item in coalesce_stream(stream(), 0.1, 1024)]
+    assert [
+        [e["choices"][0]["delta"]["content"] for e in _events(i)] for i in items
+    ] == [
+        ["ab"],
+        ["c"],
+    ]
+
+
+def test_pop_coalesce_options():
+    options = {"include_usage": True, "coalesce_interval": 0.02}
+    interval, max_bytes = pop_coalesce_options(options)
+    assert interval == 0.02 and max_bytes > 0
+    assert options == {"include_usage": True}
+    assert pop_coalesce_options(None)[0] == 0
+    with pytest.raises(ValueError):
+        pop_coalesce_options({"coalesce_max_bytes": 0})
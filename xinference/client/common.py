@@ -13,7 +13,7 @@
 # limitations under the License.
 
 import json
-from typing import Any, AsyncIterator, Iterator, Union
+from typing import Any, AsyncIterator, Dict, Iterator, Mapping, Union
 
 
 def convert_float_to_int_or_str(model_size: float) -> Union[int, str]:
@@ -27,6 +27,28 @@ def convert_float_to_int_or_str(model_size: float) -> Union[int, str]:
         return str(model_size)
 
 
+def decode_binary_embedding(headers: Mapping[str, str], content: bytes) -> Dict:
+    """
+    Decode the response of `encoding_format="binary"`, a row-major matrix in the body.
+    The embeddings are numpy arrays viewing the body without copies.
+    """
+    import numpy as np
+
+    num, dimensions = (int(n) for n in headers["X-Embedding-Shape"].split(","))
+    dtype = {"float32": "<f4", "float16": "<f2"}[headers["X-Embedding-Dtype"]]
+    matrix = np.frombuffer(content, dtype=dtype).reshape(num, dimensions)
+    return {
+        "object": "list",
+        "model": headers.get("X-Embedding-Model"),
+        "model_replica": headers.get("X-Embedding-Model-Replica"),
+        "data": [
+            {"index": i, "object": "embedding", "embedding": row}
+            for i, row in enumerate(matrix)
+        ],
+        "usage": json.loads(headers["X-Embedding-Usage"]),
+    }
+
+
 def streaming_response_iterator(
     response_lines: Iterator[bytes],
 ) -> Iterator[Any]:
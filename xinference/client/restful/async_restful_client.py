@@ -17,7 +17,11 @@ from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, List, Optional, Unio
 
 import aiohttp
 
-from ..common import async_streaming_response_iterator, convert_float_to_int_or_str
+from ..common import (
+    async_streaming_response_iterator,
+    convert_float_to_int_or_str,
+    decode_binary_embedding,
+)
 
 if TYPE_CHECKING:
     from ...types import (
@@ -102,6 +106,13 @@ class AsyncRESTfulEmbeddingModelHandle(AsyncRESTfulModelHandle):
         input: Union[str, List[str]]
             Input text to embed, encoded as a string or array of tokens.
             To embed multiple inputs in a single request, pass an array of strings or array of token arrays.
+        encoding_format: str, optional
+            `float` by default, `base64` for the base64 of each embedding,
+            or `binary` for numpy arrays transferred as raw bytes.
+        embedding_dtype: str, optional
+            `float32` by default, or `float16`, the dtype of the base64 or binary embeddings.
+        dimensions: int, optional
+            Truncate the embeddings to the dimensions, only for Matryoshka models.
 
         Returns
         -------
@@ -128,6 +139,10 @@ class AsyncRESTfulEmbeddingModelHandle(AsyncRESTfulModelHandle):
                 f"Failed to create the embeddings, detail: {await _get_error_string(response)}"
             )
 
+        if kwargs.get("encoding_format") == "binary":
+            content = await response.read()
+            await _release_response(response)
+            return decode_binary_embedding(response.headers, content)  # type: ignore
         response_data = await response.json()
         await _release_response(response)
         return response_data
@@ -196,7 +211,8 @@ class AsyncRESTfulRerankModelHandle(AsyncRESTfulModelHandle):
         top_n: int
             The number of results to return, defaults to returning all results
         max_chunks_per_doc: int
-            The maximum number of chunks derived from a document
+            The maximum number of chunks derived from a document,
+            the scores of the chunks are pooled by `chunk_pooling`, `max` or `mean`, in kwargs
         return_documents: bool
             if return documents
         return_len: bool
@@ -1217,6 +1233,53 @@ class AsyncClient:
             )
         await _release_response(response)
 
+    async def sleep_model(self, model_uid: str):
+        """
+        Let the model sleep, its weights are offloaded to the host memory to free the device memory.
+        The model rejects requests until woken up by `wake_model`, which is much faster than launching it again.
+
+        Parameters
+        ----------
+        model_uid: str
+            The unique id that identify the model we want.
+
+        Raises
+        ------
+        RuntimeError
+            Report failure to let the model sleep. Provide details of failure through error message.
+        """
+        url = f"{self.base_url}/v1/models/{model_uid}/sleep"
+
+        response = await self.session.post(url, headers=self._headers)
+        if response.status != 200:
+            raise RuntimeError(
+                f"Failed to let the model sleep, detail: {await _get_error_string(response)}"
+            )
+        await _release_response(response)
+
+    async def wake_model(self, model_uid: str):
+        """
+        Wake up the model sleeping by `sleep_model`.
+
+        Parameters
+        ----------
+        model_uid: str
+            The unique id that identify the model we want.
+
+        Raises
+        ------
+        RuntimeError
+            Report failure to wake up the model. Provide details of failure through error message.
+        """
+        url = f"{self.base_url}/v1/models/{model_uid}/wake"
+
+        response = await self.session.post(url, headers=self._headers)
+        if response.status != 200:
+            raise RuntimeError(
+                f"Failed to wake up the model, detail: {await _get_error_string(response)}"
+            )
+        await _release_response(response)
+
     async def get_launch_model_progress(self, model_uid: str) -> dict:
         """
         Get progress of the specific model.
@@ -16,7 +16,11 @@ from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Union
 
 import requests
 
-from ..common import convert_float_to_int_or_str, streaming_response_iterator
+from ..common import (
+    convert_float_to_int_or_str,
+    decode_binary_embedding,
+    streaming_response_iterator,
+)
 
 if TYPE_CHECKING:
     from ...types import (
@@ -79,6 +83,13 @@ class RESTfulEmbeddingModelHandle(RESTfulModelHandle):
         input: Union[str, List[str]]
             Input text to embed, encoded as a string or array of tokens.
             To embed multiple inputs in a single request, pass an array of strings or array of token arrays.
+        encoding_format: str, optional
+            `float` by default, `base64` for the base64 of each embedding,
+            or `binary` for numpy arrays transferred as raw bytes.
+        embedding_dtype: str, optional
+            `float32` by default, or `float16`, the dtype of the base64 or binary embeddings.
+        dimensions: int, optional
+            Truncate the embeddings to the dimensions, only for Matryoshka models.
 
         Returns
         -------
@@ -103,6 +114,8 @@ class RESTfulEmbeddingModelHandle(RESTfulModelHandle):
                 f"Failed to create the embeddings, detail: {_get_error_string(response)}"
             )
 
+        if kwargs.get("encoding_format") == "binary":
+            return decode_binary_embedding(response.headers, response.content)  # type: ignore
         response_data = response.json()
         return response_data
 
@@ -167,7 +180,8 @@ class RESTfulRerankModelHandle(RESTfulModelHandle):
         top_n: int
             The number of results to return, defaults to returning all results
         max_chunks_per_doc: int
-            The maximum number of chunks derived from a document
+            The maximum number of chunks derived from a document,
+            the scores of the chunks are pooled by `chunk_pooling`, `max` or `mean`, in kwargs
         return_documents: bool
             if return documents
         return_len: bool
@@ -1157,6 +1171,51 @@ class Client:
                 f"Failed to terminate model, detail: {_get_error_string(response)}"
             )
 
+    def sleep_model(self, model_uid: str):
+        """
+        Let the model sleep, its weights are offloaded to the host memory to free the device memory.
+        The model rejects requests until woken up by `wake_model`, which is much faster than launching it again.
+
+        Parameters
+        ----------
+        model_uid: str
+            The unique id that identify the model we want.
+
+        Raises
+        ------
+        RuntimeError
+            Report failure to let the model sleep. Provide details of failure through error message.
+        """
+        url = f"{self.base_url}/v1/models/{model_uid}/sleep"
+
+        response = self.session.post(url, headers=self._headers)
+        if response.status_code != 200:
+            raise RuntimeError(
+                f"Failed to let the model sleep, detail: {_get_error_string(response)}"
+            )
+
+    def wake_model(self, model_uid: str):
+        """
+        Wake up the model sleeping by `sleep_model`.
+
+        Parameters
+        ----------
+        model_uid: str
+            The unique id that identify the model we want.
+
+        Raises
+        ------
+        RuntimeError
+            Report failure to wake up the model. Provide details of failure through error message.
+        """
+        url = f"{self.base_url}/v1/models/{model_uid}/wake"
+
+        response = self.session.post(url, headers=self._headers)
+        if response.status_code != 200:
+            raise RuntimeError(
+                f"Failed to wake up the model, detail: {_get_error_string(response)}"
+            )
+
     def get_launch_model_progress(self, model_uid: str) -> dict:
         """
         Get progress of the specific model.
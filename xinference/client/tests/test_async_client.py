@@ -16,6 +16,7 @@ import asyncio
 import os
 import time
 
+import numpy as np
 import psutil
 import pytest
 
@@ -190,6 +191,20 @@ async def test_async_RESTful_client_for_embedding(setup):
 
     completion = await model.create_embedding("write a poem.")
     assert len(completion["data"][0]["embedding"]) == 768
+    embedding = completion["data"][0]["embedding"]
+    completion = await model.create_embedding("write a poem.", encoding_format="base64")
+    assert isinstance(completion["data"][0]["embedding"], str)
+    completion = await model.create_embedding(
+        ["write a poem.", "write a story."],
+        encoding_format="binary",
+        embedding_dtype="float16",
+    )
+    assert completion["data"][0]["embedding"].shape == (768,)
+    assert completion["data"][0]["embedding"].dtype == "float16"
+    assert completion["usage"]["total_tokens"] > 0
+    np.testing.assert_allclose(
+        completion["data"][0]["embedding"], embedding, rtol=1e-2, atol=1e-3
+    )
 
     await client.terminate_model(model_uid=model_uid)
     assert len(await client.list_models()) == 0
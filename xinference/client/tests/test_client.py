@@ -17,6 +17,7 @@ import os
 import time
 from concurrent.futures import ThreadPoolExecutor
 
+import numpy as np
 import psutil
 import pytest
 import requests
@@ -195,6 +196,20 @@ def test_RESTful_client_for_embedding(setup):
 
     completion = model.create_embedding("write a poem.")
     assert len(completion["data"][0]["embedding"]) == 768
+    embedding = completion["data"][0]["embedding"]
+    completion = model.create_embedding("write a poem.", encoding_format="base64")
+    assert isinstance(completion["data"][0]["embedding"], str)
+    completion = model.create_embedding(
+        ["write a poem.", "write a story."],
+        encoding_format="binary",
+        embedding_dtype="float16",
+    )
+    assert completion["data"][0]["embedding"].shape == (768,)
+    assert completion["data"][0]["embedding"].dtype == "float16"
+    assert completion["usage"]["total_tokens"] > 0
+    np.testing.assert_allclose(
+        completion["data"][0]["embedding"], embedding, rtol=1e-2, atol=1e-3
+    )
 
     client.terminate_model(model_uid=model_uid)
     assert len(client.list_models()) == 0
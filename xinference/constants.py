@@ -32,7 +32,16 @@ XINFERENCE_ENV_TEXT_TO_IMAGE_BATCHING_SIZE = "XINFERENCE_TEXT_TO_IMAGE_BATCHING_
 XINFERENCE_ENV_VIRTUAL_ENV = "XINFERENCE_ENABLE_VIRTUAL_ENV"
 XINFERENCE_ENV_VIRTUAL_ENV_SKIP_INSTALLED = "XINFERENCE_VIRTUAL_ENV_SKIP_INSTALLED"
 XINFERENCE_ENV_SSE_PING_ATTEMPTS_SECONDS = "XINFERENCE_SSE_PING_ATTEMPTS_SECONDS"
+XINFERENCE_ENV_STREAM_FLUSH_INTERVAL = "XINFERENCE_STREAM_FLUSH_INTERVAL"
+XINFERENCE_ENV_SSE_COALESCE_INTERVAL = "XINFERENCE_SSE_COALESCE_INTERVAL"
+XINFERENCE_ENV_SSE_COALESCE_MAX_BYTES = "XINFERENCE_SSE_COALESCE_MAX_BYTES"
+XINFERENCE_ENV_PREWARM_SUBPOOLS = "XINFERENCE_PREWARM_SUBPOOLS"
+XINFERENCE_ENV_PREWARM_MODULES = "XINFERENCE_PREWARM_MODULES"
+XINFERENCE_ENV_ON_DEMAND_IDLE_TTL = "XINFERENCE_ON_DEMAND_IDLE_TTL"
 XINFERENCE_ENV_MAX_TOKENS = "XINFERENCE_MAX_TOKENS"
+XINFERENCE_ENV_REPLICA_ROUTING_POLICY = "XINFERENCE_REPLICA_ROUTING_POLICY"
+XINFERENCE_ENV_REPLICA_SESSION_AFFINITY = "XINFERENCE_REPLICA_SESSION_AFFINITY"
+XINFERENCE_ENV_PLACEMENT_STRATEGY = "XINFERENCE_PLACEMENT_STRATEGY"
 
 
 def get_xinference_home() -> str:
@@ -95,6 +104,31 @@ XINFERENCE_TEXT_TO_IMAGE_BATCHING_SIZE = os.environ.get(
 XINFERENCE_SSE_PING_ATTEMPTS_SECONDS = int(
     os.environ.get(XINFERENCE_ENV_SSE_PING_ATTEMPTS_SECONDS, 600)
 )
+# seconds the stream chunks of a model are coalesced into one message, 0 to send each chunk
+XINFERENCE_STREAM_FLUSH_INTERVAL = float(
+    os.environ.get(XINFERENCE_ENV_STREAM_FLUSH_INTERVAL, 0)
+)
+# seconds the deltas of a completion stream are merged into one event, 0 to disable
+XINFERENCE_SSE_COALESCE_INTERVAL = float(
+    os.environ.get(XINFERENCE_ENV_SSE_COALESCE_INTERVAL, 0)
+)
+XINFERENCE_SSE_COALESCE_MAX_BYTES = int(
+    os.environ.get(XINFERENCE_ENV_SSE_COALESCE_MAX_BYTES, 16 * 1024)
+)
+# idle sub pools kept by a worker for each python environment, 0 to disable
+XINFERENCE_PREWARM_SUBPOOLS = int(os.environ.get(XINFERENCE_ENV_PREWARM_SUBPOOLS, 0))
+# modules imported by the idle sub pools before they are handed to launches
+XINFERENCE_PREWARM_MODULES = [
+    m.strip()
+    for m in os.environ.get(XINFERENCE_ENV_PREWARM_MODULES, "torch,transformers").split(
+        ","
+    )
+    if m.strip()
+]
+# seconds an on-demand model stays loaded without requests
+XINFERENCE_ON_DEMAND_IDLE_TTL = float(
+    os.environ.get(XINFERENCE_ENV_ON_DEMAND_IDLE_TTL, 600)
+)
 XINFERENCE_LAUNCH_MODEL_RETRY = 3
 XINFERENCE_DEFAULT_CANCEL_BLOCK_DURATION = 30
 XINFERENCE_ENABLE_VIRTUAL_ENV = bool(int(os.getenv(XINFERENCE_ENV_VIRTUAL_ENV, "0")))
@@ -105,6 +139,13 @@ XINFERENCE_VIRTUAL_ENV_SKIP_INSTALLED = (
 )
 XINFERENCE_MAX_TOKENS = os.getenv(XINFERENCE_ENV_MAX_TOKENS)
 XINFERENCE_MAX_TOKENS = int(XINFERENCE_MAX_TOKENS) if XINFERENCE_MAX_TOKENS else None  # type: ignore
+XINFERENCE_REPLICA_ROUTING_POLICY = os.getenv(
+    XINFERENCE_ENV_REPLICA_ROUTING_POLICY, "round_robin"
+)
+XINFERENCE_REPLICA_SESSION_AFFINITY = bool(
+    int(os.getenv(XINFERENCE_ENV_REPLICA_SESSION_AFFINITY, "0"))
+)
+XINFERENCE_PLACEMENT_STRATEGY = os.getenv(XINFERENCE_ENV_PLACEMENT_STRATEGY, "spread")
 XINFERENCE_VIRTUAL_ENV_SKIP_INSTALLED = (
     bool(int(os.getenv(XINFERENCE_ENV_VIRTUAL_ENV_SKIP_INSTALLED, "0")))
     if os.getenv(XINFERENCE_ENV_VIRTUAL_ENV_SKIP_INSTALLED)
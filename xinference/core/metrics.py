@@ -37,6 +37,66 @@ input_tokens_total_counter = Counter(
 output_tokens_total_counter = Counter(
     "xinference:output_tokens_total_counter", "Total number of output tokens."
 )
+# Speculative decoding
+spec_decode_acceptance_rate = Gauge(
+    "xinference:spec_decode_acceptance_rate",
+    "Fraction of the draft tokens accepted by speculative decoding.",
+)
+spec_decode_tokens_per_forward = Gauge(
+    "xinference:spec_decode_tokens_per_forward",
+    "Tokens generated per request by a forward of the target model in speculative decoding.",
+)
+
+# Embedding batching
+embedding_batch_size = Gauge(
+    "xinference:embedding_batch_size",
+    "Sentences encoded per batch by the embedding batcher.",
+)
+embedding_queue_wait_time = Gauge(
+    "xinference:embedding_queue_wait_time_ms",
+    "Time an embedding request waits for its batch in ms.",
+)
+# Embedding result cache
+embedding_cache_hits_total_counter = Counter(
+    "xinference:embedding_cache_hits_total_counter",
+    "Total number of texts served by the embedding result cache.",
+)
+embedding_cache_misses_total_counter = Counter(
+    "xinference:embedding_cache_misses_total_counter",
+    "Total number of texts missing in the embedding result cache.",
+)
+# Rerank batching
+rerank_batch_size = Gauge(
+    "xinference:rerank_batch_size",
+    "Documents scored per batch by the rerank batcher.",
+)
+rerank_queue_wait_time = Gauge(
+    "xinference:rerank_queue_wait_time_ms",
+    "Time a rerank request waits for its batch in ms.",
+)
+# Rerank score cache
+rerank_cache_hits_total_counter = Counter(
+    "xinference:rerank_cache_hits_total_counter",
+    "Total number of query-document scores served by the rerank score cache.",
+)
+rerank_cache_misses_total_counter = Counter(
+    "xinference:rerank_cache_misses_total_counter",
+    "Total number of query-document pairs missing in the rerank score cache.",
+)
+
+# On-demand models
+on_demand_cold_starts_total_counter = Counter(
+    "xinference:on_demand_cold_starts_total_counter",
+    "Total number of loads of on-demand models triggered by requests.",
+)
+on_demand_cold_start_time = Gauge(
+    "xinference:on_demand_cold_start_time_ms",
+    "Time requests wait for the latest load of an on-demand model in ms.",
+)
+on_demand_evictions_total_counter = Counter(
+    "xinference:on_demand_evictions_total_counter",
+    "Total number of evictions of on-demand models, by the reason.",
+)
 
 
 def record_metrics(name, op, kwargs):
@@ -23,6 +23,7 @@ import types
 import uuid
 from typing import (
     TYPE_CHECKING,
+    Any,
     AsyncGenerator,
     Callable,
     Dict,
@@ -39,6 +40,7 @@ import xoscar as xo
 from ..constants import (
     XINFERENCE_DEFAULT_CANCEL_BLOCK_DURATION,
     XINFERENCE_LAUNCH_MODEL_RETRY,
+    XINFERENCE_STREAM_FLUSH_INTERVAL,
 )
 
 if TYPE_CHECKING:
@@ -52,7 +54,7 @@ import logging
 logger = logging.getLogger(__name__)
 
 from ..device_utils import empty_cache
-from .utils import CancelMixin, json_dumps, log_async
+from .utils import CancelMixin, coalesce_chunks, encode_sse_data, json_dumps, log_async
 
 try:
     from torch.cuda import OutOfMemoryError
@@ -71,6 +73,10 @@ XINFERENCE_TEXT_TO_IMAGE_BATCHING_ALLOWED_MODELS = ["FLUX.1-dev", "FLUX.1-schnel
 XINFERENCE_TEST_OUT_OF_MEMORY_ERROR = bool(
     os.getenv("XINFERENCE_TEST_OUT_OF_MEMORY_ERROR", False)
 )
+# weight of the latest request in the moving average latency of a replica
+LATENCY_SMOOTHING_FACTOR = 0.2
+# bytes of the stream chunks coalesced into one message at most
+STREAM_FLUSH_MAX_BYTES = 64 * 1024
 
 
 def register_batching_multimodal_models(*model_names: str):
@@ -94,13 +100,19 @@ def request_limit(fn):
         logger.debug(
             f"Request {fn.__name__}, current serve request count: {self._serve_count}, request limit: {self._request_limits} for the model {self.model_uid()}"
         )
+        if self._sleeping:
+            raise RuntimeError(
+                f"Model {self.model_uid()} is sleeping, wake it up before requests"
+            )
         if 1 + self._serve_count <= self._request_limits:
             self._serve_count += 1
+            self._last_request_time = time.time()
         else:
             raise RuntimeError(
                 f"Rate limit reached for the model. Request limit {self._request_limits} for the model: {self.model_uid()}"
             )
         ret = None
+        start_time = time.time()
         try:
             ret = await fn(self, *args, **kwargs)
         finally:
@@ -110,7 +122,9 @@ def request_limit(fn):
                 # stream case, let client call model_ref to decrease self._serve_count
                 pass
             else:
+                self._record_latency(time.time() - start_time)
                 self._serve_count -= 1
+                self._last_request_time = time.time()
                 logger.debug(
                     f"After request {fn.__name__}, current serve request count: {self._serve_count} for the model {self.model_uid()}"
                 )
@@ -161,6 +175,8 @@ class ModelActor(xo.StatelessActor, CancelMixin):
 
         if hasattr(self._model, "stop") and callable(self._model.stop):
             await asyncio.to_thread(self._model.stop)
+        if hasattr(self._model, "release_shared_weights"):
+            await asyncio.to_thread(self._model.release_shared_weights)
 
         if isinstance(self._model, LLMVLLMModel):
             if self._transfer_ref is not None:
@@ -230,9 +246,23 @@ class ModelActor(xo.StatelessActor, CancelMixin):
             )
             else asyncio.locks.Lock()
         )
+        batcher = self._get_batcher()
+        if batcher is not None:
+            # the batches never run along with the other calls of the model
+            batcher.lock = self._lock
+        # the hits and misses of the embedding result cache
+        # or the rerank score cache recorded in metrics
+        self._recorded_cache_stats = {"hits": 0, "misses": 0}
         self._worker_ref = None
         self._progress_tracker_ref = None
         self._serve_count = 0
+        # when the latest request started or finished
+        self._last_request_time = time.time()
+        # the weights are offloaded to the host while sleeping
+        self._sleeping = False
+        self._sleep_lock = asyncio.Lock()
+        # moving average of seconds until the first result of the requests
+        self._latency = 0.0
         self._metrics_labels = {
             "type": self._model_description.get("model_type", "unknown"),
             "model": self.model_uid(),
@@ -241,6 +271,8 @@ class ModelActor(xo.StatelessActor, CancelMixin):
             "quantization": self._model_description.get("quantization", "none"),
         }
         self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # seconds the chunks of an async stream are coalesced into one message
+        self._stream_flush_interval = XINFERENCE_STREAM_FLUSH_INTERVAL
         # model across workers
         self._n_worker = n_worker
         self._shard = shard
@@ -266,8 +298,62 @@ class ModelActor(xo.StatelessActor, CancelMixin):
     def __getattr__(self, attr: str):
         return getattr(self._model, attr)
 
+    def _get_batcher(self):
+        get_batcher = getattr(self._model, "get_batcher", None)
+        return get_batcher() if get_batcher is not None else None
+
+    def _get_embedding_result_cache(self):
+        get_result_cache = getattr(self._model, "get_result_cache", None)
+        return get_result_cache() if get_result_cache is not None else None
+
+    async def _record_embedding_cache_metrics(self):
+        await self._record_cache_metrics(
+            self._get_embedding_result_cache(), "embedding_cache"
+        )
+
+    async def _record_cache_metrics(self, cache, prefix: str):
+        if cache is None:
+            return
+        stats = cache.stats()
+        coros = []
+        for name in ("hits", "misses"):
+            delta = stats[name] - self._recorded_cache_stats[name]
+            if delta > 0:
+                self._recorded_cache_stats[name] = stats[name]
+                coros.append(
+                    self.record_metrics(
+                        f"{prefix}_{name}_total_counter",
+                        "add",
+                        {"labels": self._metrics_labels, "value": delta},
+                    )
+                )
+        await asyncio.gather(*coros)
+
+    async def _record_batch_metrics(self, prefix: str):
+        batcher = self._get_batcher()
+        if batcher is None or not batcher.num_batches:
+            return
+        stats = batcher.stats()
+        await asyncio.gather(
+            *[
+                self.record_metrics(
+                    f"{prefix}_{name}",
+                    "set",
+                    {"labels": self._metrics_labels, "value": stats[name]},
+                )
+                for name in ("batch_size", "queue_wait_time")
+            ]
+        )
+
     def decrease_serve_count(self):
         self._serve_count -= 1
+        self._last_request_time = time.time()
+
+    def _record_latency(self, latency: float):
+        if self._latency == 0:
+            self._latency = latency
+        else:
+            self._latency += LATENCY_SMOOTHING_FACTOR * (latency - self._latency)
 
     @no_type_check
     async def start_transfer_for_vllm(self, rank_addresses: List[str]):
@@ -327,6 +413,24 @@ class ModelActor(xo.StatelessActor, CancelMixin):
                     },
                 )
             )
+        get_spec_decode_stats = getattr(
+            self._model, "get_speculative_decoding_stats", None
+        )
+        spec_decode_stats = (
+            get_spec_decode_stats() if get_spec_decode_stats is not None else None
+        )
+        if spec_decode_stats:
+            for name in ("acceptance_rate", "tokens_per_forward"):
+                coros.append(
+                    self.record_metrics(
+                        f"spec_decode_{name}",
+                        "set",
+                        {
+                            "labels": self._metrics_labels,
+                            "value": spec_decode_stats[name],
+                        },
+                    )
+                )
         await asyncio.gather(*coros)
 
     async def _get_worker_ref(self) -> xo.ActorRefType["WorkerActor"]:
@@ -385,6 +489,8 @@ class ModelActor(xo.StatelessActor, CancelMixin):
                 if hasattr(self._model, "set_loop"):
                     self._model.set_loop(asyncio.get_running_loop())
                 await asyncio.to_thread(self._model.load)
+                if hasattr(self._model, "share_weights"):
+                    await asyncio.to_thread(self._model.share_weights)
                 if hasattr(self._model, "driver_info"):
                     self._driver_info = self._model.driver_info
                 break
@@ -447,6 +553,18 @@ class ModelActor(xo.StatelessActor, CancelMixin):
         )
         os._exit(1)
 
+    @staticmethod
+    def _encode_chunk(output_type: str, v) -> bytes:
+        if output_type == "json":
+            return encode_sse_data(v)
+        assert output_type == "binary", f"Unknown output type '{output_type}'"
+        return sse_starlette.sse.ensure_bytes(v, None)
+
+    def _coalesce_async_gen(self, gen: AsyncGenerator[bytes, None]):
+        if self._stream_flush_interval <= 0:
+            return gen
+        return coalesce_chunks(gen, self._stream_flush_interval, STREAM_FLUSH_MAX_BYTES)
+
     def _to_generator(self, output_type: str, gen: types.GeneratorType):
         start_time = time.time()
         time_to_first_token = None
@@ -457,14 +575,10 @@ class ModelActor(xo.StatelessActor, CancelMixin):
             for v in gen:
                 if time_to_first_token is None:
                     time_to_first_token = (time.time() - start_time) * 1000
+                    self._record_latency(time_to_first_token / 1000)
                 if output_type == "json":
                     final_usage = v.get("usage", None)
-                    v = dict(data=json.dumps(v, ensure_ascii=False))
-                else:
-                    assert (
-                        output_type == "binary"
-                    ), f"Unknown output type '{output_type}'"
-                yield sse_starlette.sse.ensure_bytes(v, None)
+                yield self._encode_chunk(output_type, v)
         except OutOfMemoryError as ex:
             assert self._loop is not None
             asyncio.run_coroutine_threadsafe(
@@ -496,15 +610,10 @@ class ModelActor(xo.StatelessActor, CancelMixin):
             async for v in gen:
                 if time_to_first_token is None:
                     time_to_first_token = (time.time() - start_time) * 1000
+                    self._record_latency(time_to_first_token / 1000)
                 final_usage = v.get("usage", None)
-                if output_type == "json":
-                    v = await asyncio.to_thread(json.dumps, v, ensure_ascii=False)
-                    v = dict(data=v)  # noqa: F821
-                else:
-                    assert (
-                        output_type == "binary"
-                    ), f"Unknown output type '{output_type}'"
-                yield await asyncio.to_thread(sse_starlette.sse.ensure_bytes, v, None)
+                # a chunk is small, so serializing it inline is cheaper than a thread hop
+                yield self._encode_chunk(output_type, v)
         except OutOfMemoryError as ex:
             await self._handle_oom_error(ex)
         finally:
@@ -574,6 +683,21 @@ class ModelActor(xo.StatelessActor, CancelMixin):
     async def _call_wrapper_binary(self, fn: Callable, *args, **kwargs):
         return await self._call_wrapper("binary", fn, *args, **kwargs)
 
+    @oom_check
+    async def _call_batcher(self, output_type: str, fn: Callable, *args, **kwargs):
+        """
+        Call `fn` which submits the request to the batcher of the model.
+        The lock is not held while waiting for the batch, as the batcher holds it
+        when calling the model.
+        """
+        self._add_running_task(kwargs.get("request_id"))
+        ret = await fn(*args, **kwargs)
+        if output_type == "json":
+            return await asyncio.to_thread(json_dumps, ret)
+        else:
+            assert output_type == "binary", f"Unknown output type '{output_type}'"
+            return ret
+
     @oom_check
     async def _call_wrapper(self, output_type: str, fn: Callable, *args, **kwargs):
         self._add_running_task(kwargs.get("request_id"))
@@ -587,7 +711,7 @@ class ModelActor(xo.StatelessActor, CancelMixin):
                 gen = self._to_generator(output_type, ret)
                 return gen
             if inspect.isasyncgen(ret):
-                gen = self._to_async_gen(output_type, ret)
+                gen = self._coalesce_async_gen(self._to_async_gen(output_type, ret))
                 return gen
         else:
             async with self._lock:
@@ -617,7 +741,7 @@ class ModelActor(xo.StatelessActor, CancelMixin):
                     return _stream_out_generator()
 
                 if inspect.isasyncgen(ret):
-                    gen = self._to_async_gen(output_type, ret)
+                    gen = self._coalesce_async_gen(self._to_async_gen(output_type, ret))
                     stream_out = asyncio.Queue()
                     stop = object()
                     self._pending_requests.put_nowait((gen, stream_out, stop))
@@ -646,12 +770,7 @@ class ModelActor(xo.StatelessActor, CancelMixin):
     async def generate(self, prompt: str, *args, **kwargs):
         # Directly delegate to model, let model decide how to handle (batching or not)
         kwargs.pop("raw_params", None)
-        if hasattr(self._model, "generate"):
-            # not support request_id for generate
-            kwargs.pop("request_id", None)
-            return await self._call_wrapper_json(
-                self._model.generate, prompt, *args, **kwargs
-            )
+        # the async variant is preferred, which streams without a thread hop per chunk
         if hasattr(self._model, "async_generate"):
             if "request_id" not in kwargs:
                 kwargs["request_id"] = str(uuid.uuid1())
@@ -664,6 +783,12 @@ class ModelActor(xo.StatelessActor, CancelMixin):
                 *args,
                 **kwargs,
             )
+        if hasattr(self._model, "generate"):
+            # not support request_id for generate
+            kwargs.pop("request_id", None)
+            return await self._call_wrapper_json(
+                self._model.generate, prompt, *args, **kwargs
+            )
         raise AttributeError(f"Model {self._model.model_spec} is not for generate.")
 
     @request_limit
@@ -675,6 +800,17 @@ class ModelActor(xo.StatelessActor, CancelMixin):
         try:
             # Directly delegate to model, let model decide how to handle (batching or not)
             kwargs.pop("raw_params", None)
+            # the async variant is preferred, which streams without a thread hop per chunk
+            if hasattr(self._model, "async_chat"):
+                if "request_id" not in kwargs:
+                    kwargs["request_id"] = str(uuid.uuid1())
+                else:
+                    # model only accept string
+                    kwargs["request_id"] = str(kwargs["request_id"])
+                response = await self._call_wrapper_json(
+                    self._model.async_chat, messages, *args, **kwargs
+                )
+                return response
             if hasattr(self._model, "chat"):
                 # Only remove request_id if model doesn't have batch scheduler
                 if not (
@@ -686,16 +822,6 @@ class ModelActor(xo.StatelessActor, CancelMixin):
                     self._model.chat, messages, *args, **kwargs
                 )
                 return response
-            if hasattr(self._model, "async_chat"):
-                if "request_id" not in kwargs:
-                    kwargs["request_id"] = str(uuid.uuid1())
-                else:
-                    # model only accept string
-                    kwargs["request_id"] = str(kwargs["request_id"])
-                response = await self._call_wrapper_json(
-                    self._model.async_chat, messages, *args, **kwargs
-                )
-                return response
             raise AttributeError(f"Model {self._model.model_spec} is not for chat.")
         finally:
             # For the non stream result.
@@ -738,9 +864,34 @@ class ModelActor(xo.StatelessActor, CancelMixin):
     @log_async(logger=logger)
     async def create_embedding(self, input: Union[str, List[str]], *args, **kwargs):
         kwargs.pop("request_id", None)
+        # the raw buffers of the binary encoding are returned without json
+        output_type = "binary" if kwargs.get("encoding_format") == "binary" else "json"
+        if self._get_batcher() is not None:
+            ret = await self._call_batcher(
+                output_type,
+                getattr(self._model, "async_create_embedding"),
+                input,
+                *args,
+                **kwargs,
+            )
+            await asyncio.gather(
+                self._record_batch_metrics("embedding"),
+                self._record_embedding_cache_metrics(),
+            )
+            return ret
+        if self._get_embedding_result_cache() is not None:
+            ret = await self._call_wrapper(
+                output_type,
+                getattr(self._model, "async_create_embedding"),
+                input,
+                *args,
+                **kwargs,
+            )
+            await self._record_embedding_cache_metrics()
+            return ret
         if hasattr(self._model, "create_embedding"):
-            return await self._call_wrapper_json(
-                self._model.create_embedding, input, *args, **kwargs
+            return await self._call_wrapper(
+                output_type, self._model.create_embedding, input, *args, **kwargs
             )
 
         raise AttributeError(
@@ -774,8 +925,28 @@ class ModelActor(xo.StatelessActor, CancelMixin):
         **kwargs,
     ):
         kwargs.pop("request_id", None)
+        if self._get_batcher() is not None:
+            ret = await self._call_batcher(
+                "json",
+                getattr(self._model, "async_rerank"),
+                documents,
+                query,
+                top_n,
+                max_chunks_per_doc,
+                return_documents,
+                return_len,
+                *args,
+                **kwargs,
+            )
+            await asyncio.gather(
+                self._record_batch_metrics("rerank"),
+                self._record_cache_metrics(
+                    getattr(self._model, "get_score_cache")(), "rerank_cache"
+                ),
+            )
+            return ret
         if hasattr(self._model, "rerank"):
-            return await self._call_wrapper_json(
+            ret = await self._call_wrapper_json(
                 self._model.rerank,
                 documents,
                 query,
@@ -786,6 +957,10 @@ class ModelActor(xo.StatelessActor, CancelMixin):
                 *args,
                 **kwargs,
             )
+            get_score_cache = getattr(self._model, "get_score_cache", None)
+            if get_score_cache is not None:
+                await self._record_cache_metrics(get_score_cache(), "rerank_cache")
+            return ret
         raise AttributeError(f"Model {self._model.model_spec} is not for reranking.")
 
     @request_limit
@@ -917,6 +1092,7 @@ class ModelActor(xo.StatelessActor, CancelMixin):
                 )
         raise AttributeError(f"Model {self._model.model_spec} is not for txt2img.")
 
+    @request_limit
     @log_async(
         logger=logger,
         ignore_kwargs=["image"],
@@ -969,6 +1145,7 @@ class ModelActor(xo.StatelessActor, CancelMixin):
                 )
         raise AttributeError(f"Model {self._model.model_spec} is not for img2img.")
 
+    @request_limit
     @log_async(
         logger=logger,
         ignore_kwargs=["image"],
@@ -1134,3 +1311,54 @@ class ModelActor(xo.StatelessActor, CancelMixin):
 
     async def get_pending_requests_count(self):
         return self._pending_requests.qsize()
+
+    async def sleep(self):
+        """
+        Free the device memory of the model by offloading its weights to the host,
+        the model rejects requests until woken up.
+        """
+        if not hasattr(self._model, "sleep"):
+            raise ValueError(f"Model {self.model_uid()} does not support sleep")
+        async with self._sleep_lock:
+            if self._sleeping:
+                return
+            if self._serve_count > 0:
+                raise RuntimeError(
+                    f"Model {self.model_uid()} is serving {self._serve_count} requests, "
+                    f"cannot sleep"
+                )
+            self._sleeping = True
+            try:
+                await asyncio.to_thread(self._model.sleep)
+            except Exception:
+                self._sleeping = False
+                raise
+            logger.info("Model %s is sleeping", self.model_uid())
+
+    async def wake(self):
+        async with self._sleep_lock:
+            if not self._sleeping:
+                return
+            start = time.time()
+            await asyncio.to_thread(self._model.wake)
+            self._sleeping = False
+            logger.info(
+                "Model %s is woken up in %.2fs", self.model_uid(), time.time() - start
+            )
+
+    def is_sleeping(self) -> bool:
+        return self._sleeping
+
+    async def get_load(self) -> Dict[str, Any]:
+        """
+        The live load of this replica, to route the requests of the model.
+        `latency` is the recent seconds until the first result of a request,
+        which is the first chunk for a stream.
+        `last_request_time` is when the latest request started or finished.
+        """
+        return {
+            "serve_count": self._serve_count,
+            "pending_requests": self._pending_requests.qsize(),
+            "latency": self._latency,
+            "last_request_time": self._last_request_time,
+        }
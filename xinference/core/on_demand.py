@@ -0,0 +1,89 @@
+# Copyright 2022-2025 XProbe Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+# seconds between the checks of idle models
+ON_DEMAND_CHECK_INTERVAL = 10
+
+
+@dataclass
+class OnDemandModel:
+    """
+    A model launched on demand, which is loaded when a request is routed to it,
+    and evicted when idle for `idle_ttl` seconds, or when another model needs the memory.
+    """
+
+    model_uid: str
+    # the arguments of `SupervisorActor.launch_builtin_model` to load the model
+    launch_kwargs: Dict[str, Any]
+    idle_ttl: float
+    resident: bool = False
+    # the running load or eviction of the model
+    task: Optional[asyncio.Task] = None
+    last_used: float = field(default_factory=time.time)
+    # whether any replica is serving requests when the loads are checked
+    busy: bool = False
+    num_cold_starts: int = 0
+    num_evictions: int = 0
+
+    def update_usage(self, loads: List[Dict[str, Any]]):
+        """
+        Update the usage by the loads of the replicas, from `ModelActor.get_load`.
+        """
+        self.busy = any(
+            load.get("serve_count", 0) > 0 or load.get("pending_requests", 0) > 0
+            for load in loads
+        )
+        self.last_used = max(
+            [self.last_used] + [load.get("last_request_time", 0.0) for load in loads]
+        )
+
+    def is_evictable(self) -> bool:
+        return self.resident and self.task is None and not self.busy
+
+    def is_expired(self, now: float) -> bool:
+        return self.is_evictable() and now - self.last_used > self.idle_ttl
+
+    def describe(self) -> Dict[str, Any]:
+        """
+        Describe the model by its launch arguments, without loading it.
+        """
+        kwargs = self.launch_kwargs
+        return {
+            "model_type": kwargs.get("model_type") or "LLM",
+            "model_name": kwargs["model_name"],
+            "model_engine": kwargs.get("model_engine"),
+            "model_format": kwargs.get("model_format"),
+            "model_size_in_billions": kwargs.get("model_size_in_billions"),
+            "quantization": kwargs.get("quantization"),
+            "replica": kwargs.get("replica", 1),
+            "on_demand": True,
+            "resident": self.resident,
+        }
+
+
+def select_lru_model(
+    models: Iterable[OnDemandModel], exclude: Optional[str] = None
+) -> Optional[OnDemandModel]:
+    """
+    The least recently used model which can be evicted, None if no one.
+    """
+    candidates = [m for m in models if m.model_uid != exclude and m.is_evictable()]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda m: m.last_used)
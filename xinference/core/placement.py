@@ -0,0 +1,174 @@
+# Copyright 2022-2025 XProbe Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from ..constants import XINFERENCE_PLACEMENT_STRATEGY
+
+logger = logging.getLogger(__name__)
+
+PLACEMENT_STRATEGIES = ["spread", "binpack"]
+# context length to estimate the memory of a LLM launched without `max_model_len`
+DEFAULT_PLACEMENT_CONTEXT_LENGTH = 2048
+
+
+class PlacementError(RuntimeError):
+    """
+    No worker can hold the model, with the reason of each worker.
+    """
+
+    def __init__(self, reasons: Dict[str, str]):
+        self.reasons = reasons
+        details = "; ".join(
+            f"{address}: {reason}" for address, reason in reasons.items()
+        )
+        super().__init__(f"No available worker found, {details}")
+
+
+@dataclass
+class PlacementRequirement:
+    # GPUs the model takes exclusively on a worker with GPUs
+    num_gpus: int = 0
+    # estimated memory of the model in MB, split among its GPUs, None if unknown
+    memory: Optional[float] = None
+
+
+def get_placement_requirement(
+    model_type: str,
+    n_gpu: Optional[Union[int, str]],
+    model_size_in_billions: Optional[Union[int, str]] = None,
+    model_format: Optional[str] = None,
+    quantization: Optional[str] = None,
+    context_length: Optional[int] = None,
+    n_worker: int = 1,
+) -> PlacementRequirement:
+    """
+    The resources a model needs on each worker it is launched on.
+    Embedding and rerank models share GPUs with other models, the others take GPUs exclusively.
+    """
+    if n_gpu is None or model_type in ["embedding", "rerank"]:
+        num_gpus = 0
+    else:
+        # n_gpu=auto means using 1 GPU
+        num_gpus = n_gpu if isinstance(n_gpu, int) else 1
+    memory = None
+    if model_type == "LLM" and model_size_in_billions and model_format:
+        from ..model.llm.memory import estimate_llm_gpu_memory
+
+        try:
+            mem_info = estimate_llm_gpu_memory(
+                model_size_in_billions,
+                quantization if quantization != "none" else None,
+                context_length or DEFAULT_PLACEMENT_CONTEXT_LENGTH,
+                model_format,
+            )
+        except Exception as e:
+            logger.debug("Failed to estimate the memory of the model: %r", e)
+            mem_info = None
+        if mem_info is not None:
+            # the activation memory is left out,
+            # which is overestimated quadratically with the context length
+            memory = (
+                mem_info.model_mem + mem_info.kv_cache_mem + mem_info.overhead
+            ) / n_worker
+    return PlacementRequirement(num_gpus=num_gpus, memory=memory)
+
+
+def check_worker(
+    status: Dict[str, Any], requirement: PlacementRequirement
+) -> Tuple[Optional[float], Optional[str]]:
+    """
+    Check if the model fits the worker of `status`, see `WorkerActor.get_placement_status`.
+    Return the free memory in MB left after placing the model, None if unknown,
+    or the reason why the model does not fit.
+    """
+    free_gpus: List[int] = status["free_gpus"]
+    gpu_mem_free: Dict[int, float] = status["gpu_mem_free"]
+    if status["num_gpus"] > 0:
+        num_gpus = requirement.num_gpus
+        if num_gpus > len(free_gpus):
+            return None, (
+                f"needs {num_gpus} free GPUs, "
+                f"{len(free_gpus)} of {status['num_gpus']} GPUs are free"
+            )
+        if any(dev not in gpu_mem_free for dev in free_gpus):
+            return None, None
+        if requirement.memory is not None and num_gpus > 0:
+            # the worker allocates its first free GPUs
+            mem_per_gpu = requirement.memory / num_gpus
+            min_free = min(gpu_mem_free[dev] for dev in free_gpus[:num_gpus])
+            if min_free < mem_per_gpu:
+                return None, (
+                    f"needs {mem_per_gpu:.0f} MB on each of {num_gpus} GPUs, "
+                    f"only {min_free:.0f} MB free"
+                )
+            return (
+                sum(gpu_mem_free[dev] for dev in free_gpus) - requirement.memory,
+                None,
+            )
+        return sum(gpu_mem_free[dev] for dev in free_gpus), None
+
+    mem_available = status["mem_available"]
+    if mem_available is None:
+        return None, None
+    if requirement.memory is not None:
+        if mem_available < requirement.memory:
+            return None, (
+                f"needs {requirement.memory:.0f} MB of memory, "
+                f"only {mem_available:.0f} MB available"
+            )
+        return mem_available - requirement.memory, None
+    return mem_available, None
+
+
+def choose_worker(
+    statuses: Dict[str, Union[Dict[str, Any], BaseException]],
+    requirement: PlacementRequirement,
+    strategy: Optional[str] = None,
+) -> str:
+    """
+    Choose the address of the worker to place the model, among the workers which it fits.
+    `spread` chooses the worker with the most free memory left, to balance the load,
+    `binpack` chooses the one with the least, to keep large free spaces for large models.
+    Ties are broken by the number of running models.
+    Raise `PlacementError` with the reason of each worker if the model fits none.
+    """
+    if strategy is None:
+        strategy = XINFERENCE_PLACEMENT_STRATEGY
+    if strategy not in PLACEMENT_STRATEGIES:
+        raise ValueError(
+            f"Unsupported placement strategy: {strategy}, "
+            f"must be one of {', '.join(PLACEMENT_STRATEGIES)}"
+        )
+    candidates = []
+    reasons = {}
+    for address, status in statuses.items():
+        if isinstance(status, BaseException):
+            reasons[address] = f"failed to get the status, {status!r}"
+            continue
+        free_mem, reason = check_worker(status, requirement)
+        if reason is not None:
+            reasons[address] = reason
+            continue
+        free_mem = free_mem or 0.0
+        if strategy == "spread":
+            key = (-free_mem, status["model_count"])
+        else:
+            key = (free_mem, -status["model_count"])
+        candidates.append((key, address))
+    if not candidates:
+        raise PlacementError(reasons)
+    return min(candidates)[1]
@@ -40,6 +40,8 @@ class _ProgressInfo:
     progress: float
     last_updated: float
     info: Optional[str] = None
+    # e.g. the seconds of the stages of launching a model
+    metrics: Dict[str, float] = dataclasses.field(default_factory=dict)
 
 
 class ProgressTrackerActor(xo.StatelessActor):
@@ -117,6 +119,12 @@ class ProgressTrackerActor(xo.StatelessActor):
         info = self._request_id_to_progress[request_id]
         return info.progress, info.info
 
+    def set_metrics(self, request_id: str, metrics: Dict[str, float]):
+        self._request_id_to_progress[request_id].metrics.update(metrics)
+
+    def get_metrics(self, request_id: str) -> Dict[str, float]:
+        return dict(self._request_id_to_progress[request_id].metrics)
+
 
 class Progressor:
     _sub_progress_stack: List[Tuple[float, float]]
@@ -193,3 +201,10 @@ class Progressor:
                 )
                 asyncio.run_coroutine_threadsafe(set_progress, self.loop)  # type: ignore
                 self._last_report_progress = self._current_progress
+
+    def set_metrics(self, **metrics: float):
+        if self.request_id:
+            set_metrics = self.progress_tracker_ref.set_metrics(
+                self.request_id, metrics
+            )
+            asyncio.run_coroutine_threadsafe(set_metrics, self.loop)  # type: ignore
@@ -0,0 +1,172 @@
+# Copyright 2022-2025 XProbe Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import logging
+import random
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Type
+
+from ..constants import (
+    XINFERENCE_REPLICA_ROUTING_POLICY,
+    XINFERENCE_REPLICA_SESSION_AFFINITY,
+)
+
+logger = logging.getLogger(__name__)
+
+# seconds to wait for the load of a replica, a replica not answering in time is seen as busiest
+REPLICA_LOAD_TIMEOUT = 1
+# sessions remembered for the session affinity
+MAX_AFFINITY_SESSIONS = 10000
+
+# get the load of the replica of an index, see `ModelActor.get_load`
+LoadGetter = Callable[[int], Awaitable[Dict[str, Any]]]
+
+
+def get_load_key(load: Dict[str, Any]) -> Tuple[float, float]:
+    """
+    Replicas with smaller keys are less loaded:
+    the fewest outstanding requests, and then the lowest recent latency.
+    """
+    return (load["serve_count"] + load["pending_requests"], load["latency"])
+
+
+class ReplicaSelector:
+    """
+    Select a replica of a model for each request.
+    With session affinity, the requests of a session go to the replica selected
+    for its first request, which holds the KV cache of the prefix of later turns.
+    """
+
+    def __init__(
+        self,
+        session_affinity: bool = False,
+        max_sessions: int = MAX_AFFINITY_SESSIONS,
+    ):
+        self.session_affinity = session_affinity
+        self._max_sessions = max_sessions
+        # session id to replica index, in least recently used order
+        self._sessions: "OrderedDict[str, int]" = OrderedDict()
+
+    async def select(
+        self,
+        num_replicas: int,
+        get_load: LoadGetter,
+        session_id: Optional[str] = None,
+    ) -> int:
+        """
+        The index of the selected replica in `range(num_replicas)`.
+        """
+        use_affinity = self.session_affinity and bool(session_id)
+        if use_affinity:
+            index = self._sessions.get(session_id)  # type: ignore
+            if index is not None and index < num_replicas:
+                self._sessions.move_to_end(session_id)  # type: ignore
+                return index
+        index = await self._select(num_replicas, get_load) if num_replicas > 1 else 0
+        if use_affinity:
+            self._sessions[session_id] = index  # type: ignore
+            self._sessions.move_to_end(session_id)  # type: ignore
+            while len(self._sessions) > self._max_sessions:
+                self._sessions.popitem(last=False)
+        return index
+
+    async def _select(self, num_replicas: int, get_load: LoadGetter) -> int:
+        raise NotImplementedError
+
+    @staticmethod
+    async def get_load_keys(
+        indexes: List[int], get_load: LoadGetter
+    ) -> List[Tuple[float, float]]:
+        async def _get_load_key(index: int) -> Tuple[float, float]:
+            try:
+                load = await asyncio.wait_for(get_load(index), REPLICA_LOAD_TIMEOUT)
+                return get_load_key(load)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.debug("Failed to get the load of replica %s: %r", index, e)
+                return (float("inf"), float("inf"))
+
+        return await asyncio.gather(*[_get_load_key(i) for i in indexes])
+
+
+class RoundRobinSelector(ReplicaSelector):
+    """
+    Select the replicas in turn, without querying their load.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._next = 0
+
+    async def _select(self, num_replicas: int, get_load: LoadGetter) -> int:
+        index = self._next % num_replicas
+        self._next = index + 1
+        return index
+
+
+class LeastRequestsSelector(ReplicaSelector):
+    """
+    Select the replica with the fewest outstanding requests, queried from all the replicas.
+    Ties are broken in turn, so that idle replicas share the requests.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._start = 0
+
+    async def _select(self, num_replicas: int, get_load: LoadGetter) -> int:
+        indexes = list(range(num_replicas))
+        keys = await self.get_load_keys(indexes, get_load)
+        start = self._start % num_replicas
+        self._start = start + 1
+        return min(indexes[start:] + indexes[:start], key=lambda i: keys[i])
+
+
+class PowerOfTwoSelector(ReplicaSelector):
+    """
+    Power of two choices, select the less loaded one of two random replicas.
+    Almost as balanced as the least requests, with only two queries per request.
+    """
+
+    async def _select(self, num_replicas: int, get_load: LoadGetter) -> int:
+        indexes = random.sample(range(num_replicas), 2)
+        keys = await self.get_load_keys(indexes, get_load)
+        return indexes[0] if keys[0] <= keys[1] else indexes[1]
+
+
+REPLICA_SELECTORS: Dict[str, Type[ReplicaSelector]] = {
+    "round_robin": RoundRobinSelector,
+    "least_requests": LeastRequestsSelector,
+    "power_of_two": PowerOfTwoSelector,
+}
+
+
+def get_replica_selector(
+    policy: Optional[str] = None, session_affinity: Optional[bool] = None
+) -> ReplicaSelector:
+    """
+    A replica selector, configured by the environment variables by default.
+    """
+    if policy is None:
+        policy = XINFERENCE_REPLICA_ROUTING_POLICY
+    if session_affinity is None:
+        session_affinity = XINFERENCE_REPLICA_SESSION_AFFINITY
+    if policy not in REPLICA_SELECTORS:
+        raise ValueError(
+            f"Unsupported replica routing policy: {policy}, "
+            f"must be one of {', '.join(REPLICA_SELECTORS)}"
+        )
+    return REPLICA_SELECTORS[policy](session_affinity=session_affinity)
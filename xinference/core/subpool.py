@@ -0,0 +1,173 @@
+# Copyright 2022-2025 XProbe Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import importlib
+import logging
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+import xoscar as xo
+from xoscar import MainActorPoolType
+
+logger = logging.getLogger(__name__)
+
+
+class SubPoolWarmerActor(xo.StatelessActor):
+    """
+    Runs in a sub pool to import the heavy modules before a model is launched in it.
+    """
+
+    @classmethod
+    def default_uid(cls) -> str:
+        return "subpool_warmer"
+
+    def import_modules(self, modules: List[str]) -> float:
+        """
+        Import the modules not imported yet, return the seconds taken.
+        """
+        start = time.time()
+        for module in modules:
+            if module in sys.modules:
+                continue
+            try:
+                importlib.import_module(module)
+            except ImportError:
+                logger.debug("Module %s is not available to pre-import", module)
+        return time.time() - start
+
+
+# the python path, None for the python of the worker, and the environment variables
+_PoolKey = Tuple[Optional[str], Tuple[Tuple[str, str], ...]]
+
+
+def _get_pool_key(start_python: Optional[str], envs: Dict[str, str]) -> _PoolKey:
+    return start_python, tuple(sorted(envs.items()))
+
+
+class PrewarmedSubPools:
+    """
+    Idle sub pools of a worker with `modules` imported, so that launching a model skips
+    spawning a process and importing the modules.
+
+    The environment variables, e.g. the visible devices, are set when a sub pool is spawned,
+    since the devices cannot be changed once CUDA is initialized, which the imports may do.
+    So there are `size` idle sub pools for each python environment and environment variables
+    a launch asked for, and a handed out sub pool is replaced in the background.
+    """
+
+    def __init__(self, main_pool: MainActorPoolType, size: int, modules: List[str]):
+        self._main_pool = main_pool
+        self.size = size
+        self.modules = modules
+        self._idle: Dict[_PoolKey, List[str]] = defaultdict(list)
+        self._num_spawning: Dict[_PoolKey, int] = defaultdict(int)
+        self._tasks: Set[asyncio.Task] = set()
+
+    def __contains__(self, address: str) -> bool:
+        return any(address in addresses for addresses in self._idle.values())
+
+    @staticmethod
+    async def get_warmer(address: str) -> xo.ActorRefType[SubPoolWarmerActor]:
+        try:
+            return await xo.actor_ref(
+                address=address, uid=SubPoolWarmerActor.default_uid()
+            )
+        except xo.ActorNotExist:
+            return await xo.create_actor(
+                SubPoolWarmerActor,
+                address=address,
+                uid=SubPoolWarmerActor.default_uid(),
+            )
+
+    async def _spawn(self, key: _PoolKey):
+        start_python, envs = key
+        try:
+            address = await self._main_pool.append_sub_pool(
+                env=dict(envs), start_python=start_python
+            )
+            try:
+                warmer = await self.get_warmer(address)
+                cost = await warmer.import_modules(self.modules)
+            except Exception:
+                await self._main_pool.remove_sub_pool(address, force=True)
+                raise
+            logger.debug("Sub pool %s is pre-warmed in %.2fs", address, cost)
+            self._idle[key].append(address)
+        except Exception:
+            logger.exception("Failed to pre-warm a sub pool")
+        finally:
+            self._num_spawning[key] -= 1
+
+    def _refill(self, key: _PoolKey):
+        missing = self.size - len(self._idle[key]) - self._num_spawning[key]
+        for _ in range(max(missing, 0)):
+            self._num_spawning[key] += 1
+            task = asyncio.create_task(self._spawn(key))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def refill(
+        self, start_python: Optional[str] = None, envs: Optional[Dict[str, str]] = None
+    ):
+        """
+        Spawn sub pools with the environment variables in the background,
+        until there are `size` idle ones.
+        """
+        self._refill(_get_pool_key(start_python, envs or {}))
+
+    async def acquire(
+        self, start_python: Optional[str], envs: Dict[str, str]
+    ) -> Optional[str]:
+        """
+        Hand out an idle sub pool spawned with the environment variables,
+        None if there is no idle one.
+        """
+        key = _get_pool_key(start_python, envs)
+        idle = self._idle[key]
+        try:
+            while idle:
+                address = idle.pop(0)
+                try:
+                    await self.get_warmer(address)
+                    return address
+                except Exception:
+                    logger.warning("Idle sub pool %s is broken", address, exc_info=True)
+                await self._main_pool.remove_sub_pool(address, force=True)
+            return None
+        finally:
+            self._refill(key)
+
+    def discard(self, address: str) -> bool:
+        """
+        Forget an idle sub pool which is down, return whether it is an idle one.
+        """
+        for key, addresses in self._idle.items():
+            if address in addresses:
+                addresses.remove(address)
+                self._refill(key)
+                return True
+        return False
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        addresses = [a for addresses in self._idle.values() for a in addresses]
+        self._idle.clear()
+        await asyncio.gather(
+            *[self._main_pool.remove_sub_pool(a, force=True) for a in addresses],
+            return_exceptions=True,
+        )
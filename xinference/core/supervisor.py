@@ -13,20 +13,19 @@
 # limitations under the License.
 
 import asyncio
-import itertools
 import os
 import signal
 import time
 import typing
-from collections import defaultdict
+from collections import defaultdict, deque
 from dataclasses import dataclass, field
 from logging import getLogger
 from typing import (
     TYPE_CHECKING,
     Any,
     DefaultDict,
+    Deque,
     Dict,
-    Iterator,
     List,
     Literal,
     Optional,
@@ -42,12 +41,23 @@ from ..constants import (
     XINFERENCE_HEALTH_CHECK_FAILURE_THRESHOLD,
     XINFERENCE_HEALTH_CHECK_INTERVAL,
     XINFERENCE_HEALTH_CHECK_TIMEOUT,
+    XINFERENCE_ON_DEMAND_IDLE_TTL,
+    XINFERENCE_REPLICA_ROUTING_POLICY,
+    XINFERENCE_REPLICA_SESSION_AFFINITY,
 )
 from ..core.model import ModelActor
 from ..core.status_guard import InstanceInfo, LaunchStatus
 from ..model.utils import get_engine_params_by_name
 from ..types import PeftModelConfig
 from .metrics import record_metrics
+from .on_demand import ON_DEMAND_CHECK_INTERVAL, OnDemandModel, select_lru_model
+from .placement import (
+    PlacementError,
+    PlacementRequirement,
+    choose_worker,
+    get_placement_requirement,
+)
+from .replica_selector import ReplicaSelector, get_replica_selector
 from .resource import GPUStatus, ResourceStatus
 from .utils import (
     assign_replica_gpu,
@@ -76,6 +86,10 @@ logger = getLogger(__name__)
 
 
 ASYNC_LAUNCH_TASKS = {}  # type: ignore
+# number of the recent routing changes to keep for the watchers
+MAX_ROUTING_CHANGES = 1024
+# seconds to wait for the placement status of a worker
+PLACEMENT_STATUS_TIMEOUT = 10
 
 
 def callback_for_async_launch(model_uid: str):
@@ -93,7 +107,7 @@ class WorkerStatus:
 @dataclass
 class ReplicaInfo:
     replica: int
-    scheduler: Iterator
+    selector: ReplicaSelector
     replica_to_worker_refs: DefaultDict[int, List[xo.ActorRefType["WorkerActor"]]] = (
         field(default_factory=lambda: defaultdict(list))
     )
@@ -114,6 +128,16 @@ class SupervisorActor(xo.StatelessActor):
         self._model_uid_to_replica_info: Dict[str, ReplicaInfo] = {}  # type: ignore
         self._uptime = None
         self._lock = asyncio.Lock()
+        # version of the routing of models, increased when any model is changed,
+        # and the recent changes as (version, model uid)
+        self._routing_version = 0
+        self._routing_changes: Deque[Tuple[int, str]] = deque(
+            maxlen=MAX_ROUTING_CHANGES
+        )
+        self._routing_changed: Optional[asyncio.Event] = None
+        # the models launched on demand, loaded or not
+        self._on_demand_models: Dict[str, OnDemandModel] = {}
+        self._on_demand_check_task: Optional[asyncio.Task] = None
 
     @classmethod
     def default_uid(cls) -> str:
@@ -130,6 +154,7 @@ class SupervisorActor(xo.StatelessActor):
 
     async def __post_create__(self):
         self._uptime = time.time()
+        self._loop = asyncio.get_running_loop()
         if not XINFERENCE_DISABLE_HEALTH_CHECK:
             # Run _check_dead_nodes() in a dedicated thread.
             from ..isolation import Isolation
@@ -377,27 +402,33 @@ class SupervisorActor(xo.StatelessActor):
         return await worker_ref.get_devices_count()
 
     async def _choose_worker(
-        self, available_workers: Optional[List[str]] = None
+        self,
+        available_workers: Optional[List[str]] = None,
+        requirement: Optional[PlacementRequirement] = None,
     ) -> xo.ActorRefType["WorkerActor"]:
-        # TODO: better allocation strategy.
-        min_running_model_count = None
-        target_worker = None
-
-        for worker_addr, worker in self._worker_address_to_worker.items():
-            if available_workers and worker_addr not in available_workers:
-                continue
-            running_model_count = await worker.get_model_count()
-            if (
-                min_running_model_count is None
-                or running_model_count < min_running_model_count
-            ):
-                min_running_model_count = running_model_count
-                target_worker = worker
+        workers = {
+            worker_addr: worker
+            for worker_addr, worker in self._worker_address_to_worker.items()
+            if not available_workers or worker_addr in available_workers
+        }
+        if not workers:
+            raise RuntimeError("No available worker found")
 
-        if target_worker:
-            return target_worker
+        async def _get_placement_status(worker):
+            return await xo.wait_for(
+                worker.get_placement_status(), timeout=PLACEMENT_STATUS_TIMEOUT
+            )
 
-        raise RuntimeError("No available worker found")
+        statuses: List[Union[Dict[str, Any], BaseException]] = await asyncio.gather(
+            *[_get_placement_status(worker) for worker in workers.values()],
+            return_exceptions=True,
+        )
+        target_addr = choose_worker(
+            dict(zip(workers, statuses)),
+            requirement or PlacementRequirement(),
+        )
+        logger.debug("Choose worker %s for %s", target_addr, requirement)
+        return workers[target_addr]
 
     @log_sync(logger=logger)
     def get_status(self) -> Dict:
@@ -911,7 +942,10 @@ class SupervisorActor(xo.StatelessActor):
             raise ValueError(f"Unsupported model type: {model_type}")
 
     def _gen_model_uid(self, model_name: str) -> str:
-        if model_name not in self._model_uid_to_replica_info:
+        if (
+            model_name not in self._model_uid_to_replica_info
+            and model_name not in self._on_demand_models
+        ):
             return model_name
         logger.debug(
             f"{model_name} exists in xinference. Generate suffix to {model_name} for model_uid."
@@ -980,6 +1014,8 @@ class SupervisorActor(xo.StatelessActor):
         enable_virtual_env: Optional[bool] = None,
         virtual_env_packages: Optional[List[str]] = None,
         envs: Optional[Dict[str, str]] = None,
+        on_demand: bool = False,
+        idle_ttl: Optional[float] = None,
         **kwargs,
     ) -> str:
         if self.is_local_deployment() and n_worker > 1:  # type: ignore
@@ -987,6 +1023,33 @@ class SupervisorActor(xo.StatelessActor):
             logger.warning("Local deployment, ignore n_worker(%s)", n_worker)
             n_worker = 1
 
+        if on_demand:
+            if n_worker > 1:  # type: ignore
+                raise ValueError("On-demand launch does not support n_worker > 1.")
+            return self._register_on_demand_model(
+                idle_ttl,
+                model_uid=model_uid,
+                model_name=model_name,
+                model_size_in_billions=model_size_in_billions,
+                model_format=model_format,
+                quantization=quantization,
+                model_engine=model_engine,
+                model_type=model_type,
+                replica=replica,
+                n_gpu=n_gpu,
+                request_limits=request_limits,
+                model_version=model_version,
+                peft_model_config=peft_model_config,
+                worker_ip=worker_ip,
+                gpu_idx=gpu_idx,
+                download_hub=download_hub,
+                model_path=model_path,
+                enable_virtual_env=enable_virtual_env,
+                virtual_env_packages=virtual_env_packages,
+                envs=envs,
+                **kwargs,
+            )
+
         if n_worker > 1:  # type: ignore
             # distributed inference
             return await self._launch_builtin_sharded_model(
@@ -1160,6 +1223,19 @@ class SupervisorActor(xo.StatelessActor):
             await worker_ref.wait_for_load(_replica_model_uid)
             return subpool_address
 
+        placement_requirement = (
+            get_placement_requirement(
+                model_type or "LLM",
+                n_gpu,
+                model_size_in_billions,
+                model_format,
+                quantization,
+                kwargs.get("max_model_len"),
+            )
+            if gpu_idx is None
+            else None
+        )
+
         async def _launch_model():
             try:
                 worker_refs = []
@@ -1170,7 +1246,9 @@ class SupervisorActor(xo.StatelessActor):
                     worker_ref = (
                         target_ip_worker_ref
                         if target_ip_worker_ref is not None
-                        else await self._choose_worker()
+                        else await self._choose_worker(
+                            requirement=placement_requirement
+                        )
                     )
                     self._model_uid_to_replica_info[model_uid].replica_to_worker_refs[
                         _idx
@@ -1217,7 +1295,7 @@ class SupervisorActor(xo.StatelessActor):
                     logger.debug(f"Init transfer component for xavier done.")
             except Exception:
                 # terminate_model will remove the replica info.
-                await self.terminate_model(model_uid, suppress_exception=True)
+                await self._terminate_model(model_uid, suppress_exception=True)
                 await self._status_guard_ref.update_instance_info(
                     model_uid, {"status": LaunchStatus.ERROR.name}
                 )
@@ -1237,7 +1315,7 @@ class SupervisorActor(xo.StatelessActor):
             raise ValueError(f"Model is already in the model list, uid: {model_uid}")
         # Set replica info first for exception handler to terminate model.
         self._model_uid_to_replica_info[model_uid] = ReplicaInfo(
-            replica=replica, scheduler=itertools.cycle(range(replica))
+            replica=replica, selector=get_replica_selector()
         )
         instance_info = InstanceInfo(
             model_name=model_name,
@@ -1257,6 +1335,140 @@ class SupervisorActor(xo.StatelessActor):
             task.add_done_callback(lambda _: callback_for_async_launch(model_uid))  # type: ignore
         return model_uid
 
+    def _register_on_demand_model(
+        self, idle_ttl: Optional[float], **launch_kwargs
+    ) -> str:
+        model_uid = launch_kwargs["model_uid"]
+        if model_uid is None:
+            model_uid = self._gen_model_uid(launch_kwargs["model_name"])
+        if not is_valid_model_uid(model_uid):
+            raise ValueError(
+                "The model UID is invalid. Please specify the model UID by 0 < length <= 100."
+            )
+        if (
+            model_uid in self._model_uid_to_replica_info
+            or model_uid in self._on_demand_models
+        ):
+            raise ValueError(f"Model is already in the model list, uid: {model_uid}")
+        launch_kwargs.update(model_uid=model_uid, wait_ready=True)
+        self._on_demand_models[model_uid] = OnDemandModel(
+            model_uid=model_uid,
+            launch_kwargs=launch_kwargs,
+            idle_ttl=(
+                XINFERENCE_ON_DEMAND_IDLE_TTL if idle_ttl is None else float(idle_ttl)
+            ),
+        )
+        if self._on_demand_check_task is None or self._on_demand_check_task.done():
+            self._on_demand_check_task = asyncio.create_task(
+                self._check_on_demand_models()
+            )
+        logger.info("Model %s is registered to be loaded on demand", model_uid)
+        return model_uid
+
+    async def _ensure_on_demand_model_loaded(self, model_uid: str):
+        """
+        Load the model if it is launched on demand and not loaded,
+        the concurrent requests wait for the same load.
+        """
+        model = self._on_demand_models.get(model_uid)
+        if model is None:
+            return
+        model.last_used = time.time()
+        if (
+            model.resident
+            and model.task is None
+            and model_uid not in self._model_uid_to_replica_info
+        ):
+            # removed with a dead worker
+            model.resident = False
+        while not model.resident:
+            if model.task is None:
+                model.task = asyncio.create_task(self._load_on_demand_model(model))
+            await asyncio.shield(model.task)
+
+    async def _load_on_demand_model(self, model: OnDemandModel):
+        try:
+            start = time.time()
+            while True:
+                try:
+                    await self.launch_builtin_model(**model.launch_kwargs)
+                    break
+                except PlacementError:
+                    # free the memory of the least recently used models
+                    victim = select_lru_model(
+                        self._on_demand_models.values(), exclude=model.model_uid
+                    )
+                    if victim is None:
+                        raise
+                    await self._evict_on_demand_model(victim, "memory")
+            cold_start_time = time.time() - start
+            model.resident = True
+            model.last_used = time.time()
+            model.num_cold_starts += 1
+            labels = {"model": model.model_uid}
+            record_metrics(
+                "on_demand_cold_starts_total_counter",
+                "add",
+                {"labels": labels, "value": 1},
+            )
+            record_metrics(
+                "on_demand_cold_start_time",
+                "set",
+                {"labels": labels, "value": cold_start_time * 1000},
+            )
+            logger.info(
+                "On-demand model %s is loaded in %.2fs",
+                model.model_uid,
+                cold_start_time,
+            )
+        finally:
+            model.task = None
+
+    async def _evict_on_demand_model(self, model: OnDemandModel, reason: str):
+        # requests arriving during the eviction wait for it, then load the model again
+        model.resident = False
+        model.task = asyncio.create_task(
+            self._terminate_model(model.model_uid, suppress_exception=True)
+        )
+        try:
+            await model.task
+        finally:
+            model.task = None
+        model.num_evictions += 1
+        record_metrics(
+            "on_demand_evictions_total_counter",
+            "add",
+            {"labels": {"model": model.model_uid, "reason": reason}, "value": 1},
+        )
+        logger.info(
+            "On-demand model %s is evicted, reason: %s", model.model_uid, reason
+        )
+
+    async def _check_on_demand_models(self):
+        """
+        Evict the on-demand models idle for longer than their TTLs.
+        """
+        while self._on_demand_models:
+            await asyncio.sleep(ON_DEMAND_CHECK_INTERVAL)
+            for model in list(self._on_demand_models.values()):
+                if not model.is_evictable():
+                    continue
+                try:
+                    replica = self._model_uid_to_replica_info[model.model_uid].replica
+                    loads = [
+                        await (
+                            await self._get_replica_model(model.model_uid, rep_id)
+                        ).get_load()
+                        for rep_id in range(replica)
+                    ]
+                    model.update_usage(loads)
+                    if model.is_expired(time.time()):
+                        await self._evict_on_demand_model(model, "idle")
+                except Exception:
+                    logger.exception(
+                        "Failed to check the on-demand model %s", model.model_uid
+                    )
+
     async def _launch_builtin_sharded_model(
         self,
         model_uid: Optional[str],
@@ -1307,6 +1519,20 @@ class SupervisorActor(xo.StatelessActor):
             else:
                 available_workers.append(worker_ip)
 
+        placement_requirement = (
+            get_placement_requirement(
+                model_type or "LLM",
+                n_gpu,
+                model_size_in_billions,
+                model_format,
+                quantization,
+                kwargs.get("max_model_len"),
+                n_worker=n_worker or 1,
+            )
+            if gpu_idx is None
+            else None
+        )
+
         async def _launch_model():
             # Validation of n_worker, intercept if it is greater than the available workers.
             if n_worker > len(available_workers):
@@ -1324,7 +1550,9 @@ class SupervisorActor(xo.StatelessActor):
                     worker_refs = []
                     driver_info = None
                     for i_worker in range(n_worker):
-                        worker_ref = await self._choose_worker(available_workers)
+                        worker_ref = await self._choose_worker(
+                            available_workers, placement_requirement
+                        )
                         self._model_uid_to_replica_info[
                             model_uid
                         ].replica_to_worker_refs[_idx].append(worker_ref)
@@ -1394,7 +1622,7 @@ class SupervisorActor(xo.StatelessActor):
 
         # Set replica info first for exception handler to terminate model.
         self._model_uid_to_replica_info[model_uid] = ReplicaInfo(
-            replica=replica, scheduler=itertools.cycle(range(replica))
+            replica=replica, selector=get_replica_selector()
         )
         instance_info = InstanceInfo(
             model_name=model_name,
@@ -1456,6 +1684,7 @@ class SupervisorActor(xo.StatelessActor):
             pass
         # remove replica info
         self._model_uid_to_replica_info.pop(model_uid, None)
+        self.notify_routing_change(model_uid)
 
     async def get_instance_info(
         self, model_name: Optional[str], model_uid: Optional[str]
@@ -1504,6 +1733,10 @@ class SupervisorActor(xo.StatelessActor):
                             self._replica_model_uid_to_worker.pop(
                                 replica_model_uid, None
                             )
+                            # running in the thread of health check
+                            self._loop.call_soon_threadsafe(
+                                self.notify_routing_change, model_uid
+                            )
                         dead_nodes.append(address)
                     elif (
                         status.failure_remaining_count
@@ -1523,6 +1756,17 @@ class SupervisorActor(xo.StatelessActor):
 
     @log_async(logger=logger)
     async def terminate_model(self, model_uid: str, suppress_exception=False):
+        model = self._on_demand_models.pop(model_uid, None)
+        if model is not None:
+            if model.task is not None:
+                # the model is being loaded or evicted
+                await asyncio.gather(model.task, return_exceptions=True)
+            if not model.resident:
+                self.notify_routing_change(model_uid)
+                return
+        await self._terminate_model(model_uid, suppress_exception)
+
+    async def _terminate_model(self, model_uid: str, suppress_exception=False):
         async def _terminate_one_model(_replica_model_uid):
             worker_refs = self._replica_model_uid_to_worker.get(
                 _replica_model_uid, None
@@ -1549,6 +1793,7 @@ class SupervisorActor(xo.StatelessActor):
                 if not suppress_exception:
                     raise
         self._model_uid_to_replica_info.pop(model_uid, None)
+        self.notify_routing_change(model_uid)
 
         # clear for xavier
         rank0_uid = model_uid + "-rank0"
@@ -1582,16 +1827,58 @@ class SupervisorActor(xo.StatelessActor):
             finally:
                 logger.debug(f"Destroy block_tracker_ref done. model uid: {model_uid}")
 
+    async def _get_replica_models(
+        self, model_uid: str
+    ) -> List[xo.ActorRefType["ModelActor"]]:
+        replica_info = self._model_uid_to_replica_info.get(model_uid, None)
+        if replica_info is None:
+            raise ValueError(f"Model not found in the model list, uid: {model_uid}")
+        return [
+            await self._get_replica_model(model_uid, rep_id)
+            for rep_id in range(replica_info.replica)
+        ]
+
+    @log_async(logger=logger)
+    async def sleep_model(self, model_uid: str):
+        """
+        Offload the weights of all the replicas to the host memory to free the device memory,
+        the replicas keep running and reject requests until woken up.
+        """
+        model_refs = await self._get_replica_models(model_uid)
+        await asyncio.gather(*[model_ref.sleep() for model_ref in model_refs])
+
+    @log_async(logger=logger)
+    async def wake_model(self, model_uid: str):
+        model_refs = await self._get_replica_models(model_uid)
+        await asyncio.gather(*[model_ref.wake() for model_ref in model_refs])
+
     @log_async(logger=logger)
-    async def get_model(self, model_uid: str) -> xo.ActorRefType["ModelActor"]:
+    async def get_model(
+        self, model_uid: str, session_id: Optional[str] = None
+    ) -> xo.ActorRefType["ModelActor"]:
+        """
+        A replica of the model, selected by the replica routing policy.
+        With session affinity, the requests of the same `session_id` go to the same replica.
+        A model launched on demand is loaded first if it is not loaded.
+        """
+        await self._ensure_on_demand_model_loaded(model_uid)
         replica_info = self._model_uid_to_replica_info.get(model_uid, None)
         if replica_info is None:
             raise ValueError(f"Model not found in the model list, uid: {model_uid}")
 
-        replica_model_uid = build_replica_model_uid(
-            model_uid, next(replica_info.scheduler)
+        async def _get_load(rep_id: int) -> Dict[str, Any]:
+            model_ref = await self._get_replica_model(model_uid, rep_id)
+            return await model_ref.get_load()
+
+        rep_id = await replica_info.selector.select(
+            replica_info.replica, _get_load, session_id
         )
+        return await self._get_replica_model(model_uid, rep_id)
 
+    async def _get_replica_model(
+        self, model_uid: str, rep_id: int
+    ) -> xo.ActorRefType["ModelActor"]:
+        replica_model_uid = build_replica_model_uid(model_uid, rep_id)
         worker_ref = self._replica_model_uid_to_worker.get(replica_model_uid, None)
         if worker_ref is None:
             raise ValueError(
@@ -1602,6 +1889,67 @@ class SupervisorActor(xo.StatelessActor):
             worker_ref = worker_ref[0]
         return await worker_ref.get_model(model_uid=replica_model_uid)
 
+    def notify_routing_change(self, model_uid: str):
+        """
+        Called when the model is terminated, or its replicas are changed,
+        so that the cached routing of the model is invalidated.
+        """
+        self._routing_version += 1
+        self._routing_changes.append((self._routing_version, model_uid))
+        if self._routing_changed is not None:
+            self._routing_changed.set()
+            self._routing_changed = None
+
+    async def watch_routing_changes(
+        self, version: int, timeout: float
+    ) -> Tuple[int, Optional[List[str]]]:
+        """
+        Wait at most `timeout` seconds until the routing is changed after `version`,
+        return the current version and the uids of models changed after `version`,
+        None for all the models if the changes are too old to know.
+        """
+        if version == self._routing_version:
+            if self._routing_changed is None:
+                self._routing_changed = asyncio.Event()
+            try:
+                await asyncio.wait_for(self._routing_changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        if version > self._routing_version or (
+            version < self._routing_version
+            and (not self._routing_changes or self._routing_changes[0][0] > version + 1)
+        ):
+            return self._routing_version, None
+        return self._routing_version, list(
+            {uid for v, uid in self._routing_changes if v > version}
+        )
+
+    @log_async(logger=logger)
+    async def get_model_routing(self, model_uid: str) -> Dict[str, Any]:
+        """
+        Everything to route the requests of the model,
+        which is cached until the routing version of the model changes.
+        """
+        await self._ensure_on_demand_model_loaded(model_uid)
+        version = self._routing_version
+        replica_info = self._model_uid_to_replica_info.get(model_uid, None)
+        if replica_info is None:
+            raise ValueError(f"Model not found in the model list, uid: {model_uid}")
+        replica_refs = [
+            await self._get_replica_model(model_uid, rep_id)
+            for rep_id in range(replica_info.replica)
+        ]
+        description = await self.describe_model(model_uid)
+        return {
+            "version": version,
+            "description": description,
+            "replica_refs": replica_refs,
+            "is_vllm_backend": await replica_refs[0].is_vllm_backend(),
+            "is_sglang_backend": await replica_refs[0].is_sglang_backend(),
+            "routing_policy": XINFERENCE_REPLICA_ROUTING_POLICY,
+            "session_affinity": XINFERENCE_REPLICA_SESSION_AFFINITY,
+        }
+
     @log_async(logger=logger)
     async def get_model_status(self, replica_model_uid: str):
         worker_ref = self._replica_model_uid_to_worker.get(replica_model_uid, None)
@@ -1616,6 +1964,10 @@ class SupervisorActor(xo.StatelessActor):
 
     @log_async(logger=logger)
     async def describe_model(self, model_uid: str) -> Dict[str, Any]:
+        on_demand_model = self._on_demand_models.get(model_uid)
+        if on_demand_model is not None and not on_demand_model.resident:
+            # describing a model does not load it
+            return on_demand_model.describe()
         replica_info = self._model_uid_to_replica_info.get(model_uid, None)
         if replica_info is None:
             raise ValueError(f"Model not found in the model list, uid: {model_uid}")
@@ -1645,6 +1997,13 @@ class SupervisorActor(xo.StatelessActor):
         # add replica count
         for k, v in running_model_info.items():
             v["replica"] = self._model_uid_to_replica_info[k].replica
+            if k in self._on_demand_models:
+                v["on_demand"] = True
+                v["resident"] = True
+        # the on-demand models not loaded
+        for model_uid, model in self._on_demand_models.items():
+            if model_uid not in running_model_info:
+                running_model_info[model_uid] = model.describe()
         return running_model_info
 
     def is_local_deployment(self) -> bool:
@@ -1750,6 +2109,7 @@ class SupervisorActor(xo.StatelessActor):
             model_uid, _ = parse_replica_model_uid(replica_model_uid)
             self._model_uid_to_replica_info.pop(model_uid, None)
             self._replica_model_uid_to_worker.pop(replica_model_uid, None)
+            self.notify_routing_change(model_uid)
 
         if worker_address in self._worker_address_to_worker:
             del self._worker_address_to_worker[worker_address]
@@ -16,9 +16,11 @@ import asyncio
 
 import pytest
 import pytest_asyncio
+import torch
 import xoscar as xo
 from xoscar import create_actor_pool
 
+from ...model.offload import SleepModelMixin
 from ..model import ModelActor
 
 TEST_EVENT = None
@@ -107,8 +109,8 @@ async def test_concurrent_call(setup_pool):
         async for g in gen:
             result.append(g)
         assert result == [
-            b'data: {"test1": "test_prompt2"}\r\n\r\n',
-            b'data: {"test2": "test_prompt2"}\r\n\r\n',
+            b'data: {"test1":"test_prompt2"}\r\n\r\n',
+            b'data: {"test2":"test_prompt2"}\r\n\r\n',
         ]
 
     check_task = asyncio.create_task(_check())
@@ -121,3 +123,71 @@ async def test_concurrent_call(setup_pool):
     await check_task
     pending_count = await worker.get_pending_requests_count()
     assert pending_count == 0
+
+
+class MockStreamModel(MockModel):
+    async def generate(self, prompt, **kwargs):
+        for i in range(3):
+            yield {"index": i}
+
+
+class MockStreamModelActor(MockModelActor):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._model = MockStreamModel()  # type: ignore
+        self._lock = None
+        self._stream_flush_interval = 0.5
+
+
+@pytest.mark.asyncio
+async def test_coalesce_stream(setup_pool):
+    pool = setup_pool
+    actor: xo.ActorRefType[MockStreamModelActor] = await xo.create_actor(  # type: ignore
+        MockStreamModelActor,
+        address=pool.external_address,
+        uid=MockStreamModelActor.default_uid(),
+        supervisor_address="test:123",
+        worker_address="test:345",
+        replica_model_uid="test_model",
+    )
+    gen = await actor.generate("test_prompt")
+    # the chunks within the flush interval are sent in one message
+    assert [g async for g in gen] == [
+        b'data: {"index":0}\r\n\r\ndata: {"index":1}\r\n\r\ndata: {"index":2}\r\n\r\n'
+    ]
+
+
+class MockSleepModel(MockStreamModel, SleepModelMixin):
+    def __init__(self):
+        super().__init__()
+        self._model = torch.nn.Linear(4, 4)
+
+
+class MockSleepModelActor(MockStreamModelActor):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._model = MockSleepModel()  # type: ignore
+        self._stream_flush_interval = 0
+
+
+@pytest.mark.asyncio
+async def test_sleep(setup_pool):
+    pool = setup_pool
+    actor: xo.ActorRefType[MockSleepModelActor] = await xo.create_actor(  # type: ignore
+        MockSleepModelActor,
+        address=pool.external_address,
+        uid=MockSleepModelActor.default_uid(),
+        supervisor_address="test:123",
+        worker_address="test:345",
+        replica_model_uid="test_model",
+    )
+    await actor.sleep()
+    assert await actor.is_sleeping()
+    # a sleeping model rejects requests
+    with pytest.raises(RuntimeError, match="sleeping"):
+        await actor.generate("test_prompt")
+
+    await actor.wake()
+    assert not await actor.is_sleeping()
+    gen = await actor.generate("test_prompt")
+    assert len([g async for g in gen]) == 3
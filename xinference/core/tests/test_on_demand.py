@@ -0,0 +1,117 @@
+# Copyright 2022-2025 XProbe Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import time
+from unittest.mock import AsyncMock
+
+import pytest
+
+from ..on_demand import OnDemandModel, select_lru_model
+from ..placement import PlacementError
+from ..replica_selector import get_replica_selector
+from ..supervisor import ReplicaInfo, SupervisorActor
+
+
+def _create_mock_supervisor(monkeypatch, capacity: int) -> SupervisorActor:
+    """
+    Holds at most `capacity` models, and loads a model in 0.1 seconds.
+    """
+    supervisor = SupervisorActor()
+
+    async def _launch(model_uid: str, **kwargs):
+        if len(supervisor._model_uid_to_replica_info) >= capacity:
+            raise PlacementError({"worker": "not enough memory"})
+        supervisor._model_uid_to_replica_info[model_uid] = ReplicaInfo(
+            replica=1, selector=get_replica_selector()
+        )
+        await asyncio.sleep(0.1)
+        return model_uid
+
+    async def _terminate(model_uid: str, suppress_exception=False):
+        supervisor._model_uid_to_replica_info.pop(model_uid, None)
+        supervisor.notify_routing_change(model_uid)
+
+    monkeypatch.setattr(
+        supervisor, "launch_builtin_model", AsyncMock(side_effect=_launch)
+    )
+    monkeypatch.setattr(supervisor, "_terminate_model", _terminate)
+    return supervisor
+
+
+def test_on_demand_model():
+    model = OnDemandModel("m", {}, idle_ttl=10, last_used=100)
+    assert not model.is_evictable()
+    model.resident = True
+    model.update_usage([{"serve_count": 1, "last_request_time": 105}])
+    assert model.busy
+    assert model.last_used == 105
+    assert not model.is_expired(200)
+
+    model.update_usage([{"serve_count": 0, "pending_requests": 0}])
+    assert not model.busy
+    assert not model.is_expired(110)
+    assert model.is_expired(200)
+
+    other = OnDemandModel("n", {}, idle_ttl=10, last_used=101, resident=True)
+    assert select_lru_model([model, other]) is other
+    assert select_lru_model([model, other], exclude="n") is model
+    other.busy = True
+    assert select_lru_model([model, other]) is model
+
+
+async def test_load_on_demand(monkeypatch):
+    supervisor = _create_mock_supervisor(monkeypatch, capacity=1)
+    for model_uid in ["model_a", "model_b"]:
+        assert (
+            supervisor._register_on_demand_model(
+                None, model_uid=model_uid, model_name="mock", replica=1
+            )
+            == model_uid
+        )
+    with pytest.raises(ValueError):
+        supervisor._register_on_demand_model(
+            None, model_uid="model_a", model_name="mock", replica=1
+        )
+    model_a = supervisor._on_demand_models["model_a"]
+    model_b = supervisor._on_demand_models["model_b"]
+
+    # describing a model does not load it
+    info = await supervisor.describe_model("model_a")
+    assert info["model_name"] == "mock"
+    assert info["on_demand"] and not info["resident"]
+    assert supervisor.launch_builtin_model.call_count == 0
+
+    # the concurrent requests wait for the same load
+    await asyncio.gather(
+        *[supervisor._ensure_on_demand_model_loaded("model_a") for _ in range(3)]
+    )
+    assert supervisor.launch_builtin_model.call_count == 1
+    assert model_a.resident and model_a.num_cold_starts == 1
+
+    # the least recently used model is evicted for the memory
+    model_a.last_used = time.time() - 1
+    await supervisor._ensure_on_demand_model_loaded("model_b")
+    assert model_b.resident
+    assert not model_a.resident and model_a.num_evictions == 1
+    assert list(supervisor._model_uid_to_replica_info) == ["model_b"]
+
+    # a busy model is not evicted
+    model_b.busy = True
+    with pytest.raises(PlacementError):
+        await supervisor._ensure_on_demand_model_loaded("model_a")
+
+    await supervisor.terminate_model("model_a")
+    assert "model_a" not in supervisor._on_demand_models
+    supervisor._on_demand_check_task.cancel()
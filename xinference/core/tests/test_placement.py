@@ -0,0 +1,83 @@
+# Copyright 2022-2025 XProbe Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from ..placement import (
+    PlacementError,
+    PlacementRequirement,
+    choose_worker,
+    get_placement_requirement,
+)
+
+
+def _gpu_worker(gpu_mem_free, num_gpus=4, model_count=0):
+    return {
+        "model_count": model_count,
+        "num_gpus": num_gpus,
+        "free_gpus": list(gpu_mem_free),
+        "gpu_mem_free": gpu_mem_free,
+        "mem_available": 64000.0,
+    }
+
+
+def test_placement_requirement():
+    requirement = get_placement_requirement("LLM", "auto", 7, "pytorch", "none")
+    assert requirement.num_gpus == 1
+    # fp16 weights of 7B
+    assert 13000 < requirement.memory < 16000
+    int4 = get_placement_requirement("LLM", 2, 7, "gptq", "Int4")
+    assert int4.num_gpus == 2 and int4.memory < requirement.memory
+    assert get_placement_requirement("embedding", "auto") == PlacementRequirement()
+    assert get_placement_requirement("LLM", None).num_gpus == 0
+    assert get_placement_requirement("LLM", "auto", None, "pytorch").memory is None
+
+
+def test_choose_worker():
+    statuses = {
+        "a": _gpu_worker({0: 20000.0, 1: 20000.0}, model_count=2),
+        "b": _gpu_worker({3: 70000.0}, model_count=3),
+        "c": _gpu_worker({2: 30000.0, 3: 30000.0}, model_count=1),
+        "d": RuntimeError("worker is dead"),
+    }
+    one_gpu = PlacementRequirement(num_gpus=1, memory=15000)
+    assert choose_worker(statuses, one_gpu, "spread") == "b"
+    assert choose_worker(statuses, one_gpu, "binpack") == "a"
+    # 25000 MB on each GPU
+    two_gpus = PlacementRequirement(num_gpus=2, memory=50000)
+    assert choose_worker(statuses, two_gpus, "spread") == "c"
+
+    with pytest.raises(PlacementError) as e:
+        choose_worker(statuses, PlacementRequirement(num_gpus=3), "spread")
+    assert e.value.reasons["a"] == "needs 3 free GPUs, 2 of 4 GPUs are free"
+    assert "worker is dead" in e.value.reasons["d"]
+    with pytest.raises(PlacementError) as e:
+        choose_worker(statuses, PlacementRequirement(num_gpus=1, memory=80000))
+    assert (
+        e.value.reasons["b"] == "needs 80000 MB on each of 1 GPUs, only 70000 MB free"
+    )
+
+    # unknown memory, the fewest models
+    unknown = {
+        addr: dict(s, gpu_mem_free={}) for addr, s in statuses.items() if addr != "d"
+    }
+    assert choose_worker(unknown, one_gpu, "spread") == "c"
+    # CPU workers
+    cpu_workers = {
+        "a": dict(_gpu_worker({}, num_gpus=0), mem_available=8000.0),
+        "b": dict(_gpu_worker({}, num_gpus=0), mem_available=32000.0),
+    }
+    assert choose_worker(cpu_workers, PlacementRequirement(memory=10000)) == "b"
+    with pytest.raises(ValueError):
+        choose_worker(cpu_workers, PlacementRequirement(), "random")
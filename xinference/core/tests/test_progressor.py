@@ -75,3 +75,30 @@ async def test_progressor():
 
         await asyncio.sleep(0.1)
         assert await progress_tracker_ref.get_progress(request_id) == 1.0
+
+
+@pytest.mark.asyncio
+async def test_progressor_metrics():
+    pool = await xo.create_actor_pool("127.0.0.1", n_process=0)
+    async with pool:
+        progress_tracker_ref = await xo.create_actor(
+            ProgressTrackerActor,
+            to_remove_interval=0,
+            check_interval=1,
+            address=pool.external_address,
+            uid=ProgressTrackerActor.default_uid(),
+        )
+        request_id = str(uuid.uuid4())
+
+        progressor = Progressor(
+            request_id, progress_tracker_ref, asyncio.get_running_loop(), upload_span=0
+        )
+        await progressor.start()
+
+        progressor.set_metrics(spawn=0.5)
+        progressor.set_metrics(load=2.0)
+        await asyncio.sleep(0.1)
+        assert await progress_tracker_ref.get_metrics(request_id) == {
+            "spawn": 0.5,
+            "load": 2.0,
+        }
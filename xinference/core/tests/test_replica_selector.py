@@ -0,0 +1,75 @@
+# Copyright 2022-2025 XProbe Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from ..replica_selector import get_replica_selector
+
+
+def _load_getter(loads):
+    queried = []
+
+    async def get_load(index):
+        queried.append(index)
+        if loads[index] is None:
+            raise RuntimeError("replica is dead")
+        serve_count, latency = loads[index]
+        return {"serve_count": serve_count, "pending_requests": 0, "latency": latency}
+
+    return get_load, queried
+
+
+async def test_round_robin():
+    selector = get_replica_selector("round_robin", False)
+    get_load, queried = _load_getter([(0, 0)] * 3)
+    assert [await selector.select(3, get_load) for _ in range(4)] == [0, 1, 2, 0]
+    assert await selector.select(1, get_load) == 0
+    assert not queried
+
+
+async def test_least_requests():
+    selector = get_replica_selector("least_requests", False)
+    # the replica stuck on a long request is skipped
+    get_load, _ = _load_getter([(5, 0.1), (1, 3.0), (1, 0.5), None])
+    assert [await selector.select(4, get_load) for _ in range(3)] == [2, 2, 2]
+    # idle replicas are selected in turn
+    get_load, _ = _load_getter([(0, 0)] * 3)
+    assert sorted([await selector.select(3, get_load) for _ in range(3)]) == [0, 1, 2]
+
+
+async def test_power_of_two():
+    selector = get_replica_selector("power_of_two", False)
+    get_load, queried = _load_getter([(9, 0), (0, 0), (9, 0), (9, 0)])
+    for _ in range(20):
+        queried.clear()
+        index = await selector.select(4, get_load)
+        assert len(queried) == 2
+        assert index == (1 if 1 in queried else queried[0])
+
+
+async def test_session_affinity():
+    selector = get_replica_selector("least_requests", True)
+    loads = [(0, 0), (1, 0)]
+    get_load, _ = _load_getter(loads)
+    assert await selector.select(2, get_load, "s1") == 0
+    loads[0] = (5, 0)
+    # the session sticks to its replica
+    assert await selector.select(2, get_load, "s1") == 0
+    assert await selector.select(2, get_load, "s2") == 1
+    assert await selector.select(2, get_load) == 1
+    # the replica is gone
+    assert await selector.select(1, get_load, "s2") == 0
+
+    with pytest.raises(ValueError):
+        get_replica_selector("random")
@@ -12,8 +12,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
+import json
+
+import pytest
+import sse_starlette.sse
+
 from ..utils import (
     build_replica_model_uid,
+    coalesce_chunks,
+    encode_sse_data,
     iter_replica_model_uid,
     parse_replica_model_uid,
 )
@@ -29,3 +37,45 @@ def test_replica_model_uid():
         all_gen_ids.append(replica_model_uid)
     assert len(all_gen_ids) == 5
     assert len(set(all_gen_ids)) == 5
+
+
+def test_encode_sse_data():
+    chunk = {"id": "1", "choices": [{"delta": {"content": "你好\n"}}]}
+    data = encode_sse_data(chunk)
+    assert data.startswith(b"data: ") and data.endswith(b"\r\n\r\n")
+    # the same event as sse_starlette
+    assert json.loads(data[len(b"data: ") :]) == chunk
+    assert data.count(b"\n") == sse_starlette.sse.ensure_bytes(
+        dict(data=json.dumps(chunk, ensure_ascii=False)), None
+    ).count(b"\n")
+    # fallback for what orjson does not serialize
+    assert json.loads(encode_sse_data({1: 2**70})[len(b"data: ") :]) == {"1": 2**70}
+
+
+async def test_coalesce_chunks():
+    async def burst():
+        for i in range(5):
+            yield b"%d" % i
+        await asyncio.sleep(0.3)
+        yield b"5"
+
+    assert [c async for c in coalesce_chunks(burst(), 0.1, 1024)] == [
+        b"01234",
+        b"5",
+    ]
+    # limited by bytes
+    assert [c async for c in coalesce_chunks(burst(), 0.1, 2)] == [
+        b"01",
+        b"23",
+        b"4",
+        b"5",
+    ]
+
+    async def fail():
+        yield b"0"
+        raise ValueError("failed")
+
+    gen = coalesce_chunks(fail(), 0.1, 1024)
+    assert await gen.__anext__() == b"0"
+    with pytest.raises(ValueError):
+        await gen.__anext__()
@@ -11,6 +11,7 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import asyncio
 from typing import List, Optional, Union
 
 import pytest
@@ -18,6 +19,7 @@ import pytest_asyncio
 import xoscar as xo
 from xoscar import MainActorPoolType, create_actor_pool, get_pool_config
 
+from ..subpool import PrewarmedSubPools
 from ..worker import WorkerActor
 
 
@@ -431,3 +433,40 @@ async def test_launch_model_with_gpu_idx(setup_pool):
     for info in [embedding_info, user_specified_info]:
         for dev, details in info.items():
             assert len(details) == 0
+
+
+@pytest.mark.asyncio
+async def test_prewarmed_sub_pools(setup_pool):
+    pool = setup_pool
+    sub_pools = PrewarmedSubPools(pool, 1, ["json"])
+    envs = {"CUDA_VISIBLE_DEVICES": "-1"}
+
+    async def _wait_idle(key):
+        for _ in range(50):
+            if sub_pools._idle[key]:
+                break
+            await asyncio.sleep(0.1)
+        return sub_pools._idle[key][0]
+
+    # no idle sub pool before pre-warmed, and the devices asked are pre-warmed then
+    assert await sub_pools.acquire(None, envs) is None
+    key = (None, (("CUDA_VISIBLE_DEVICES", "-1"),))
+    address = await _wait_idle(key)
+    assert address in sub_pools
+    # the sub pools are not shared by different devices
+    assert await sub_pools.acquire(None, {}) is None
+
+    assert await sub_pools.acquire(None, envs) == address
+    assert address not in sub_pools
+    warmer = await PrewarmedSubPools.get_warmer(address)
+    # the modules are imported already
+    assert await warmer.import_modules(["json"]) < 0.1
+
+    # a handed out sub pool is replaced
+    new_address = await _wait_idle(key)
+    assert new_address != address
+    assert sub_pools.discard(new_address)
+    assert not sub_pools.discard(address)
+
+    await sub_pools.close()
+    await pool.remove_sub_pool(address)
@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import asyncio
+import json
 import logging
 import os
 import random
@@ -19,7 +20,15 @@ import string
 import uuid
 import weakref
 from enum import Enum
-from typing import Generator, List, Optional, Tuple, Union
+from typing import (
+    AsyncGenerator,
+    AsyncIterator,
+    Generator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 
 import orjson
 
@@ -203,6 +212,78 @@ def json_dumps(o):
     return orjson.dumps(o, default=_default)
 
 
+def encode_sse_data(o) -> bytes:
+    """
+    Encode a chunk as the server-sent event `data: <json>`, the same as `sse_starlette`,
+    but serialized by orjson in the calling thread.
+    """
+    try:
+        data = json_dumps(o)
+    except TypeError:
+        # e.g. non-str keys and integers over 64 bits
+        data = json.dumps(o, ensure_ascii=False).encode("utf-8")
+    # the json has no line breaks, so the event is a single data line
+    return b"data: " + data + b"\r\n\r\n"
+
+
+async def coalesce_chunks(
+    chunks: AsyncIterator[bytes], interval: float, max_bytes: int
+) -> AsyncGenerator[bytes, None]:
+    """
+    Join the chunks which arrive within `interval` seconds after the first of them,
+    up to about `max_bytes`, so that a burst of chunks is sent as one message.
+    A chunk is never delayed more than `interval` seconds.
+    """
+    pending: asyncio.Queue = asyncio.Queue()
+    done = object()
+
+    async def _produce():
+        try:
+            async for chunk in chunks:
+                pending.put_nowait(chunk)
+        except Exception as e:
+            pending.put_nowait(e)
+        pending.put_nowait(done)
+
+    loop = asyncio.get_running_loop()
+    task = asyncio.create_task(_produce())
+    try:
+        item = await pending.get()
+        while item is not done:
+            if isinstance(item, Exception):
+                raise item
+            buffer = [item]
+            size = len(item)
+            deadline = loop.time() + interval
+            item = None
+            while size < max_bytes:
+                if pending.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(pending.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    item = pending.get_nowait()
+                if item is done or isinstance(item, Exception):
+                    break
+                buffer.append(item)
+                size += len(item)
+                item = None
+            yield b"".join(buffer)
+            if item is None:
+                item = await pending.get()
+    finally:
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+
 def purge_dir(d):
     if not os.path.exists(d) or not os.path.isdir(d):
         return
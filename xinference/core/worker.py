@@ -49,6 +49,8 @@ from ..constants import (
     XINFERENCE_DISABLE_METRICS,
     XINFERENCE_ENABLE_VIRTUAL_ENV,
     XINFERENCE_HEALTH_CHECK_INTERVAL,
+    XINFERENCE_PREWARM_MODULES,
+    XINFERENCE_PREWARM_SUBPOOLS,
     XINFERENCE_VIRTUAL_ENV_DIR,
     XINFERENCE_VIRTUAL_ENV_SKIP_INSTALLED,
 )
@@ -64,6 +66,7 @@ from .event import Event, EventCollectorActor, EventType
 from .metrics import launch_metrics_export_server, record_metrics
 from .resource import gather_node_info
 from .status_guard import StatusGuardActor
+from .subpool import PrewarmedSubPools
 from .utils import log_async, log_sync, parse_replica_model_uid, purge_dir
 
 try:
@@ -143,6 +146,14 @@ class WorkerActor(xo.StatelessActor):
         self._model_uid_to_addr: Dict[str, str] = {}
         self._model_uid_to_recover_count: Dict[str, Optional[int]] = {}
         self._model_uid_to_launch_args: Dict[str, Dict] = {}
+        # idle sub pools with the heavy modules imported, handed to launches
+        self._prewarmed_pools = (
+            PrewarmedSubPools(
+                main_pool, XINFERENCE_PREWARM_SUBPOOLS, XINFERENCE_PREWARM_MODULES
+            )
+            if XINFERENCE_PREWARM_SUBPOOLS > 0
+            else None
+        )
 
         if XINFERENCE_DISABLE_METRICS:
             logger.info(
@@ -183,6 +194,8 @@ class WorkerActor(xo.StatelessActor):
             await self._main_pool.remove_sub_pool(address)
         except Exception:
             pass
+        if self._prewarmed_pools is not None and self._prewarmed_pools.discard(address):
+            return
         for model_uid, addr in self._model_uid_to_addr.items():
             if addr == address:
                 launch_args = self._model_uid_to_launch_args.get(model_uid)
@@ -196,6 +209,7 @@ class WorkerActor(xo.StatelessActor):
                         await self.terminate_model(model_uid, is_model_die=True)
                     except Exception:
                         pass
+                    await self._notify_routing_change(model_uid)
                     if recover_count is not None:
                         if recover_count > 0:
                             logger.warning(
@@ -224,13 +238,24 @@ class WorkerActor(xo.StatelessActor):
                                 recover_count - 1
                             )
                             await self.recover_model(launch_args)
+                            await self._notify_routing_change(model_uid)
                         else:
                             logger.warning("Stop recreating model actor.")
                     else:
                         logger.warning("Recreating model actor %s ...", model_uid)
                         await self.recover_model(launch_args)
+                        await self._notify_routing_change(model_uid)
                 break
 
+    async def _notify_routing_change(self, replica_model_uid: str):
+        # the refs of the model actors cached by the RESTful API are changed
+        try:
+            model_uid, _ = parse_replica_model_uid(replica_model_uid)
+            supervisor_ref = await self.get_supervisor_ref(add_worker=False)
+            await supervisor_ref.notify_routing_change(model_uid)
+        except Exception as e:
+            logger.error("Notify routing change error: %s", e)
+
     @classmethod
     def default_uid(cls) -> str:
         return "worker"
@@ -331,6 +356,14 @@ class WorkerActor(xo.StatelessActor):
                 self._periodical_report_status(), loop=self._isolation.loop
             )
         logger.info(f"Xinference worker {self.address} started")
+        if self._prewarmed_pools is not None:
+            # the devices are set before the imports, so sub pools are pre-warmed
+            # for each device, and for the device sets asked by the launches later
+            env_name = get_available_device_env_name() or "CUDA_VISIBLE_DEVICES"
+            for dev in self._total_gpu_devices:
+                self._prewarmed_pools.refill(envs={env_name: str(dev)})
+            if not self._total_gpu_devices:
+                self._prewarmed_pools.refill()
 
         # Windows does not have signal handler
         if os.name != "nt":
@@ -350,6 +383,8 @@ class WorkerActor(xo.StatelessActor):
             )
 
     async def __pre_destroy__(self):
+        if self._prewarmed_pools is not None:
+            await self._prewarmed_pools.close()
         self._isolation.stop()
 
     async def trigger_exit(self) -> bool:
@@ -425,6 +460,38 @@ class WorkerActor(xo.StatelessActor):
     def get_model_count(self) -> int:
         return len(self._model_uid_to_model)
 
+    async def get_placement_status(self) -> Dict[str, Any]:
+        """
+        The resources of this worker to place a new model, memory in MB.
+        The free memory of GPUs or RAM is None if unknown.
+        """
+        node_info: Dict[str, Any] = {}
+        try:
+            async with timeout(2):
+                node_info = await asyncio.to_thread(gather_node_info)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Gather node info for placement got error.")
+        free_devices = self._get_free_devices()
+        gpu_mem_free = {}
+        for dev in free_devices:
+            gpu_status = node_info.get(f"gpu-{dev}")
+            if gpu_status is not None:
+                gpu_mem_free[dev] = gpu_status.mem_free / 1024**2
+        cpu_status = node_info.get("cpu")
+        return {
+            "model_count": len(self._model_uid_to_model),
+            "num_gpus": len(self._total_gpu_devices),
+            "free_gpus": free_devices,
+            "gpu_mem_free": gpu_mem_free,
+            "mem_available": (
+                cpu_status.memory_available / 1024**2
+                if cpu_status is not None
+                else None
+            ),
+        }
+
     async def is_model_vllm_backend(self, model_uid: str) -> bool:
         _model_uid, _ = parse_replica_model_uid(model_uid)
         supervisor_ref = await self.get_supervisor_ref()
@@ -482,7 +549,10 @@ class WorkerActor(xo.StatelessActor):
         self._gpu_to_embedding_model_uids[device].add(model_uid)
         return device
 
-    def allocate_devices(self, model_uid: str, n_gpu: int) -> List[int]:
+    def _get_free_devices(self) -> List[int]:
+        """
+        GPUs not taken exclusively by a model, embedding and rerank models share GPUs.
+        """
         user_specified_allocated_devices: Set[int] = set()
         for dev, model_infos in self._user_specified_gpu_to_model_uids.items():
             allocated_non_embedding_rerank_models = False
@@ -495,18 +565,19 @@ class WorkerActor(xo.StatelessActor):
                     break
             if allocated_non_embedding_rerank_models:
                 user_specified_allocated_devices.add(dev)
-        allocated_devices = set(self._gpu_to_model_uid.keys()).union(
-            user_specified_allocated_devices
-        )
-        if n_gpu > len(self._total_gpu_devices) - len(allocated_devices):
-            raise RuntimeError("No available slot found for the model")
-
-        devices: List[int] = [
+        return [
             dev
             for dev in self._total_gpu_devices
             if dev not in self._gpu_to_model_uid
             and dev not in user_specified_allocated_devices
-        ][:n_gpu]
+        ]
+
+    def allocate_devices(self, model_uid: str, n_gpu: int) -> List[int]:
+        free_devices = self._get_free_devices()
+        if n_gpu > len(free_devices):
+            raise RuntimeError("No available slot found for the model")
+
+        devices: List[int] = free_devices[:n_gpu]
         for dev in devices:
             self._gpu_to_model_uid[int(dev)] = model_uid
 
@@ -583,6 +654,8 @@ class WorkerActor(xo.StatelessActor):
         env: Optional[Dict[str, str]] = None,
         start_python: Optional[str] = None,
     ) -> Tuple[str, List[str]]:
+        # sub pools are pre-warmed with the devices only, not the custom envs
+        use_prewarmed = self._prewarmed_pools is not None and not env
         env = {} if env is None else env
         devices = []
         env_name = get_available_device_env_name() or "CUDA_VISIBLE_DEVICES"
@@ -607,9 +680,14 @@ class WorkerActor(xo.StatelessActor):
             )
             env[env_name] = ",".join([str(dev) for dev in devices])
 
-        subpool_address = await self._main_pool.append_sub_pool(
-            env=env, start_python=start_python
-        )
+        subpool_address = None
+        if use_prewarmed:
+            assert self._prewarmed_pools is not None
+            subpool_address = await self._prewarmed_pools.acquire(start_python, env)
+        if subpool_address is None:
+            subpool_address = await self._main_pool.append_sub_pool(
+                env=env, start_python=start_python
+            )
         return subpool_address, [str(dev) for dev in devices]
 
     def _check_model_is_valid(self, model_name: str, model_format: Optional[str]):
@@ -997,6 +1075,9 @@ class WorkerActor(xo.StatelessActor):
                 if virtual_env_manager is None
                 else virtual_env_manager.get_python_path()
             )
+            # seconds of the stages of the launch
+            launch_metrics: Dict[str, float] = {}
+            start = time.time()
             subpool_address, devices = await self._create_subpool(
                 model_uid,
                 model_type,
@@ -1005,6 +1086,7 @@ class WorkerActor(xo.StatelessActor):
                 start_python=subpool_python_path,
                 env=envs,
             )
+            launch_metrics["spawn"] = time.time() - start
             all_subpool_addresses = [subpool_address]
             try:
                 xavier_config: Optional[Dict] = kwargs.pop("xavier_config", None)
@@ -1122,12 +1204,27 @@ class WorkerActor(xo.StatelessActor):
                 # when cancelled, all subpool addresses need to be destroyed
                 launch_info.sub_pools = all_subpool_addresses
 
+                if self._prewarmed_pools is not None:
+                    # nothing left to import if the sub pool is pre-warmed
+                    warmer = await PrewarmedSubPools.get_warmer(subpool_address)
+                    launch_metrics["import"] = await warmer.import_modules(
+                        self._prewarmed_pools.modules
+                    )
+
                 with progressor:
+                    start = time.time()
                     try:
                         await model_ref.load()
                     except xo.ServerClosed:
                         check_cancel()
                         raise
+                    launch_metrics["load"] = time.time() - start
+                progressor.set_metrics(**launch_metrics)
+                logger.info(
+                    "Launch stages of model %s in seconds: %s",
+                    model_uid,
+                    launch_metrics,
+                )
             except:
                 logger.error(f"Failed to load model {model_uid}", exc_info=True)
                 self.release_devices(model_uid=model_uid)
@@ -0,0 +1,184 @@
+# Copyright 2022-2025 XProbe Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import abc
+import asyncio
+import json
+import logging
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# seconds the first request of a batch waits for others to join
+DEFAULT_BATCH_WAIT_TIME = 0.005
+# weight of the latest batch in the moving averages of the batch stats
+STATS_SMOOTHING_FACTOR = 0.2
+
+
+@dataclass
+class BatchRequest:
+    inputs: Any
+    # the number of items, e.g. sentences or documents, of the request
+    size: int
+    kwargs: Dict[str, Any]
+    future: asyncio.Future
+    arrival_time: float = field(default_factory=time.time)
+
+
+def get_batch_key(kwargs: Dict[str, Any]) -> Optional[str]:
+    # requests can be merged only if they are handled with the same arguments
+    try:
+        return json.dumps(kwargs, sort_keys=True)
+    except (TypeError, ValueError):
+        return None
+
+
+def split_tokens(total: int, weights: List[int]) -> List[int]:
+    """
+    Split `total` tokens by `weights`, the parts sum up to `total`.
+    """
+    weight_sum = sum(weights)
+    if weight_sum == 0:
+        weights, weight_sum = [1] * len(weights), len(weights)
+    shares = [total * w / weight_sum for w in weights]
+    parts = [int(s) for s in shares]
+    # the largest remainders get the tokens left
+    by_remainder = sorted(range(len(shares)), key=lambda i: parts[i] - shares[i])
+    for i in by_remainder[: total - sum(parts)]:
+        parts[i] += 1
+    return parts
+
+
+class RequestBatcher(abc.ABC):
+    """
+    Merge concurrent requests of a model into batches.
+
+    The first request of a batch waits at most `max_wait_time` seconds for others,
+    and a batch holds at most `max_batch_size` items of the requests.
+    The requests of a batch are grouped by their arguments, and each group is handled by `_run_group`,
+    which sets the futures of the requests.
+    The model is called by `_run_model`, holding `lock` if set,
+    so that the calls of the batcher never run along with the other calls of the model.
+    """
+
+    def __init__(
+        self,
+        max_batch_size: int,
+        max_wait_time: float = DEFAULT_BATCH_WAIT_TIME,
+    ):
+        self.max_batch_size = max_batch_size
+        self.max_wait_time = max_wait_time
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # shared with the calls of the model outside the batcher
+        self.lock: Optional[asyncio.Lock] = None
+        self.num_batches = 0
+        # moving averages of the items in a batch, and the ms a request waits in the queue
+        self.batch_size = 0.0
+        self.queue_wait_time = 0.0
+
+    def _update_stat(self, name: str, value: float):
+        current = getattr(self, name)
+        if current == 0:
+            setattr(self, name, value)
+        else:
+            setattr(self, name, current + STATS_SMOOTHING_FACTOR * (value - current))
+
+    async def _run_model(self, fn: Callable, *args, **kwargs):
+        if self.lock is None:
+            return await asyncio.to_thread(fn, *args, **kwargs)
+        async with self.lock:
+            return await asyncio.to_thread(fn, *args, **kwargs)
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _submit(self, request: BatchRequest):
+        self._ensure_started()
+        assert self._queue is not None
+        self._queue.put_nowait(request)
+        return await request.future
+
+    async def _collect(self) -> List[BatchRequest]:
+        assert self._queue is not None
+        req = await self._queue.get()
+        reqs = [req]
+        num_items = req.size
+        deadline = req.arrival_time + self.max_wait_time
+        while num_items < self.max_batch_size:
+            if self._queue.empty():
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                try:
+                    req = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            else:
+                req = self._queue.get_nowait()
+            reqs.append(req)
+            num_items += req.size
+        return reqs
+
+    async def _run(self):
+        while True:
+            reqs = await self._collect()
+            now = time.time()
+            self._update_stat(
+                "queue_wait_time",
+                sum(now - r.arrival_time for r in reqs) * 1000 / len(reqs),
+            )
+            groups: Dict[str, List[BatchRequest]] = defaultdict(list)
+            for r in reqs:
+                groups[get_batch_key(r.kwargs)].append(r)  # type: ignore
+            for group in groups.values():
+                try:
+                    await self._run_group(group)
+                except asyncio.CancelledError:
+                    for r in group:
+                        if not r.future.done():
+                            r.future.cancel()
+                    raise
+                except Exception as e:
+                    logger.exception("Batched requests failed")
+                    for r in group:
+                        if not r.future.done():
+                            r.future.set_exception(e)
+
+    @abc.abstractmethod
+    async def _run_group(self, reqs: List[Any]):
+        """
+        Handle the requests with the same arguments, and set their futures.
+        """
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "num_batches": self.num_batches,
+            "batch_size": self.batch_size,
+            "queue_wait_time": self.queue_wait_time,
+        }
@@ -0,0 +1,136 @@
+# Copyright 2022-2025 XProbe Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+from typing import TYPE_CHECKING, Any, List, Set, Union
+
+from ...types import Embedding, EmbeddingData, EmbeddingUsage
+from ..batch import (
+    DEFAULT_BATCH_WAIT_TIME,
+    BatchRequest,
+    RequestBatcher,
+    get_batch_key,
+    split_tokens,
+)
+
+if TYPE_CHECKING:
+    from .core import EmbeddingModel
+
+# seconds the first request of a batch waits for others to join
+DEFAULT_EMBEDDING_BATCH_WAIT_TIME = DEFAULT_BATCH_WAIT_TIME
+
+
+class EmbeddingBatcher(RequestBatcher):
+    """
+    Merge the sentences of concurrent `create_embedding` requests into batches,
+    so that one forward encodes the sentences of many small requests.
+
+    A batch holds at most `max_batch_size` sentences.
+    The sentences of the requests with the same arguments are sorted by length and cut into batches,
+    so that sentences of similar length are padded together.
+    The embeddings are split back to the requests, and the tokens of a batch
+    are shared among its sentences by their text length.
+    Requests whose inputs are not texts are encoded alone.
+    """
+
+    def __init__(
+        self,
+        model: "EmbeddingModel",
+        max_batch_size: int,
+        max_wait_time: float = DEFAULT_EMBEDDING_BATCH_WAIT_TIME,
+    ):
+        super().__init__(max_batch_size, max_wait_time)
+        self._model = model
+
+    async def create_embedding(
+        self, sentences: Union[str, List[str]], **kwargs
+    ) -> Embedding:
+        texts = [sentences] if isinstance(sentences, str) else sentences
+        if (
+            not isinstance(texts, list)
+            or not texts
+            or not all(isinstance(s, str) for s in texts)
+            or get_batch_key(kwargs) is None
+        ):
+            return await self._run_model(
+                self._model.create_embedding, sentences, **kwargs
+            )
+        future = asyncio.get_running_loop().create_future()
+        return await self._submit(BatchRequest(texts, len(texts), kwargs, future))
+
+    async def _run_group(self, reqs: List[BatchRequest]):
+        kwargs = reqs[0].kwargs
+        # (request index, sentence index) of all the sentences, the longest first
+        items = [(i, j) for i, r in enumerate(reqs) for j in range(len(r.inputs))]
+        items.sort(key=lambda item: -len(reqs[item[0]].inputs[item[1]]))
+        embeddings: List[List[Any]] = [[None] * len(r.inputs) for r in reqs]
+        tokens = [0] * len(reqs)
+        # requests in a failed batch are encoded alone,
+        # so that a bad input fails only its own request
+        unbatched: Set[int] = set()
+        model = None
+        for start in range(0, len(items), self.max_batch_size):
+            batch = [
+                item
+                for item in items[start : start + self.max_batch_size]
+                if item[0] not in unbatched
+            ]
+            if not batch:
+                continue
+            texts = [reqs[i].inputs[j] for i, j in batch]
+            try:
+                result = await self._run_model(
+                    self._model.create_embedding, texts, **kwargs
+                )
+            except Exception:
+                unbatched.update(i for i, _ in batch)
+                continue
+            self.num_batches += 1
+            self._update_stat("batch_size", len(batch))
+            model = result["model"]
+            for (i, j), data in zip(batch, result["data"]):
+                embeddings[i][j] = data["embedding"]
+            batch_tokens = split_tokens(
+                result["usage"]["total_tokens"], [len(t) for t in texts]
+            )
+            for (i, _), n in zip(batch, batch_tokens):
+                tokens[i] += n
+
+        for i, r in enumerate(reqs):
+            if r.future.done():
+                continue
+            if i in unbatched:
+                try:
+                    r.future.set_result(
+                        await self._run_model(
+                            self._model.create_embedding, r.inputs, **kwargs
+                        )
+                    )
+                except Exception as e:
+                    r.future.set_exception(e)
+                continue
+            r.future.set_result(
+                Embedding(
+                    object="list",
+                    model=model,  # type: ignore
+                    model_replica=self._model._model_uid,
+                    data=[
+                        EmbeddingData(index=j, object="embedding", embedding=e)
+                        for j, e in enumerate(embeddings[i])
+                    ],
+                    usage=EmbeddingUsage(
+                        prompt_tokens=tokens[i], total_tokens=tokens[i]
+                    ),
+                )
+            )
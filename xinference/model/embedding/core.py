@@ -13,19 +13,27 @@
 # limitations under the License.
 
 import abc
+import asyncio
 import gc
 import logging
 import os
 from abc import abstractmethod
 from collections import defaultdict
-from typing import Annotated, Dict, List, Literal, Optional, Union
+from typing import TYPE_CHECKING, Annotated, Dict, List, Literal, Optional, Union
 
 from ..._compat import ROOT_KEY, BaseModel, ErrorWrapper, Field, ValidationError
 from ...device_utils import empty_cache
+from ...types import Embedding, EmbeddingData, EmbeddingUsage
 from ..core import VirtualEnvSettings
+from ..offload import SleepModelMixin
+from ..shared_weights import SharedWeightsMixin
 from ..utils import ModelInstanceInfoMixin
 from .embed_family import match_embedding
 
+if TYPE_CHECKING:
+    from .batch import EmbeddingBatcher
+    from .result_cache import EmbeddingResultCache
+
 logger = logging.getLogger(__name__)
 
 # Used for check whether the model is cached.
@@ -39,6 +47,9 @@ EMBEDDING_EMPTY_CACHE_TOKENS = int(
 )
 assert EMBEDDING_EMPTY_CACHE_COUNT > 0
 assert EMBEDDING_EMPTY_CACHE_TOKENS > 0
+# default sizes of the result cache in MB
+DEFAULT_RESULT_CACHE_SIZE = 256
+DEFAULT_RESULT_CACHE_DISK_SIZE = 1024
 
 
 def get_embedding_model_descriptions():
@@ -79,6 +90,8 @@ class EmbeddingModelFamilyV2(BaseModel, ModelInstanceInfoMixin):
     version: Literal[2]
     model_name: str
     dimensions: int
+    # the minimum `dimensions` of the embeddings truncated for Matryoshka models
+    min_dimensions: Optional[int]
     max_tokens: int
     language: List[str]
     model_specs: List["EmbeddingSpecV1"]
@@ -96,6 +109,7 @@ class EmbeddingModelFamilyV2(BaseModel, ModelInstanceInfoMixin):
             "accelerators": getattr(self, "accelerators", None),
             "model_name": self.model_name,
             "dimensions": self.dimensions,
+            "min_dimensions": self.min_dimensions,
             "max_tokens": self.max_tokens,
             "language": self.language,
             "model_hub": spec.model_hub,
@@ -134,7 +148,7 @@ def generate_embedding_description(
     return res
 
 
-class EmbeddingModel(abc.ABC):
+class EmbeddingModel(abc.ABC, SleepModelMixin, SharedWeightsMixin):
     def __init__(
         self,
         model_uid: str,
@@ -154,6 +168,10 @@ class EmbeddingModel(abc.ABC):
         self._model_spec = model_family.model_specs[0]
         self._quantization = quantization
         self._model_name = self.model_family.model_name
+        self._batcher = self._create_batcher(kwargs)
+        self._result_cache = self._create_result_cache(kwargs)
+        # the replicas on the same node share the weights on CPU
+        self._share_weights = bool(kwargs.pop("share_weights", False))
         self._kwargs = kwargs
 
     @classmethod
@@ -191,6 +209,127 @@ class EmbeddingModel(abc.ABC):
         Load embedding model
         """
 
+    def _create_batcher(self, kwargs: Dict) -> Optional["EmbeddingBatcher"]:
+        # `max_batch_size` > 1 at launch enables merging concurrent requests
+        max_batch_size = kwargs.pop("max_batch_size", None)
+        max_wait_time = kwargs.pop("max_batch_wait_time", None)
+        if max_batch_size is None or int(max_batch_size) <= 1:
+            return None
+        from .batch import DEFAULT_EMBEDDING_BATCH_WAIT_TIME, EmbeddingBatcher
+
+        return EmbeddingBatcher(
+            self,
+            int(max_batch_size),
+            (
+                float(max_wait_time)
+                if max_wait_time is not None
+                else DEFAULT_EMBEDDING_BATCH_WAIT_TIME
+            ),
+        )
+
+    def _pop_dimensions(self, kwargs: Dict) -> Optional[int]:
+        """
+        Pop and check the `dimensions` of the embeddings requested,
+        None if the embeddings are not truncated.
+        """
+        dimensions = kwargs.pop("dimensions", None)
+        if dimensions is None:
+            return None
+        dimensions = int(dimensions)
+        max_dimensions = self.model_family.dimensions
+        if dimensions == max_dimensions:
+            return None
+        min_dimensions = self.model_family.min_dimensions
+        if min_dimensions is None:
+            raise ValueError(
+                f"Model {self._model_name} does not support `dimensions`, "
+                f"its embeddings have {max_dimensions} dimensions"
+            )
+        if not min_dimensions <= dimensions <= max_dimensions:
+            raise ValueError(
+                f"`dimensions` of model {self._model_name} must be "
+                f"between {min_dimensions} and {max_dimensions}, got {dimensions}"
+            )
+        return dimensions
+
+    def get_batcher(self) -> Optional["EmbeddingBatcher"]:
+        return self._batcher
+
+    def _create_result_cache(self, kwargs: Dict) -> Optional["EmbeddingResultCache"]:
+        # sizes in MB, the cache is enabled by either of them
+        cache_size = kwargs.pop("result_cache_size", None)
+        cache_dir = kwargs.pop("result_cache_dir", None)
+        disk_size = kwargs.pop("result_cache_disk_size", None)
+        if not cache_size and not cache_dir:
+            return None
+        from .result_cache import EmbeddingResultCache
+
+        return EmbeddingResultCache(
+            int(float(cache_size or DEFAULT_RESULT_CACHE_SIZE) * 1024**2),
+            # the files of a replica are not shared with other processes
+            os.path.join(cache_dir, self._model_uid) if cache_dir else None,
+            int(float(disk_size or DEFAULT_RESULT_CACHE_DISK_SIZE) * 1024**2),
+        )
+
+    def get_result_cache(self) -> Optional["EmbeddingResultCache"]:
+        return self._result_cache
+
+    async def _async_encode(self, sentences: Union[str, List[str]], **kwargs):
+        if self._batcher is not None:
+            return await self._batcher.create_embedding(sentences, **kwargs)
+        return await asyncio.to_thread(self.create_embedding, sentences, **kwargs)
+
+    async def async_create_embedding(
+        self,
+        sentences: Union[str, List[str]],
+        **kwargs,
+    ):
+        """
+        Creating embeddings of the sentences not in the result cache,
+        by the batcher with the sentences of other concurrent requests if enabled.
+        The usage counts only the tokens encoded by the model.
+        """
+        cache = self._result_cache
+        texts = [sentences] if isinstance(sentences, str) else sentences
+        if (
+            cache is None
+            or not isinstance(texts, list)
+            or not all(isinstance(t, str) for t in texts)
+            or kwargs.get("return_sparse")
+        ):
+            return await self._async_encode(sentences, **kwargs)
+
+        from .encoding import decode_embedding, encode_embeddings, pop_encoding_format
+        from .result_cache import get_cache_key
+
+        encoding_format, dtype = pop_encoding_format(kwargs)
+        model_uid = kwargs.get("model_uid")
+        keys = [get_cache_key(model_uid or self._model_uid, kwargs, t) for t in texts]
+        embeddings = [cache.get(key) for key in keys]
+        misses = [i for i, e in enumerate(embeddings) if e is None]
+        num_tokens = 0
+        if misses:
+            # the raw float32 buffers are cached, and encoded for the request
+            result = await self._async_encode(
+                [texts[i] for i in misses], encoding_format="binary", **kwargs
+            )
+            for i, data in zip(misses, result["data"]):
+                embeddings[i] = decode_embedding(data["embedding"], "float32")
+                cache.put(keys[i], embeddings[i])
+            num_tokens = result["usage"]["total_tokens"]
+        return Embedding(
+            object="list",
+            model=model_uid,  # type: ignore
+            model_replica=self._model_uid,
+            data=[
+                EmbeddingData(index=i, object="embedding", embedding=e)
+                for i, e in enumerate(
+                    encode_embeddings(embeddings, encoding_format, dtype)
+                )
+            ],
+            usage=EmbeddingUsage(prompt_tokens=num_tokens, total_tokens=num_tokens),
+        )
+
     def _fix_langchain_openai_inputs(
         self, sentences: Union[str, List[str], Dict[str, str], List[Dict[str, str]]]
     ):
@@ -0,0 +1,136 @@
+# Copyright 2022-2025 XProbe Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import base64
+import json
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+# `float` returns lists of floats, `base64` returns the base64 of the little-endian buffer
+# of each embedding, compatible with OpenAI, `binary` returns the raw buffers
+EMBEDDING_ENCODING_FORMATS = ["float", "base64", "binary"]
+EMBEDDING_DTYPES = {"float32": "<f4", "float16": "<f2"}
+
+
+def pop_encoding_format(kwargs: Dict[str, Any]) -> Tuple[str, str]:
+    """
+    Pop and check `encoding_format` and `embedding_dtype` of a request.
+    """
+    encoding_format = kwargs.pop("encoding_format", None) or "float"
+    dtype = kwargs.pop("embedding_dtype", None) or "float32"
+    if encoding_format not in EMBEDDING_ENCODING_FORMATS:
+        raise ValueError(
+            f"Unsupported encoding format: {encoding_format}, "
+            f"must be one of {', '.join(EMBEDDING_ENCODING_FORMATS)}"
+        )
+    if dtype not in EMBEDDING_DTYPES:
+        raise ValueError(
+            f"Unsupported embedding dtype: {dtype}, "
+            f"must be one of {', '.join(EMBEDDING_DTYPES)}"
+        )
+    return encoding_format, dtype
+
+
+def _to_numpy(embeddings: Sequence) -> np.ndarray:
+    first = embeddings[0]
+    if isinstance(first, np.ndarray):
+        return np.stack(embeddings)
+    if hasattr(first, "cpu"):
+        import torch
+
+        # bfloat16 has no numpy dtype
+        return torch.stack(list(embeddings)).float().cpu().numpy()
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+def truncate_embeddings(
+    embeddings: Any, dimensions: Optional[int], normalize: bool = True
+):
+    """
+    Truncate the embeddings of Matryoshka models to the first `dimensions`, and re-normalize them.
+    The embeddings are a 2-D tensor, which is kept on its device, a numpy array or lists of floats.
+    """
+    if dimensions is None:
+        return embeddings
+    if hasattr(embeddings, "cpu"):
+        import torch
+
+        embeddings = embeddings[..., :dimensions]
+        if normalize:
+            embeddings = torch.nn.functional.normalize(embeddings, p=2, dim=-1)
+        return embeddings
+    matrix = np.asarray(embeddings, dtype=np.float32)[..., :dimensions]
+    if normalize:
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        matrix = matrix / np.maximum(norms, 1e-12)
+    return matrix
+
+
+def encode_embeddings(
+    embeddings: Sequence,
+    encoding_format: str = "float",
+    dtype: str = "float32",
+) -> List[Union[List[float], str, bytes]]:
+    """
+    Encode the dense embeddings, which are tensors, numpy arrays or lists of floats.
+    The buffers are serialized directly without building python floats
+    unless the format is `float`.
+    """
+    if len(embeddings) == 0:
+        return []
+    if isinstance(embeddings[0], dict):
+        if encoding_format != "float":
+            raise ValueError(
+                f"Encoding format {encoding_format} is not supported "
+                f"for sparse embeddings"
+            )
+        return list(embeddings)
+    if encoding_format == "float":
+        return [e if isinstance(e, list) else e.tolist() for e in embeddings]
+    matrix = np.ascontiguousarray(_to_numpy(embeddings), dtype=EMBEDDING_DTYPES[dtype])
+    if encoding_format == "base64":
+        return [base64.b64encode(row.tobytes()).decode("ascii") for row in matrix]
+    return [row.tobytes() for row in matrix]
+
+
+def decode_embedding(embedding: Union[List[float], str, bytes], dtype: str):
+    """
+    Decode an embedding encoded by `encode_embeddings` into a numpy array.
+    """
+    if isinstance(embedding, str):
+        embedding = base64.b64decode(embedding)
+    if isinstance(embedding, bytes):
+        return np.frombuffer(embedding, dtype=EMBEDDING_DTYPES[dtype])
+    return np.asarray(embedding, dtype=np.float32)
+
+
+def pack_binary_embedding(
+    embedding: Dict[str, Any], dtype: str
+) -> Tuple[bytes, Dict[str, str]]:
+    """
+    Pack an embedding response of the binary encoding for HTTP,
+    the embeddings as a row-major matrix in the body, the rest in the headers.
+    """
+    rows = [d["embedding"] for d in embedding["data"]]
+    itemsize = np.dtype(EMBEDDING_DTYPES[dtype]).itemsize
+    dimensions = len(rows[0]) // itemsize if rows else 0
+    headers = {
+        "X-Embedding-Shape": f"{len(rows)},{dimensions}",
+        "X-Embedding-Dtype": dtype,
+        "X-Embedding-Model": embedding.get("model") or "",
+        "X-Embedding-Model-Replica": embedding.get("model_replica") or "",
+        "X-Embedding-Usage": json.dumps(embedding["usage"]),
+    }
+    return b"".join(rows), headers
@@ -31,6 +31,7 @@ except ImportError:
 from ....device_utils import get_available_device
 from ....types import Embedding, EmbeddingData, EmbeddingUsage
 from ..core import EmbeddingModel, EmbeddingModelFamilyV2, EmbeddingSpecV1
+from ..encoding import encode_embeddings, pop_encoding_format, truncate_embeddings
 
 FLAG_EMBEDDER_MODEL_LIST = support_native_bge_model_list() if flag_installed else []
 logger = logging.getLogger(__name__)
@@ -110,6 +111,8 @@ class FlagEmbeddingModel(EmbeddingModel):
         # flag embed dose not have this param
         # kwargs.setdefault("normalize_embeddings", True)
         model_uid = kwargs.pop("model_uid", None)
+        encoding_format, dtype = pop_encoding_format(kwargs)
+        dimensions = self._pop_dimensions(kwargs)
 
         @no_type_check
         def encode(
@@ -215,7 +218,9 @@ class FlagEmbeddingModel(EmbeddingModel):
                         if kwargs.get("return_sparse"):
                             embeddings = out_features["lexical_weights"]
                         else:
-                            embeddings = out_features["dense_vecs"]
+                            embeddings = truncate_embeddings(
+                                out_features["dense_vecs"], dimensions
+                            )
 
                         if convert_to_numpy:
                             embeddings = embeddings.cpu()
@@ -248,22 +253,22 @@ class FlagEmbeddingModel(EmbeddingModel):
 
         if isinstance(sentences, str):
             all_embeddings = [all_embeddings]
-        embedding_list = []
-        for index, data in enumerate(all_embeddings):
-            if kwargs.get("return_sparse"):
-                embedding_list.append(
-                    EmbeddingData(
-                        index=index,
-                        object="sparse_embedding",
-                        embedding={k: float(v) for k, v in data.items()},
-                    )
+        if kwargs.get("return_sparse"):
+            embedding_list = [
+                EmbeddingData(
+                    index=index,
+                    object="sparse_embedding",
+                    embedding={k: float(v) for k, v in data.items()},
                 )
-            else:
-                embedding_list.append(
-                    EmbeddingData(
-                        index=index, object="embedding", embedding=data.tolist()
-                    )
+                for index, data in enumerate(all_embeddings)
+            ]
+        else:
+            embedding_list = [
+                EmbeddingData(index=index, object="embedding", embedding=data)
+                for index, data in enumerate(
+                    encode_embeddings(all_embeddings, encoding_format, dtype)
                 )
+            ]
         usage = EmbeddingUsage(prompt_tokens=-1, total_tokens=-1)
         result = Embedding(
             object=("list" if kwargs.get("return_sparse") else "dict"),  # type: ignore
@@ -26,6 +26,7 @@ import orjson
 
 from ....types import Embedding
 from ..core import EmbeddingModel, EmbeddingModelFamilyV2, EmbeddingSpecV1
+from ..encoding import encode_embeddings, pop_encoding_format, truncate_embeddings
 
 logger = logging.getLogger(__name__)
 
@@ -184,6 +185,8 @@ class XllamaCppEmbeddingModel(EmbeddingModel):
         q: queue.Queue = queue.Queue()
         if isinstance(sentences, str):
             sentences = [sentences]
+        encoding_format, dtype = pop_encoding_format(kwargs)
+        dimensions = self._pop_dimensions(kwargs)
 
         def _handle_embedding():
             data = {"input": sentences}
@@ -219,6 +222,14 @@ class XllamaCppEmbeddingModel(EmbeddingModel):
         if type(r) is _Error:
             raise Exception(f"Failed to create embedding: {r.msg}")
         r["model_replica"] = self._model_uid
+        if encoding_format != "float" or dimensions is not None:
+            encoded = encode_embeddings(
+                truncate_embeddings([d["embedding"] for d in r["data"]], dimensions),
+                encoding_format,
+                dtype,
+            )
+            for d, e in zip(r["data"], encoded):
+                d["embedding"] = e
         return Embedding(**r)  # type: ignore
 
     @classmethod
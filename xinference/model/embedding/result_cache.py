@@ -0,0 +1,207 @@
+# Copyright 2022-2025 XProbe Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DIGEST_SIZE = 32
+# the header of a disk file holds the next slot to write
+HEADER_SIZE = 8
+
+
+def get_cache_key(model_uid: str, kwargs: Dict[str, Any], text: str) -> bytes:
+    """
+    The key of the embedding of `text`, encoded by the model with the arguments,
+    e.g. the normalization flags and the prompt name.
+    """
+    args = json.dumps(
+        [model_uid, {k: v for k, v in kwargs.items() if k != "model_uid"}],
+        sort_keys=True,
+        default=str,
+    )
+    h = hashlib.sha256(args.encode("utf-8"))
+    h.update(b"\0")
+    h.update(text.encode("utf-8"))
+    return h.digest()
+
+
+class DiskEmbeddingStore:
+    """
+    A ring buffer of embeddings with the same dimensions in a memory-mapped file.
+    Each slot holds the key and the float32 embedding, the oldest slot is overwritten when full.
+    The keys are indexed in memory when opened, so the store survives restarts.
+    """
+
+    def __init__(self, path: str, dimensions: int, max_bytes: int):
+        self._slot_size = DIGEST_SIZE + dimensions * 4
+        self.dimensions = dimensions
+        self.capacity = max(1, (max_bytes - HEADER_SIZE) // self._slot_size)
+        size = HEADER_SIZE + self.capacity * self._slot_size
+        if not os.path.exists(path) or os.path.getsize(path) != size:
+            with open(path, "wb") as f:
+                f.truncate(size)
+        self._mmap = np.memmap(path, dtype=np.uint8, mode="r+", shape=(size,))
+        self._next = int(self._mmap[:HEADER_SIZE].view(np.int64)[0]) % self.capacity
+        keys = self._mmap[HEADER_SIZE:].reshape(self.capacity, self._slot_size)[
+            :, :DIGEST_SIZE
+        ]
+        self._index: Dict[bytes, int] = {
+            keys[slot].tobytes(): int(slot) for slot in np.flatnonzero(keys.any(axis=1))
+        }
+
+    def _offset(self, slot: int) -> int:
+        return HEADER_SIZE + slot * self._slot_size
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def get(self, key: bytes) -> Optional[np.ndarray]:
+        slot = self._index.get(key)
+        if slot is None:
+            return None
+        offset = self._offset(slot)
+        if bytes(self._mmap[offset : offset + DIGEST_SIZE]) != key:
+            # the slot is overwritten out of the index, e.g. by another process
+            del self._index[key]
+            return None
+        start = offset + DIGEST_SIZE
+        return self._mmap[start : start + self.dimensions * 4].view(np.float32).copy()
+
+    def put(self, key: bytes, embedding: np.ndarray):
+        if key in self._index:
+            return
+        slot = self._next
+        offset = self._offset(slot)
+        old_key = bytes(self._mmap[offset : offset + DIGEST_SIZE])
+        if self._index.get(old_key) == slot:
+            del self._index[old_key]
+        self._mmap[offset : offset + DIGEST_SIZE] = np.frombuffer(key, dtype=np.uint8)
+        self._mmap[offset + DIGEST_SIZE : offset + self._slot_size] = np.frombuffer(
+            embedding.astype(np.float32).tobytes(), dtype=np.uint8
+        )
+        self._index[key] = slot
+        self._next = (slot + 1) % self.capacity
+        self._mmap[:HEADER_SIZE] = np.frombuffer(
+            np.int64(self._next).tobytes(), dtype=np.uint8
+        )
+
+    def flush(self):
+        self._mmap.flush()
+
+
+class EmbeddingResultCache:
+    """
+    Content-addressed cache of the embeddings of texts, so only the texts not cached reach the model.
+    The memory tier is LRU with a budget of `max_bytes`.
+    The optional disk tier is written through, and serves the embeddings evicted from memory
+    and the ones cached before restarts.
+    It is kept in memory-mapped files under `disk_dir`, with a budget of `disk_max_bytes` for each dimensions,
+    and the files are written by this cache only, e.g. each replica has its own `disk_dir`.
+    Embeddings are kept in float32, sparse embeddings are not cached.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        disk_dir: Optional[str] = None,
+        disk_max_bytes: int = 0,
+    ):
+        self.max_bytes = max_bytes
+        self._disk_dir = disk_dir
+        self._disk_max_bytes = disk_max_bytes
+        self._memory: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_stores: Dict[int, DiskEmbeddingStore] = {}
+        if disk_dir is not None:
+            os.makedirs(disk_dir, exist_ok=True)
+            # open the stores written before restarts
+            for name in os.listdir(disk_dir):
+                if name.startswith("embeddings-") and name.endswith(".mmap"):
+                    self._get_disk_store(int(name[len("embeddings-") : -len(".mmap")]))
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _get_disk_store(self, dimensions: int) -> Optional[DiskEmbeddingStore]:
+        if self._disk_dir is None or self._disk_max_bytes <= 0:
+            return None
+        store = self._disk_stores.get(dimensions)
+        if store is None:
+            path = os.path.join(self._disk_dir, f"embeddings-{dimensions}.mmap")
+            store = self._disk_stores[dimensions] = DiskEmbeddingStore(
+                path, dimensions, self._disk_max_bytes
+            )
+        return store
+
+    def _lookup_disk(self, key: bytes) -> Optional[np.ndarray]:
+        for store in self._disk_stores.values():
+            embedding = store.get(key)
+            if embedding is not None:
+                return embedding
+        return None
+
+    def get(self, key: bytes) -> Optional[np.ndarray]:
+        embedding = self._memory.get(key)
+        if embedding is not None:
+            self._memory.move_to_end(key)
+        else:
+            embedding = self._lookup_disk(key)
+            if embedding is not None:
+                self._put_memory(key, embedding)
+        if embedding is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return embedding
+
+    def put(self, key: bytes, embedding: Any):
+        if isinstance(embedding, dict):
+            return
+        embedding = np.asarray(embedding, dtype=np.float32)
+        self._put_memory(key, embedding)
+        store = self._get_disk_store(embedding.shape[0])
+        if store is not None:
+            store.put(key, embedding)
+
+    def _put_memory(self, key: bytes, embedding: np.ndarray):
+        if key in self._memory or embedding.nbytes > self.max_bytes:
+            return
+        self._memory[key] = embedding
+        self._memory_bytes += embedding.nbytes
+        while self._memory_bytes > self.max_bytes:
+            _, old_embedding = self._memory.popitem(last=False)
+            self._memory_bytes -= old_embedding.nbytes
+            self.evictions += 1
+
+    def flush(self):
+        for store in self._disk_stores.values():
+            store.flush()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "memory_bytes": self._memory_bytes,
+            "num_memory_entries": len(self._memory),
+            "num_disk_entries": sum(len(s) for s in self._disk_stores.values()),
+        }
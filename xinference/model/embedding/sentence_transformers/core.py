@@ -22,6 +22,7 @@ import torch
 from ....types import Embedding, EmbeddingData, EmbeddingUsage
 from ...utils import is_flash_attn_available
 from ..core import EmbeddingModel, EmbeddingModelFamilyV2, EmbeddingSpecV1
+from ..encoding import encode_embeddings, pop_encoding_format, truncate_embeddings
 
 logger = logging.getLogger(__name__)
 SENTENCE_TRANSFORMER_MODEL_LIST: List[str] = []
@@ -126,6 +127,8 @@ class SentenceTransformerEmbeddingModel(EmbeddingModel):
     ):
         sentences = self._fix_langchain_openai_inputs(sentences)
         model_uid = kwargs.pop("model_uid", None)
+        encoding_format, dtype = pop_encoding_format(kwargs)
+        dimensions = self._pop_dimensions(kwargs)
 
         from sentence_transformers import SentenceTransformer
 
@@ -150,6 +153,7 @@ class SentenceTransformerEmbeddingModel(EmbeddingModel):
             convert_to_tensor: bool = False,
             device: str = None,
             normalize_embeddings: bool = False,
+            dimensions: Optional[int] = None,
             **kwargs,
         ):
             """
@@ -163,6 +167,7 @@ class SentenceTransformerEmbeddingModel(EmbeddingModel):
             :param convert_to_tensor: If true, you get one large tensor as return. Overwrites any setting from convert_to_numpy
             :param device: Which torch.device to use for the computation
             :param normalize_embeddings: If set to true, returned vectors will have length 1. In that case, the faster dot-product (util.dot_score) instead of cosine similarity can be used.
+            :param dimensions: Truncate the sentence embeddings to the first dimensions on the device.
 
             :return:
                By default, a list of tensors is returned. If convert_to_tensor, a stacked tensor is returned. If convert_to_numpy, a numpy matrix is returned.
@@ -293,6 +298,10 @@ class SentenceTransformerEmbeddingModel(EmbeddingModel):
                     else:  # Sentence embeddings
                         embeddings = out_features[output_value]
                         embeddings = embeddings.detach()
+                        # normalized below after truncated
+                        embeddings = truncate_embeddings(
+                            embeddings, dimensions, normalize=False
+                        )
                         if normalize_embeddings:
                             embeddings = torch.nn.functional.normalize(
                                 embeddings, p=2, dim=1
@@ -331,6 +340,7 @@ class SentenceTransformerEmbeddingModel(EmbeddingModel):
                 sentences,
                 prompt_name="query",
                 convert_to_numpy=False,
+                dimensions=dimensions,
                 **kwargs,
             )
         elif (
@@ -376,6 +386,7 @@ class SentenceTransformerEmbeddingModel(EmbeddingModel):
                 self._model,
                 objs,
                 convert_to_numpy=False,
+                dimensions=dimensions,
                 **kwargs,
             )
         else:
@@ -383,15 +394,17 @@ class SentenceTransformerEmbeddingModel(EmbeddingModel):
                 self._model,
                 sentences,
                 convert_to_numpy=False,
+                dimensions=dimensions,
                 **kwargs,
             )
         if isinstance(sentences, str):
             all_embeddings = [all_embeddings]
-        embedding_list = []
-        for index, data in enumerate(all_embeddings):
-            embedding_list.append(
-                EmbeddingData(index=index, object="embedding", embedding=data.tolist())
+        embedding_list = [
+            EmbeddingData(index=index, object="embedding", embedding=data)
+            for index, data in enumerate(
+                encode_embeddings(all_embeddings, encoding_format, dtype)
             )
+        ]
         usage = EmbeddingUsage(
             prompt_tokens=all_token_nums, total_tokens=all_token_nums
         )
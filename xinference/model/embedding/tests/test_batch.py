@@ -0,0 +1,145 @@
+# Copyright 2022-2025 XProbe Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+
+import numpy as np
+
+from ....types import Embedding, EmbeddingData, EmbeddingUsage
+from ...batch import split_tokens
+from ..core import EmbeddingModel
+from ..encoding import encode_embeddings, pop_encoding_format
+from .test_embedding_models import TEST_MODEL_SPEC
+
+
+class MockEmbeddingModel(EmbeddingModel):
+    """
+    Embeds a sentence as [its length, the number of sentences encoded together].
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batches = []
+
+    @classmethod
+    def check_lib(cls) -> bool:
+        return True
+
+    @classmethod
+    def match_json(cls, model_family, model_spec, quantization) -> bool:
+        return True
+
+    def load(self):
+        pass
+
+    def create_embedding(self, sentences, **kwargs):
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        if "error" in sentences:
+            raise ValueError("bad input")
+        self.batches.append(list(sentences))
+        scale = kwargs.get("scale", 1)
+        encoding_format, dtype = pop_encoding_format(kwargs)
+        embeddings = encode_embeddings(
+            [np.array([len(s) * scale, len(sentences)]) for s in sentences],
+            encoding_format,
+            dtype,
+        )
+        return Embedding(
+            object="list",
+            model=kwargs.pop("model_uid", None),
+            model_replica=self._model_uid,
+            data=[
+                EmbeddingData(index=i, object="embedding", embedding=e)
+                for i, e in enumerate(embeddings)
+            ],
+            usage=EmbeddingUsage(
+                prompt_tokens=sum(len(s) for s in sentences),
+                total_tokens=sum(len(s) for s in sentences),
+            ),
+        )
+
+
+def testsplit_tokens():
+    assert split_tokens(10, [1, 1, 1]) == [4, 3, 3]
+    assert split_tokens(7, [6, 2]) == [5, 2]
+    assert split_tokens(3, [0, 0]) == [2, 1]
+
+
+async def test_embedding_batcher():
+    model = MockEmbeddingModel(
+        "mock", "", TEST_MODEL_SPEC, max_batch_size=4, max_batch_wait_time=0.05
+    )
+    batcher = model.get_batcher()
+    assert batcher is not None
+    inputs = ["a", ["bbb", "cc"], ["dddd", "e", "ffffff"], "gg"]
+    results = await asyncio.gather(
+        *[model.async_create_embedding(x, model_uid="mock") for x in inputs]
+    )
+    # the first 3 requests fill a batch, and their sentences are cut into batches,
+    # the longest first
+    assert model.batches == [["ffffff", "dddd", "bbb", "cc"], ["a", "e"], ["gg"]]
+    for x, result in zip(inputs, results):
+        sentences = [x] if isinstance(x, str) else x
+        assert result["model"] == "mock"
+        assert [d["index"] for d in result["data"]] == list(range(len(sentences)))
+        assert [d["embedding"][0] for d in result["data"]] == [
+            len(s) for s in sentences
+        ]
+        assert result["usage"]["total_tokens"] == sum(len(s) for s in sentences)
+    assert batcher.num_batches == 3
+    assert batcher.stats()["queue_wait_time"] > 0
+
+    # requests with different arguments are not merged
+    model.batches.clear()
+    results = await asyncio.gather(
+        model.async_create_embedding(["aa"], scale=2),
+        model.async_create_embedding(["b"]),
+    )
+    assert results[0]["data"][0]["embedding"] == [4, 1]
+    assert sorted(model.batches) == [["aa"], ["b"]]
+
+    # a failed batch fails only its requests
+    results = await asyncio.gather(
+        model.async_create_embedding(["error"]),
+        model.async_create_embedding(["longer than error"]),
+        return_exceptions=True,
+    )
+    assert isinstance(results[0], ValueError)
+    assert results[1]["data"][0]["embedding"] == [17, 1]
+    assert results[1]["usage"]["total_tokens"] == 17
+
+    # the model is not called while other calls of the model hold the lock
+    model.batches.clear()
+    batcher.lock = asyncio.Lock()
+    await batcher.lock.acquire()
+    tasks = [
+        asyncio.create_task(model.async_create_embedding("a")),
+        # inputs that are not texts are encoded alone
+        asyncio.create_task(model.async_create_embedding([[1, 2]])),
+    ]
+    await asyncio.sleep(0.2)
+    assert model.batches == []
+    batcher.lock.release()
+    await asyncio.gather(*tasks)
+    assert len(model.batches) == 2
+    await batcher.stop()
+
+
+def test_batching_disabled():
+    assert MockEmbeddingModel("mock", "", TEST_MODEL_SPEC).get_batcher() is None
+    model = MockEmbeddingModel("mock", "", TEST_MODEL_SPEC, max_batch_size="1")
+    assert model.get_batcher() is None
+    result = asyncio.run(model.async_create_embedding("a"))
+    assert result["data"][0]["embedding"] == [1, 1]
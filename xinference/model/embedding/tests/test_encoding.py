@@ -0,0 +1,128 @@
+# Copyright 2022-2025 XProbe Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import base64
+
+import numpy as np
+import pytest
+
+from ....client.common import decode_binary_embedding
+from ..encoding import (
+    decode_embedding,
+    encode_embeddings,
+    pack_binary_embedding,
+    pop_encoding_format,
+    truncate_embeddings,
+)
+from .test_batch import MockEmbeddingModel
+from .test_embedding_models import TEST_MODEL_SPEC
+
+
+def test_pop_encoding_format():
+    kwargs = {"encoding_format": "base64", "embedding_dtype": "float16", "a": 1}
+    assert pop_encoding_format(kwargs) == ("base64", "float16")
+    assert kwargs == {"a": 1}
+    assert pop_encoding_format({"encoding_format": None}) == ("float", "float32")
+    with pytest.raises(ValueError):
+        pop_encoding_format({"encoding_format": "hex"})
+    with pytest.raises(ValueError):
+        pop_encoding_format({"embedding_dtype": "int8"})
+
+
+def test_encode_embeddings():
+    torch = pytest.importorskip("torch")
+    embeddings = [torch.tensor([0.5, -1.25, 3.0]), torch.tensor([1.0, 2.0, 0.0])]
+    assert encode_embeddings(embeddings) == [[0.5, -1.25, 3.0], [1.0, 2.0, 0.0]]
+
+    encoded = encode_embeddings(embeddings, "base64")
+    # compatible with OpenAI
+    assert np.frombuffer(base64.b64decode(encoded[0]), dtype="<f4").tolist() == [
+        0.5,
+        -1.25,
+        3.0,
+    ]
+    encoded = encode_embeddings(embeddings, "binary", "float16")
+    assert [len(e) for e in encoded] == [6, 6]
+    assert decode_embedding(encoded[1], "float16").tolist() == [1.0, 2.0, 0.0]
+    bf16 = [e.to(torch.bfloat16) for e in embeddings]
+    assert decode_embedding(
+        encode_embeddings(bf16, "base64")[0], "float32"
+    ).tolist() == [
+        0.5,
+        -1.25,
+        3.0,
+    ]
+
+    sparse = [{"1": 0.5}]
+    assert encode_embeddings(sparse) == sparse
+    with pytest.raises(ValueError):
+        encode_embeddings(sparse, "base64")
+
+
+async def test_binary_embedding():
+    model = MockEmbeddingModel("mock", "", TEST_MODEL_SPEC, result_cache_size=1)
+    result = await model.async_create_embedding(
+        ["aa", "b"],
+        model_uid="mock",
+        encoding_format="binary",
+        embedding_dtype="float16",
+    )
+    content, headers = pack_binary_embedding(result, "float16")
+    assert headers["X-Embedding-Shape"] == "2,2"
+    decoded = decode_binary_embedding(headers, content)
+    assert decoded["model"] == "mock"
+    assert decoded["usage"]["total_tokens"] == 3
+    assert [d["embedding"].tolist() for d in decoded["data"]] == [[2, 2], [1, 2]]
+
+    # served by the cache in another format
+    result = await model.async_create_embedding(
+        "aa", model_uid="mock", encoding_format="base64"
+    )
+    assert decode_embedding(result["data"][0]["embedding"], "float32").tolist() == [
+        2,
+        2,
+    ]
+    assert len(model.batches) == 1
+
+
+def test_truncate_embeddings():
+    matrix = [[3.0, 4.0, 12.0], [0.0, -2.0, 1.0]]
+    assert truncate_embeddings(matrix, None) is matrix
+    np.testing.assert_allclose(
+        truncate_embeddings(matrix, 2), [[0.6, 0.8], [0.0, -1.0]], rtol=1e-6
+    )
+    np.testing.assert_allclose(
+        truncate_embeddings(np.array(matrix), 1, normalize=False), [[3.0], [0.0]]
+    )
+    torch = pytest.importorskip("torch")
+    truncated = truncate_embeddings(torch.tensor(matrix), 2)
+    assert isinstance(truncated, torch.Tensor)
+    np.testing.assert_allclose(truncated.numpy(), [[0.6, 0.8], [0.0, -1.0]], rtol=1e-6)
+
+
+def test_pop_dimensions():
+    model = MockEmbeddingModel("mock", "", TEST_MODEL_SPEC)
+    assert model._pop_dimensions({}) is None
+    assert model._pop_dimensions({"dimensions": 384}) is None
+    with pytest.raises(ValueError, match="does not support"):
+        model._pop_dimensions({"dimensions": 128})
+
+    spec = TEST_MODEL_SPEC.copy(update={"min_dimensions": 64})
+    model = MockEmbeddingModel("mock", "", spec)
+    kwargs = {"dimensions": "128", "normalize_embeddings": True}
+    assert model._pop_dimensions(kwargs) == 128
+    assert kwargs == {"normalize_embeddings": True}
+    for dimensions in [32, 512]:
+        with pytest.raises(ValueError, match="between 64 and 384"):
+            model._pop_dimensions({"dimensions": dimensions})
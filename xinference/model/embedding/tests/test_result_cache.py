@@ -0,0 +1,122 @@
+# Copyright 2022-2025 XProbe Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from ..result_cache import EmbeddingResultCache, get_cache_key
+from .test_batch import MockEmbeddingModel
+from .test_embedding_models import TEST_MODEL_SPEC
+
+
+def test_cache_key():
+    key = get_cache_key("bge", {"normalize_embeddings": True}, "hello")
+    assert key == get_cache_key(
+        "bge", {"normalize_embeddings": True, "model_uid": "other"}, "hello"
+    )
+    assert key != get_cache_key("bge", {"normalize_embeddings": False}, "hello")
+    assert key != get_cache_key("bge", {"prompt_name": "query"}, "hello")
+    assert key != get_cache_key("e5", {"normalize_embeddings": True}, "hello")
+    assert key != get_cache_key("bge", {"normalize_embeddings": True}, "hello!")
+
+
+def test_memory_lru():
+    # 3 embeddings of 4 float32
+    cache = EmbeddingResultCache(max_bytes=48)
+    keys = [get_cache_key("bge", {}, str(i)) for i in range(4)]
+    for i in range(3):
+        cache.put(keys[i], [float(i)] * 4)
+    assert cache.get(keys[0]).tolist() == [0.0] * 4
+    # the least recently used is evicted
+    cache.put(keys[3], [3.0] * 4)
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]).tolist() == [0.0] * 4
+    assert cache.get(keys[3]).tolist() == [3.0] * 4
+    # sparse embeddings are not cached
+    cache.put(keys[1], {"1": 0.5})
+    assert cache.get(keys[1]) is None
+    assert cache.stats() == {
+        "hits": 3,
+        "misses": 2,
+        "evictions": 1,
+        "memory_bytes": 48,
+        "num_memory_entries": 3,
+        "num_disk_entries": 0,
+    }
+
+
+def test_disk_cache(tmp_path):
+    # the disk holds 2 embeddings of 4 float32
+    disk_max_bytes = 8 + 2 * (32 + 16)
+    cache = EmbeddingResultCache(16, str(tmp_path), disk_max_bytes)
+    keys = [get_cache_key("bge", {}, str(i)) for i in range(3)]
+    cache.put(keys[0], [0.5] * 4)
+    cache.put(keys[1], [1.5] * 4)
+    # evicted from memory, served by the disk
+    assert cache.get(keys[0]).tolist() == [0.5] * 4
+    cache.flush()
+
+    # survives restarts
+    cache = EmbeddingResultCache(16, str(tmp_path), disk_max_bytes)
+    assert cache.stats()["num_disk_entries"] == 2
+    assert cache.get(keys[1]).tolist() == [1.5] * 4
+    # the oldest is overwritten when full
+    cache.put(keys[2], [2.5] * 4)
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[2]).tolist() == [2.5] * 4
+    assert cache.stats()["num_disk_entries"] == 2
+
+    # a slot overwritten by another writer is a miss rather than its embedding
+    other = EmbeddingResultCache(16, str(tmp_path), disk_max_bytes)
+    other.put(keys[0], [0.5] * 4)
+    assert other.get(keys[0]).tolist() == [0.5] * 4
+    cache._memory.clear()
+    assert cache.get(keys[1]) is None
+    assert cache.stats()["num_disk_entries"] == 1
+
+
+def test_disk_cache_per_replica(tmp_path):
+    model = MockEmbeddingModel(
+        "mock-0", "", TEST_MODEL_SPEC, result_cache_dir=str(tmp_path)
+    )
+    assert model.get_result_cache() is not None
+    assert (tmp_path / "mock-0").is_dir()
+
+
+async def test_cached_embedding():
+    model = MockEmbeddingModel("mock", "", TEST_MODEL_SPEC, result_cache_size=1)
+    assert model.get_result_cache() is not None
+    result = await model.async_create_embedding(["aa", "b"], model_uid="mock")
+    assert result["usage"]["total_tokens"] == 3
+    # only the misses reach the model
+    result = await model.async_create_embedding(["ccc", "aa", "b"], model_uid="mock")
+    assert model.batches == [["aa", "b"], ["ccc"]]
+    assert result["model"] == "mock"
+    assert [d["index"] for d in result["data"]] == [0, 1, 2]
+    assert [d["embedding"] for d in result["data"]] == [[3, 1], [2, 2], [1, 2]]
+    assert result["usage"]["total_tokens"] == 3
+    result = await model.async_create_embedding("aa", model_uid="mock")
+    assert result["data"][0]["embedding"] == [2, 2]
+    assert result["usage"]["total_tokens"] == 0
+    assert len(model.batches) == 2
+    # the arguments are part of the key
+    await model.async_create_embedding("aa", model_uid="mock", scale=2)
+    assert model.batches[-1] == ["aa"]
+    assert model.get_result_cache().stats()["hits"] == 3
+
+    # together with the batcher
+    model = MockEmbeddingModel(
+        "mock", "", TEST_MODEL_SPEC, result_cache_size=1, max_batch_size=4
+    )
+    await model.async_create_embedding(["aa", "b"])
+    await model.async_create_embedding(["b", "ccc"])
+    assert model.batches == [["aa", "b"], ["ccc"]]
+    await model.get_batcher().stop()
@@ -18,6 +18,7 @@ from typing import List, Union
 
 from ....types import Embedding, EmbeddingData, EmbeddingUsage
 from ..core import EmbeddingModel, EmbeddingModelFamilyV2, EmbeddingSpecV1
+from ..encoding import encode_embeddings, pop_encoding_format, truncate_embeddings
 
 logger = logging.getLogger(__name__)
 SUPPORTED_MODELS_PREFIXES = ["bge", "gte", "text2vec", "m3e", "gte", "Qwen3"]
@@ -56,6 +57,8 @@ class VLLMEmbeddingModel(EmbeddingModel):
     ):
         sentences = self._fix_langchain_openai_inputs(sentences)
         model_uid = kwargs.pop("model_uid", None)
+        encoding_format, dtype = pop_encoding_format(kwargs)
+        dimensions = self._pop_dimensions(kwargs)
 
         normalize_embedding = kwargs.get("normalize_embedding", True)
         if not normalize_embedding:
@@ -93,15 +96,19 @@ class VLLMEmbeddingModel(EmbeddingModel):
                 sentences = truncated_sentences
 
         outputs = self._model.embed(sentences, use_tqdm=False)
-        embedding_list = []
-        all_token_nums = 0
-        for index, output in enumerate(outputs):
-            embedding_list.append(
-                EmbeddingData(
-                    index=index, object="embedding", embedding=output.outputs.embedding
+        embedding_list = [
+            EmbeddingData(index=index, object="embedding", embedding=data)
+            for index, data in enumerate(
+                encode_embeddings(
+                    truncate_embeddings(
+                        [output.outputs.embedding for output in outputs], dimensions
+                    ),
+                    encoding_format,
+                    dtype,
                 )
             )
-            all_token_nums += len(output.prompt_token_ids)
+        ]
+        all_token_nums = sum(len(output.prompt_token_ids) for output in outputs)
         usage = EmbeddingUsage(
             prompt_tokens=all_token_nums, total_tokens=all_token_nums
         )
@@ -32,6 +32,7 @@ from PIL import ImageOps
 
 from ....device_utils import get_available_device, move_model_to_available_device
 from ....types import LoRA
+from ...offload import SleepModelMixin
 from ..sdapi import SDAPIDiffusionModelMixin
 from ..utils import handle_image_result
 
@@ -78,7 +79,7 @@ def model_accept_param(params: Union[str, List[str]], model: Any) -> bool:
     return allow_params
 
 
-class DiffusionModel(SDAPIDiffusionModelMixin):
+class DiffusionModel(SDAPIDiffusionModelMixin, SleepModelMixin):
     def __init__(
         self,
         model_uid: str,
@@ -466,6 +467,10 @@ class DiffusionModel(SDAPIDiffusionModelMixin):
     def get_max_num_images_for_batching(self):
         return self._kwargs.get("max_num_images", 16)
 
+    def _get_sleep_targets(self) -> List[Any]:
+        # the pipelines of other abilities share the components
+        return [self._model, *self._ability_to_models.values()]
+
     @staticmethod
     def _get_scheduler(model: Any, sampler_name: str):
         if not sampler_name or sampler_name == "default":
@@ -11,13 +11,23 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import asyncio
 import concurrent.futures
 import importlib.util
 import logging
 import os
 import pprint
 import queue
-from typing import Iterator, List, Optional, Union
+from typing import (
+    Any,
+    AsyncGenerator,
+    AsyncIterator,
+    Callable,
+    Iterator,
+    List,
+    Optional,
+    Union,
+)
 
 import orjson
 
@@ -49,7 +59,7 @@ class XllamaCppModel(LLM, ChatModelMixin):
     ):
         super().__init__(model_uid, model_family, model_path)
         self._llamacpp_model_config = self._sanitize_model_config(llamacpp_model_config)
-        self._llm = None
+        self._llm: Optional[Any] = None
         self._executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
 
     def _sanitize_model_config(self, llamacpp_model_config: Optional[dict]) -> dict:
@@ -223,143 +233,176 @@ class XllamaCppModel(LLM, ChatModelMixin):
         except AssertionError:
             raise RuntimeError(f"Load model {self.model_family.model_name} failed")
 
-    def generate(
-        self, prompt: str, generate_config: Optional[dict] = None
-    ) -> Union[Completion, Iterator[CompletionChunk]]:
-        generate_config = generate_config or {}
-        if not generate_config.get("max_tokens") and XINFERENCE_MAX_TOKENS:
-            generate_config["max_tokens"] = XINFERENCE_MAX_TOKENS
-        stream = generate_config.get("stream", False)
-        q: queue.Queue = queue.Queue()
+    def _submit(self, handle: str, data: dict, put: Callable[[Any], Any]):
+        """
+        Run a request by the `handle` method of the llama.cpp server in the executor.
+        Each result is passed to `put`, followed by `_Done`, errors are passed as `_Error`.
+        """
 
-        def _handle_completion():
-            data = generate_config
-            data.pop("stopping_criteria", None)
-            data.pop("logits_processor", None)
-            data.pop("suffix", None)
-            data.pop("best_of", None)
-            data.update(
-                {
-                    "prompt": prompt,
-                    "stream": stream,
-                }
-            )
-            prompt_json = orjson.dumps(data)
-
-            def _error_callback(err):
-                try:
-                    msg = orjson.loads(err)
-                    q.put(_Error(msg))
-                except Exception as e:
-                    q.put(_Error(str(e)))
-
-            def _ok_callback(ok):
-                try:
-                    res = orjson.loads(ok)
-                    res["model"] = self.model_uid
-                    q.put(res)
-                except Exception as e:
-                    logger.exception("handle_completions callback failed: %s", e)
-                    q.put(_Error(str(e)))
+        def _error_callback(err):
+            try:
+                msg = orjson.loads(err)
+                put(_Error(msg))
+            except Exception as e:
+                put(_Error(str(e)))
 
+        def _ok_callback(ok):
+            try:
+                res = orjson.loads(ok)
+                res["model"] = self.model_uid
+                put(res)
+            except Exception as e:
+                logger.exception("%s callback failed: %s", handle, e)
+                put(_Error(str(e)))
+
+        def _run():
             try:
-                self._llm.handle_completions(prompt_json, _error_callback, _ok_callback)
+                prompt_json = orjson.dumps(data)
+                getattr(self._llm, handle)(prompt_json, _error_callback, _ok_callback)
             except Exception as ex:
-                logger.exception("handle_completions failed: %s", ex)
-                q.put(_Error(str(ex)))
-            q.put(_Done)
+                logger.exception("%s failed: %s", handle, ex)
+                put(_Error(str(ex)))
+            put(_Done)
 
         assert self._executor
-        self._executor.submit(_handle_completion)
-
-        if stream:
-
-            def _to_iterator():
-                while (r := q.get()) is not _Done:
-                    if type(r) is _Error:
-                        raise Exception("Got error in generate stream: %s", r.msg)
-                    yield r
-
-            return _to_iterator()
-        else:
-            r = q.get()
-            if type(r) is _Error:
-                raise Exception("Got error in generate: %s", r.msg)
-            return r
+        self._executor.submit(_run)
 
-    def chat(
-        self,
-        messages: List[dict],
-        generate_config: Optional[dict] = None,
-    ) -> Union[ChatCompletion, Iterator[ChatCompletionChunk]]:
+    def _results(self, handle: str, data: dict) -> Iterator[Any]:
+        q: queue.Queue = queue.Queue()
+        self._submit(handle, data, q.put)
+        while (r := q.get()) is not _Done:
+            yield r
+
+    async def _async_results(self, handle: str, data: dict) -> AsyncIterator[Any]:
+        # the callbacks wake up the event loop directly, without a thread blocked per stream
+        loop = asyncio.get_running_loop()
+        q: asyncio.Queue = asyncio.Queue()
+        self._submit(handle, data, lambda r: loop.call_soon_threadsafe(q.put_nowait, r))
+        while (r := await q.get()) is not _Done:
+            yield r
+
+    async def _async_result(self, handle: str, data: dict) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def _set_result(r):
+            if not future.done():
+                future.set_result(r)
+
+        self._submit(handle, data, lambda r: loop.call_soon_threadsafe(_set_result, r))
+        return await future
+
+    @staticmethod
+    def _prepare_config(generate_config: Optional[dict]) -> dict:
         generate_config = generate_config or {}
         if not generate_config.get("max_tokens") and XINFERENCE_MAX_TOKENS:
             generate_config["max_tokens"] = XINFERENCE_MAX_TOKENS
-        stream = generate_config.get("stream", False)
+        generate_config.pop("stopping_criteria", None)
+        generate_config.pop("logits_processor", None)
+        generate_config.pop("suffix", None)
+        generate_config.pop("best_of", None)
+        generate_config["stream"] = generate_config.get("stream", False)
+        return generate_config
+
+    def _prepare_completion(self, prompt: str, generate_config: Optional[dict]) -> dict:
+        data = self._prepare_config(generate_config)
+        data["prompt"] = prompt
+        return data
+
+    def _prepare_chat_completion(
+        self, messages: List[dict], generate_config: Optional[dict]
+    ) -> dict:
         tools = generate_config.pop("tools", []) if generate_config else None
-        q: queue.Queue = queue.Queue()
+        data = self._prepare_config(generate_config)
+        data["tools"] = tools
+        data["messages"] = messages
+        return data
+
+    @staticmethod
+    def _to_completion_chunk(r: Any) -> CompletionChunk:
+        if type(r) is _Error:
+            raise Exception("Got error in generate stream: %s", r.msg)
+        return r
+
+    @staticmethod
+    def _to_completion(r: Any) -> Completion:
+        if type(r) is _Error:
+            raise Exception("Got error in generate: %s", r.msg)
+        return r
+
+    @staticmethod
+    def _filter_chat_chunk(r: Any) -> ChatCompletionChunk:
+        if type(r) is _Error:
+            raise Exception(f"Got error in chat stream: {r.msg}")
+        # Get valid keys (O(1) lookup)
+        chunk_keys = ChatCompletionChunk.__annotations__
+        # The chunk may contain additional keys (e.g., system_fingerprint),
+        # which might not conform to OpenAI/DeepSeek formats.
+        # Filter out keys that are not part of ChatCompletionChunk.
+        return {key: r[key] for key in chunk_keys if key in r}  # type: ignore
+
+    def _to_chat(self, r: Any) -> ChatCompletion:
+        if type(r) is _Error:
+            raise Exception(f"Got error in chat: {r.msg}")
+        return self._to_chat_completion(r, self.reasoning_parser)
 
-        def _handle_chat_completion():
-            data = generate_config
-            data.pop("stopping_criteria", None)
-            data.pop("logits_processor", None)
-            data.pop("suffix", None)
-            data.pop("best_of", None)
-            data.update(
-                {
-                    "messages": messages,
-                    "stream": stream,
-                    "tools": tools,
-                }
-            )
-            prompt_json = orjson.dumps(data)
-
-            def _error_callback(err):
-                try:
-                    msg = orjson.loads(err)
-                    q.put(_Error(msg))
-                except Exception as e:
-                    q.put(_Error(str(e)))
+    def generate(
+        self, prompt: str, generate_config: Optional[dict] = None
+    ) -> Union[Completion, Iterator[CompletionChunk]]:
+        data = self._prepare_completion(prompt, generate_config)
+        results = self._results("handle_completions", data)
+        if data["stream"]:
+            return (self._to_completion_chunk(r) for r in results)
+        return self._to_completion(next(results))
 
-            def _ok_callback(ok):
-                try:
-                    res = orjson.loads(ok)
-                    res["model"] = self.model_uid
-                    q.put(res)
-                except Exception as e:
-                    logger.exception("handle_chat_completions callback failed: %s", e)
-                    q.put(_Error(str(e)))
+    async def async_generate(
+        self,
+        prompt: str,
+        generate_config: Optional[dict] = None,
+        request_id: Optional[str] = None,
+    ) -> Union[Completion, AsyncGenerator[CompletionChunk, None]]:
+        data = self._prepare_completion(prompt, generate_config)
+        if data["stream"]:
 
-            try:
-                self._llm.handle_chat_completions(
-                    prompt_json, _error_callback, _ok_callback
-                )
-            except Exception as ex:
-                logger.exception("handle_chat_completions failed: %s", ex)
-                q.put(_Error(str(ex)))
-            q.put(_Done)
+            async def _to_async_generator():
+                async for r in self._async_results("handle_completions", data):
+                    yield self._to_completion_chunk(r)
 
-        assert self._executor
-        self._executor.submit(_handle_chat_completion)
+            return _to_async_generator()
+        return self._to_completion(await self._async_result("handle_completions", data))
 
-        if stream:
+    def chat(
+        self,
+        messages: List[dict],
+        generate_config: Optional[dict] = None,
+    ) -> Union[ChatCompletion, Iterator[ChatCompletionChunk]]:
+        data = self._prepare_chat_completion(messages, generate_config)
+        results = self._results("handle_chat_completions", data)
+        if data["stream"]:
 
             def _to_iterator():
-                while (r := q.get()) is not _Done:
-                    if type(r) is _Error:
-                        raise Exception(f"Got error in chat stream: {r.msg}")
-                    # Get valid keys (O(1) lookup)
-                    chunk_keys = ChatCompletionChunk.__annotations__
-                    # The chunk may contain additional keys (e.g., system_fingerprint),
-                    # which might not conform to OpenAI/DeepSeek formats.
-                    # Filter out keys that are not part of ChatCompletionChunk.
-                    yield {key: r[key] for key in chunk_keys if key in r}
+                for r in results:
+                    yield self._filter_chat_chunk(r)
 
             return self._to_chat_completion_chunks(
                 _to_iterator(), self.reasoning_parser
             )
-        else:
-            r = q.get()
-            if type(r) is _Error:
-                raise Exception(f"Got error in chat: {r.msg}")
-            return self._to_chat_completion(r, self.reasoning_parser)
+        return self._to_chat(next(results))
+
+    async def async_chat(
+        self,
+        messages: List[dict],
+        generate_config: Optional[dict] = None,
+        request_id: Optional[str] = None,
+    ) -> Union[ChatCompletion, AsyncGenerator[ChatCompletionChunk, None]]:
+        data = self._prepare_chat_completion(messages, generate_config)
+        if data["stream"]:
+
+            async def _to_async_generator():
+                async for r in self._async_results("handle_chat_completions", data):
+                    yield self._filter_chat_chunk(r)
+
+            return self._async_to_chat_completion_chunks(
+                _to_async_generator(), self.reasoning_parser
+            )
+        return self._to_chat(await self._async_result("handle_chat_completions", data))
@@ -12,10 +12,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import base64
+import concurrent.futures
+import threading
 
+import orjson
+import pytest
 import requests
 
 from .....client import Client
+from ..core import XllamaCppModel
 
 
 def test_gguf(setup):
@@ -91,3 +96,57 @@ def test_gguf_multimodal(setup):
     assert "black" in content
     assert "white" in content
     assert "cat" in content
+
+
+class _MockServer:
+    """
+    Calls back from the thread of the request like the llama.cpp server,
+    with a completion chunk per word of the prompt.
+    """
+
+    def __init__(self):
+        self.threads = set()
+
+    def handle_completions(self, prompt_json, error_callback, ok_callback):
+        self.threads.add(threading.get_ident())
+        data = orjson.loads(prompt_json)
+        if data["prompt"] == "error":
+            error_callback(orjson.dumps({"message": "failed"}))
+            return
+        words = data["prompt"].split()
+        if not data["stream"]:
+            ok_callback(orjson.dumps({"choices": [{"text": " ".join(words)}]}))
+            return
+        for word in words:
+            ok_callback(orjson.dumps({"choices": [{"text": word}]}))
+
+
+def _create_mock_model() -> XllamaCppModel:
+    model = XllamaCppModel.__new__(XllamaCppModel)
+    model.model_uid = "mock"
+    model.reasoning_parser = None
+    model._llm = _MockServer()
+    model._executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+    return model
+
+
+async def test_async_generate():
+    model = _create_mock_model()
+    gen = await model.async_generate("a b c", {"stream": True})
+    chunks = [chunk async for chunk in gen]
+    assert [c["choices"][0]["text"] for c in chunks] == ["a", "b", "c"]
+    assert all(c["model"] == "mock" for c in chunks)
+    # the callbacks run in the executor, not in the event loop thread
+    assert threading.get_ident() not in model._llm.threads
+
+    completion = await model.async_generate("a b c", {"stream": False})
+    assert completion["choices"][0]["text"] == "a b c"
+    # the sync variant gets the same results
+    assert model.generate("a b c")["choices"][0]["text"] == "a b c"
+
+    with pytest.raises(Exception, match="Got error in generate"):
+        await model.async_generate("error")
+    gen = await model.async_generate("error", {"stream": True})
+    with pytest.raises(Exception, match="Got error in generate stream"):
+        async for _ in gen:
+            pass
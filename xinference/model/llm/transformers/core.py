@@ -36,7 +36,9 @@ from ....types import (
     PytorchGenerateConfig,
     PytorchModelConfig,
 )
+from ...offload import SleepModelMixin
 from ...scheduler.request import InferenceRequest
+from ...shared_weights import SharedWeightsMixin
 from ...utils import select_device
 from ..core import LLM, chat_context_var
 from ..llm_family import LLMFamilyV2, LLMSpecV1
@@ -89,7 +91,7 @@ def register_non_default_model(*model_names: str):
     return decorator
 
 
-class PytorchModel(LLM):
+class PytorchModel(LLM, SleepModelMixin, SharedWeightsMixin):
     def __init__(
         self,
         model_uid: str,
@@ -105,6 +107,10 @@ class PytorchModel(LLM):
         )
         self._context_length: Optional[int] = None
         self._peft_model = peft_model
+        # the replicas on the same node share the weights on CPU
+        self._share_weights = bool(
+            self._pytorch_model_config.pop("share_weights", False)
+        )
 
     def _sanitize_model_config(
         self, pytorch_model_config: Optional[PytorchModelConfig]
@@ -119,6 +125,15 @@ class PytorchModel(LLM):
         pytorch_model_config.setdefault("device", "auto")
         pytorch_model_config.setdefault("trust_remote_code", True)
         pytorch_model_config.setdefault("max_num_seqs", 16)
+        pytorch_model_config.setdefault("batching_mode", "default")
+        pytorch_model_config.setdefault("enable_prefix_caching", False)
+        pytorch_model_config.setdefault("prefix_cache_max_memory", 1)
+        pytorch_model_config.setdefault("chunked_prefill_size", None)
+        pytorch_model_config.setdefault("scheduling_policy", "fcfs")
+        pytorch_model_config.setdefault("speculative_decoding", None)
+        pytorch_model_config.setdefault("num_speculative_tokens", 4)
+        pytorch_model_config.setdefault("speculative_draft_model_path", None)
+        pytorch_model_config.setdefault("speculative_ngram_size", 3)
         pytorch_model_config.setdefault("enable_tensorizer", False)
         pytorch_model_config.setdefault("reasoning_content", False)
         pytorch_model_config.setdefault("quantization_config", {})
@@ -361,6 +376,329 @@ class PytorchModel(LLM):
 
             self._batch_scheduler = BatchScheduler(self)
             # Note: scheduler will be started when first request comes in
+            self._init_kv_arena()
+            self._init_prefix_cache()
+            self._init_chunked_prefill()
+            self._init_speculative_decoding(kwargs)
+
+    def _init_kv_arena(self):
+        self._kv_arena = None
+        batching_mode = self._pytorch_model_config.get("batching_mode", "default")
+        if batching_mode not in ("default", "kv_arena"):
+            raise ValueError(
+                f"Unsupported batching mode: {batching_mode}, "
+                f"must be one of `default` and `kv_arena`"
+            )
+        if batching_mode == "default":
+            if not self._pytorch_model_config.get("speculative_decoding"):
+                return
+            # the KV cache of rejected draft tokens is dropped by the arena
+            logger.info("Speculative decoding enables batching mode `kv_arena`.")
+        if type(self).merge_kv_cache is not PytorchModel.merge_kv_cache:
+            logger.warning(
+                f"Model {self.model_family.model_name} has its own KV cache, "
+                f"batching mode `kv_arena` is not supported, fallback to `default`."
+            )
+            return
+        from .kv_cache import KVCacheArena
+
+        self._kv_arena = KVCacheArena(self.get_max_num_seqs())
+
+    def get_kv_arena(self):
+        """
+        The preallocated KV cache for batching mode `kv_arena`, None for the default mode.
+        """
+        return getattr(self, "_kv_arena", None)
+
+    def _supports_prefill_with_cached_prefix(self, feature: str) -> bool:
+        # prefilling on top of cached prefixes relies on the default inputs and KV cache
+        customized = [
+            name
+            for name in (
+                "build_prefill_kwargs",
+                "build_prefill_inputs",
+                "build_prefill_position_ids",
+                "merge_kv_cache",
+            )
+            if getattr(type(self), name) is not getattr(PytorchModel, name)
+        ]
+        if customized:
+            logger.warning(
+                f"Model {self.model_family.model_name} does not support {feature}, "
+                f"since it has its own {', '.join(customized)}."
+            )
+            return False
+        if self._tokenizer.padding_side != "left":
+            logger.warning(
+                f"Model {self.model_family.model_name} does not support {feature}, "
+                f"since its tokenizer pads on the right."
+            )
+            return False
+        return True
+
+    def _init_prefix_cache(self):
+        self._prefix_cache = None
+        if not self._pytorch_model_config.get(
+            "enable_prefix_caching"
+        ) or not self._supports_prefill_with_cached_prefix("prefix caching"):
+            return
+        from .prefix_cache import PrefixCache
+
+        max_memory = self._pytorch_model_config.get("prefix_cache_max_memory")
+        self._prefix_cache = PrefixCache(int(max_memory * 1024**3))  # type: ignore
+
+    def get_prefix_cache(self):
+        """
+        The KV cache of prompt prefixes, None if prefix caching is not enabled.
+        """
+        return getattr(self, "_prefix_cache", None)
+
+    def _free_device_caches(self):
+        prefix_cache = self.get_prefix_cache()
+        if prefix_cache is not None:
+            prefix_cache.clear()
+        kv_arena = self.get_kv_arena()
+        if kv_arena is not None:
+            kv_arena.free()
+
+    def _init_chunked_prefill(self):
+        self._chunked_prefill_size = None
+        chunked_prefill_size = self._pytorch_model_config.get("chunked_prefill_size")
+        if not chunked_prefill_size:
+            return
+        if chunked_prefill_size < 0:
+            raise ValueError(
+                f"`chunked_prefill_size` must be greater than 0, got {chunked_prefill_size}"
+            )
+        if self._supports_prefill_with_cached_prefix("chunked prefill"):
+            self._chunked_prefill_size = chunked_prefill_size
+
+    def get_chunked_prefill_size(self) -> Optional[int]:
+        """
+        Max number of prompt tokens to prefill in a step, None if chunked prefill is not enabled.
+        """
+        return getattr(self, "_chunked_prefill_size", None)
+
+    def _init_speculative_decoding(self, load_kwargs: Dict[str, Any]):
+        self._speculative_decoder = None
+        method = self._pytorch_model_config.get("speculative_decoding")
+        if not method:
+            return
+        if method not in ("ngram", "draft"):
+            raise ValueError(
+                f"Unsupported speculative decoding: {method}, "
+                f"must be one of `ngram` and `draft`"
+            )
+        num_speculative_tokens = self._pytorch_model_config.get(
+            "num_speculative_tokens"
+        )
+        if not num_speculative_tokens or num_speculative_tokens < 0:
+            raise ValueError(
+                f"`num_speculative_tokens` must be greater than 0, got {num_speculative_tokens}"
+            )
+        # the draft tokens are fed with the default inputs of decoding
+        customized = [
+            name
+            for name in (
+                "build_decode_kwargs",
+                "build_decode_attention_mask",
+                "build_decode_position_ids",
+                "build_decode_token_type_ids",
+            )
+            if getattr(type(self), name) is not getattr(PytorchModel, name)
+        ]
+        if self.get_kv_arena() is None or customized:
+            logger.warning(
+                f"Model {self.model_family.model_name} does not support speculative decoding, "
+                f"since it has its own KV cache or {', '.join(customized) or 'inputs'}."
+            )
+            return
+
+        from .speculative import DraftModelProposer, NgramProposer, SpeculativeDecoder
+
+        proposer: Any
+        if method == "ngram":
+            proposer = NgramProposer(
+                max_ngram=self._pytorch_model_config.get("speculative_ngram_size")  # type: ignore
+            )
+        else:
+            draft_model_path = self._pytorch_model_config.get(
+                "speculative_draft_model_path"
+            )
+            if not draft_model_path:
+                raise ValueError(
+                    "`speculative_draft_model_path` is required for speculative decoding `draft`"
+                )
+            from transformers import AutoModelForCausalLM
+
+            draft_model = AutoModelForCausalLM.from_pretrained(
+                draft_model_path,
+                torch_dtype=load_kwargs.get("torch_dtype"),
+                trust_remote_code=load_kwargs.get("trust_remote_code"),
+            ).to(self._model.device)
+            draft_model.eval()
+            if draft_model.config.vocab_size < len(self._tokenizer):
+                raise ValueError(
+                    f"Draft model {draft_model_path} must share the tokenizer "
+                    f"of model {self.model_family.model_name}"
+                )
+            proposer = DraftModelProposer(
+                draft_model,
+                self.get_max_num_seqs(),
+                pad_token_id=self._tokenizer.pad_token_id or 0,
+            )
+        self._speculative_decoder = SpeculativeDecoder(proposer, num_speculative_tokens)
+
+    def get_speculative_decoder(self):
+        """
+        The decoder verifying the draft tokens, None if speculative decoding is not enabled.
+        """
+        return getattr(self, "_speculative_decoder", None)
+
+    def get_speculative_decoding_stats(self) -> Optional[Dict[str, float]]:
+        """
+        Statistics of speculative decoding to tune `num_speculative_tokens`,
+        None if speculative decoding is not enabled.
+        """
+        decoder = self.get_speculative_decoder()
+        return decoder.stats() if decoder is not None else None
+
+    def get_scheduling_policy(self) -> str:
+        return self._pytorch_model_config.get("scheduling_policy")  # type: ignore
+
+    @lru_cache
+    def support_preemption(self) -> bool:
+        """
+        Preempted requests drop their KV cache,
+        and prefill their prompt and generated tokens again on top of the cached prefix when resumed.
+        """
+        return self._supports_prefill_with_cached_prefix("preemption")
+
+    def prefill_with_cached_prefix(self) -> bool:
+        """
+        Whether prompts are prefilled on top of their cached prefixes,
+        which are from the prefix cache or the prefilled chunks.
+        """
+        return (
+            self.get_prefix_cache() is not None
+            or self.get_chunked_prefill_size() is not None
+        )
+
+    def prepare_prefill_tokens(self, prompts: List, req_list: List[InferenceRequest]):
+        """
+        Tokenize the prompts of new requests, and look up their prefixes in the prefix cache.
+        The requests resumed from preemption already have their prompt tokens.
+        """
+        from .prefix_cache import CachedPrefix
+
+        new_reqs = [
+            (prompt, r)
+            for prompt, r in zip(prompts, req_list)
+            if r.prompt_tokens is None
+        ]
+        if new_reqs:
+            inputs = self._tokenizer([p for p, _ in new_reqs], padding=False).input_ids
+            context_len = self.get_context_len()
+            for (_, r), input_id in zip(new_reqs, inputs):
+                r.prompt_tokens = input_id[-get_max_src_len(context_len, r) :]
+        prefix_cache = self.get_prefix_cache()
+        for r in req_list:
+            if r.cached_prefix is not None:
+                continue
+            if prefix_cache is not None:
+                tokens = r.prefill_tokens
+                # at least the last token is prefilled to get the logits
+                r.cached_prefix = prefix_cache.match(tokens, len(tokens) - 1)
+            else:
+                r.cached_prefix = CachedPrefix([])
+
+    def build_prefill_kwargs_with_cached_prefix(
+        self, req_list: List[InferenceRequest], prefill_lens: List[int]
+    ):
+        """
+        Get all inputs parameters for prefill phase,
+        which prefills `prefill_tokens[cached_prefix.length:prefill_len]` of each request.
+        The KV cache of the cached prefixes is passed as `past_key_values`,
+        so each row of the whole sequence is `[PAD][prefix][PAD][suffix]`.
+        """
+        from .prefix_cache import build_prefix_kv_cache
+
+        prefixes = [r.cached_prefix for r in req_list]
+        prefix_len = max(p.length for p in prefixes)
+        suffix_len = max(n - p.length for p, n in zip(prefixes, prefill_lens))
+
+        input_ids, attention_mask, position_ids = [], [], []
+        for r, p, n in zip(req_list, prefixes, prefill_lens):
+            suffix = r.prefill_tokens[p.length : n]
+            padding_len = suffix_len - len(suffix)
+            input_ids.append([0] * padding_len + suffix)
+            attention_mask.append(
+                [0] * (prefix_len - p.length)
+                + [1] * p.length
+                + [0] * padding_len
+                + [1] * len(suffix)
+            )
+            position_ids.append([0] * padding_len + list(range(p.length, n)))
+        res = {
+            "input_ids": torch.as_tensor(input_ids, device=self._device),
+            "attention_mask": torch.as_tensor(attention_mask, device=self._device),
+            "position_ids": torch.as_tensor(position_ids, device=self._device),
+        }
+        past_key_values = build_prefix_kv_cache(prefixes)
+        if past_key_values is not None:
+            res["past_key_values"] = past_key_values
+        return res
+
+    def finish_prefill_with_cached_prefix(
+        self, req_list: List[InferenceRequest], prefill_lens: List[int], cache
+    ) -> Tuple[List[int], Any]:
+        """
+        Keep the KV cache of the requests whose prompts are not fully prefilled for the next step,
+        and cache the prompts which are fully prefilled.
+        Return the indexes of the fully prefilled requests,
+        and their KV cache padded on the left like the one of a normal prefill.
+        """
+        from .prefix_cache import CachedPrefix, compact_kv_cache
+
+        prefix_lens = [r.cached_prefix.length for r in req_list]
+        if max(prefix_lens) > 0:
+            cache = compact_kv_cache(cache, prefix_lens, prefill_lens)
+        max_len = max(prefill_lens)
+        prefix_cache = self.get_prefix_cache()
+        finished = []
+        for i, (r, n) in enumerate(zip(req_list, prefill_lens)):
+            keys = [k[i, :, max_len - n :] for k in cache.key_cache]
+            values = [v[i, :, max_len - n :] for v in cache.value_cache]
+            tokens = r.prefill_tokens
+            if n < len(tokens):
+                r.cached_prefix = CachedPrefix.from_kv(
+                    tokens[:n],
+                    [k.clone() for k in keys],
+                    [v.clone() for v in values],
+                )
+                continue
+            r.cached_prefix = None
+            if prefix_cache is not None:
+                prefix_cache.insert(tokens, keys, values)
+            finished.append(i)
+        if prefix_cache is not None:
+            logger.debug("Prefix cache stats: %s", prefix_cache.stats())
+        if not finished:
+            return finished, None
+
+        seq_len = max(prefill_lens[i] for i in finished)
+        if len(finished) < len(req_list):
+            index = torch.as_tensor(finished)
+            for idx in range(len(cache)):
+                k, v = cache.key_cache[idx], cache.value_cache[idx]
+                cache.key_cache[idx] = k[index.to(k.device), :, max_len - seq_len :]
+                cache.value_cache[idx] = v[index.to(v.device), :, max_len - seq_len :]
+        for i in finished:
+            r = req_list[i]
+            r.padding_len = seq_len - prefill_lens[i]
+            r.extra_kwargs["attention_mask_seq_len"] = prefill_lens[i]
+            r.extra_kwargs["max_position_id"] = prefill_lens[i] - 1
+        return finished, cache
 
     def _should_use_batching(self) -> bool:
         """Check if this model should use batch scheduling"""
@@ -546,6 +884,10 @@ class PytorchModel(LLM):
         Note that the `seq_length` parameter is from merged kv_cache.
         So we need pad `0` on the left again.
         """
+        kv_arena = self.get_kv_arena()
+        if kv_arena is not None:
+            # tokens are stored from the beginning of each slot
+            return kv_arena.build_attention_mask().to(self._device)
         data = []
         for r in reqs:
             r.extra_kwargs["attention_mask_seq_len"] += 1
@@ -840,6 +1182,9 @@ class PytorchModel(LLM):
         self.handle_batch_inference_results(req_list)
 
     def build_reduced_kv_cache(self, cache, skipped_indexes: Set[int]):
+        if cache is self.get_kv_arena():
+            cache.release_stopped()
+            return cache
         batch_size = cache.key_cache[0].shape[0]
         batch_slices = [num for num in range(batch_size) if num not in skipped_indexes]
         for idx in range(len(cache)):
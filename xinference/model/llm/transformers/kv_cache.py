@@ -0,0 +1,282 @@
+# Copyright 2022-2025 XProbe Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import torch
+from transformers.cache_utils import Cache
+
+from ...scheduler.request import InferenceRequest
+
+logger = logging.getLogger(__name__)
+
+
+class KVCacheArena(Cache):
+    """
+    Preallocated KV cache for continuous batching.
+    Each layer has a buffer of `(max_batch_size, num_heads, capacity, head_dim)`,
+    and every running request owns a slot (a row) of the buffers.
+    The tokens of a request are always stored from the beginning of its slot,
+    the per-slot lengths and the attention mask tell the valid part.
+    Slots `[0, n)` are always in use, so the running batch is a view of the buffers.
+
+    Compared with merging the KV cache by padding and concatenating,
+    admitting a request only writes its own KV cache to a free slot,
+    and retiring a request only moves the last slot to the retired one.
+    """
+
+    def __init__(self, max_batch_size: int, initial_capacity: int = 256):
+        super().__init__()
+        self.max_batch_size = max_batch_size
+        self._initial_capacity = initial_capacity
+        self._capacity = 0
+        self.key_cache: List[torch.Tensor] = []
+        self.value_cache: List[torch.Tensor] = []
+        # requests and their lengths of slots in use
+        self._requests: List[InferenceRequest] = []
+        self._lengths: List[int] = []
+        # the positions to write for the current forward, set by the first layer
+        self._write_index: Optional[Tuple[torch.Tensor, torch.Tensor]] = None
+
+    @property
+    def requests(self) -> List[InferenceRequest]:
+        """
+        Requests ordered by slots, which is the order of the rows of the batch.
+        """
+        return list(self._requests)
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    def __len__(self):
+        return len(self.key_cache)
+
+    def __getitem__(self, layer_idx: int) -> Tuple[torch.Tensor, torch.Tensor]:
+        n, seq_len = len(self._requests), self.get_seq_length()
+        return (
+            self.key_cache[layer_idx][:n, :, :seq_len],
+            self.value_cache[layer_idx][:n, :, :seq_len],
+        )
+
+    def get_seq_length(self, layer_idx: Optional[int] = 0) -> int:
+        return max(self._lengths, default=0)
+
+    def get_max_cache_shape(self) -> Optional[int]:
+        # the buffers grow when needed
+        return None
+
+    def _allocate(self, cache, capacity: int):
+        for k, v in zip(cache.key_cache, cache.value_cache):
+            # must be zeros, the masked positions still join the computation of attention
+            self.key_cache.append(
+                k.new_zeros((self.max_batch_size, k.shape[1], capacity, k.shape[3]))
+            )
+            self.value_cache.append(
+                v.new_zeros((self.max_batch_size, v.shape[1], capacity, v.shape[3]))
+            )
+        self._capacity = capacity
+
+    def _ensure_capacity(self, seq_len: int):
+        if seq_len <= self._capacity:
+            return
+        # grow exponentially, so that the copy is amortized
+        capacity = max(seq_len, self._capacity * 2)
+        logger.debug("Growing KV cache arena from %s to %s", self._capacity, capacity)
+        n, old_len = len(self._requests), self.get_seq_length()
+        for cache in (self.key_cache, self.value_cache):
+            for idx, buf in enumerate(cache):
+                new_buf = buf.new_zeros(
+                    (buf.shape[0], buf.shape[1], capacity, buf.shape[3])
+                )
+                new_buf[:n, :, :old_len] = buf[:n, :, :old_len]
+                cache[idx] = new_buf
+        self._capacity = capacity
+
+    def admit(
+        self,
+        reqs: List[InferenceRequest],
+        cache,
+        padding_lens: Optional[List[int]] = None,
+    ):
+        """
+        Write the KV cache of the prefilled requests to free slots.
+        The row `i` of `cache` is for `reqs[i]`, which is padded on the left
+        by `padding_lens[i]`, defaults to the `padding_len` of the request.
+        """
+        if padding_lens is None:
+            padding_lens = [r.padding_len for r in reqs]
+        seq_len = cache.key_cache[0].shape[2]
+        if len(self._requests) + len(reqs) > self.max_batch_size:
+            raise RuntimeError(
+                f"KV cache arena is full, {len(self._requests)} slots in use, "
+                f"{len(reqs)} requests to admit, max batch size: {self.max_batch_size}"
+            )
+        if not self.key_cache:
+            self._allocate(cache, max(seq_len, self._initial_capacity))
+        else:
+            self._ensure_capacity(seq_len)
+        for i, (r, padding_len) in enumerate(zip(reqs, padding_lens)):
+            slot = len(self._requests)
+            real_len = seq_len - padding_len
+            for idx in range(len(self.key_cache)):
+                self.key_cache[idx][slot, :, :real_len] = cache.key_cache[idx][
+                    i, :, padding_len:
+                ]
+                self.value_cache[idx][slot, :, :real_len] = cache.value_cache[idx][
+                    i, :, padding_len:
+                ]
+            self._requests.append(r)
+            self._lengths.append(real_len)
+
+    def _move_slot(self, src: int, dst: int):
+        length = self._lengths[src]
+        for cache in (self.key_cache, self.value_cache):
+            for buf in cache:
+                buf[dst, :, :length] = buf[src, :, :length]
+        self._requests[dst] = self._requests[src]
+        self._lengths[dst] = length
+
+    def _released(self, req: InferenceRequest) -> bool:
+        # stopped, or preempted which drops its KV cache
+        return req.stopped or req.kv_cache is not self
+
+    @torch.inference_mode()
+    def release_stopped(self):
+        """
+        Free the slots of stopped or preempted requests, by moving the last slots in use to them.
+        Called out of the forward, so the inference mode is needed for the buffers.
+        """
+        while self._requests and self._released(self._requests[-1]):
+            self._requests.pop()
+            self._lengths.pop()
+        i = 0
+        while i < len(self._requests):
+            if self._released(self._requests[i]):
+                self._move_slot(len(self._requests) - 1, i)
+                self._requests.pop()
+                self._lengths.pop()
+                while self._requests and self._released(self._requests[-1]):
+                    self._requests.pop()
+                    self._lengths.pop()
+            i += 1
+
+    def free(self):
+        """
+        Free the buffers, which are allocated again when requests are admitted.
+        All the requests must be stopped or preempted.
+        """
+        self.release_stopped()
+        if self._requests:
+            raise RuntimeError(
+                f"Cannot free KV cache arena, {len(self._requests)} slots in use"
+            )
+        self.key_cache = []
+        self.value_cache = []
+        self._capacity = 0
+        self._write_index = None
+
+    @torch.inference_mode()
+    def reorder(self, requests: List[InferenceRequest]):
+        """
+        Keep the slots of `requests` only, and order the slots as them.
+        All the `requests` must be in the arena.
+        """
+        slots = {id(r): i for i, r in enumerate(self._requests)}
+        index = [slots[id(r)] for r in requests]
+        if index == list(range(len(self._requests))):
+            return
+        seq_len = self.get_seq_length()
+        if index:
+            index_tensor = torch.as_tensor(index, device=self.key_cache[0].device)
+            for cache in (self.key_cache, self.value_cache):
+                for buf in cache:
+                    buf[: len(index), :, :seq_len] = buf[
+                        index_tensor.to(buf.device), :, :seq_len
+                    ]
+        self._requests = list(requests)
+        self._lengths = [self._lengths[i] for i in index]
+
+    def get_lengths(self) -> List[int]:
+        """
+        Number of tokens in each slot.
+        """
+        return list(self._lengths)
+
+    def truncate(self, lengths: List[int]):
+        """
+        Keep only the first `lengths[i]` tokens of slot `i`, e.g. drop the rejected draft tokens.
+        """
+        assert len(lengths) == len(self._lengths)
+        self._lengths = [min(n, old) for n, old in zip(lengths, self._lengths)]
+
+    def build_attention_mask(
+        self, query_len: int = 1, dtype: Optional[torch.dtype] = None
+    ) -> torch.Tensor:
+        """
+        Attention mask for the next forward, which appends `query_len` tokens to every slot.
+        When `query_len` is greater than 1, the new tokens of a slot start at different positions
+        of the slots, which the causal mask of the model does not know.
+        So a 4D mask `(batch_size, 1, query_len, seq_len)` is built instead,
+        0 for the positions to attend and the minimum of `dtype` for the others.
+        """
+        device = self.key_cache[0].device
+        seq_len = self.get_seq_length() + query_len
+        if query_len == 1:
+            lengths = torch.as_tensor(self._lengths, device=device) + 1
+            return (
+                torch.arange(seq_len, device=device).unsqueeze(0) < lengths.unsqueeze(1)
+            ).long()
+        dtype = dtype or self.key_cache[0].dtype
+        # the last position each query can attend to
+        ends = torch.as_tensor(self._lengths, device=device).unsqueeze(
+            1
+        ) + torch.arange(query_len, device=device)
+        visible = torch.arange(seq_len, device=device) <= ends.unsqueeze(-1)
+        mask = torch.zeros(visible.shape, dtype=dtype, device=device)
+        mask.masked_fill_(~visible, torch.finfo(dtype).min)
+        return mask.unsqueeze(1)
+
+    def update(
+        self,
+        key_states: torch.Tensor,
+        value_states: torch.Tensor,
+        layer_idx: int,
+        cache_kwargs: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        n, _, query_len, _ = key_states.shape
+        assert n == len(self._requests), (
+            f"Batch size of inputs({n}) does not match "
+            f"the slots in use({len(self._requests)})"
+        )
+        if layer_idx == 0:
+            self._ensure_capacity(self.get_seq_length() + query_len)
+            device = key_states.device
+            rows = torch.arange(n, device=device).unsqueeze(1)
+            cols = torch.as_tensor(self._lengths, device=device).unsqueeze(
+                1
+            ) + torch.arange(query_len, device=device)
+            self._write_index = (rows, cols)
+            self._lengths = [length + query_len for length in self._lengths]
+
+        assert self._write_index is not None
+        rows, cols = self._write_index
+        if rows.device != key_states.device:
+            # layers may be dispatched to different devices
+            rows, cols = rows.to(key_states.device), cols.to(key_states.device)
+        # index by (rows, :, cols) puts the dim of heads after the ones of indexes
+        self.key_cache[layer_idx][rows, :, cols] = key_states.transpose(1, 2)
+        self.value_cache[layer_idx][rows, :, cols] = value_states.transpose(1, 2)
+        return self[layer_idx]
@@ -0,0 +1,302 @@
+# Copyright 2022-2025 XProbe Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import heapq
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import torch
+from transformers import DynamicCache
+
+logger = logging.getLogger(__name__)
+
+
+class _RadixNode:
+    __slots__ = ("tokens", "keys", "values", "children", "parent", "last_access")
+
+    def __init__(
+        self,
+        tokens: Tuple[int, ...],
+        keys: List[torch.Tensor],
+        values: List[torch.Tensor],
+        parent: Optional["_RadixNode"],
+    ):
+        # tokens on the edge from the parent,
+        # and their KV cache of every layer, `(num_heads, len(tokens), head_dim)`
+        self.tokens = tokens
+        self.keys = keys
+        self.values = values
+        self.children: Dict[int, "_RadixNode"] = {}
+        self.parent = parent
+        self.last_access = 0
+
+    @property
+    def num_bytes(self) -> int:
+        return sum(t.numel() * t.element_size() for t in self.keys + self.values)
+
+    def split(self, pos: int) -> "_RadixNode":
+        """
+        Split the edge at `pos`, return the new node of `tokens[:pos]`.
+        """
+        assert self.parent is not None and 0 < pos < len(self.tokens)
+        head = _RadixNode(
+            self.tokens[:pos],
+            # clone, so that each node owns its memory and can be freed alone
+            [k[:, :pos].clone() for k in self.keys],
+            [v[:, :pos].clone() for v in self.values],
+            self.parent,
+        )
+        head.last_access = self.last_access
+        self.parent.children[self.tokens[0]] = head
+        self.tokens = self.tokens[pos:]
+        self.keys = [k[:, pos:].clone() for k in self.keys]
+        self.values = [v[:, pos:].clone() for v in self.values]
+        self.parent = head
+        head.children[self.tokens[0]] = self
+        return head
+
+
+class CachedPrefix:
+    """
+    KV cache of a prefix of the prompt,
+    which is matched from the prefix cache or computed by the prefilled chunks.
+    """
+
+    def __init__(
+        self, segments: List[Tuple[List[torch.Tensor], List[torch.Tensor], int]]
+    ):
+        # KV cache of every layer and how many tokens of them are used.
+        # Hold the tensors rather than the nodes, since the nodes may be split later.
+        self._segments = segments
+        self.length = sum(n for _, _, n in segments)
+
+    @classmethod
+    def from_kv(
+        cls,
+        tokens: Sequence[int],
+        keys: List[torch.Tensor],
+        values: List[torch.Tensor],
+    ) -> "CachedPrefix":
+        """
+        `keys` and `values` are of every layer, `(num_heads, len(tokens), head_dim)`.
+        """
+        return cls([(keys, values, len(tokens))] if tokens else [])
+
+    def copy_to(
+        self,
+        key_cache: List[torch.Tensor],
+        value_cache: List[torch.Tensor],
+        row: int,
+        end: int,
+    ):
+        """
+        Write the KV cache of the prefix to `[row, :, end - length:end]` of every layer.
+        """
+        start = end - self.length
+        for keys, values, n in self._segments:
+            for idx in range(len(key_cache)):
+                key_cache[idx][row, :, start : start + n] = keys[idx][:, :n]
+                value_cache[idx][row, :, start : start + n] = values[idx][:, :n]
+            start += n
+
+
+class PrefixCache:
+    """
+    LRU cache of the KV cache of prompt prefixes, which is a radix tree over token ids.
+    Requests sharing a prefix with the cached prompts, e.g. the same long system prompt,
+    only need to prefill the uncached suffix.
+    When the memory exceeds `max_memory` bytes, the least recently used leaves are evicted.
+    """
+
+    def __init__(self, max_memory: int):
+        self.max_memory = max_memory
+        self._root = _RadixNode((), [], [], None)
+        self._memory = 0
+        self._clock = 0
+        # statistics of lookups
+        self.hits = 0
+        self.misses = 0
+        self.hit_tokens = 0
+        self.queried_tokens = 0
+
+    @property
+    def memory(self) -> int:
+        return self._memory
+
+    def _touch(self, node: _RadixNode):
+        self._clock += 1
+        while node is not None:
+            node.last_access = self._clock
+            node = node.parent  # type: ignore
+
+    def _walk(self, tokens: Sequence[int]) -> Tuple[List[Tuple[_RadixNode, int]], int]:
+        segments: List[Tuple[_RadixNode, int]] = []
+        node, pos = self._root, 0
+        while pos < len(tokens):
+            child = node.children.get(tokens[pos])
+            if child is None:
+                break
+            n = 0
+            for a, b in zip(child.tokens, tokens[pos:]):
+                if a != b:
+                    break
+                n += 1
+            segments.append((child, n))
+            pos += n
+            if n < len(child.tokens):
+                break
+            node = child
+        return segments, pos
+
+    def match(
+        self, tokens: Sequence[int], max_len: Optional[int] = None
+    ) -> CachedPrefix:
+        """
+        Find the longest cached prefix of `tokens`, which is no longer than `max_len`.
+        """
+        if max_len is not None:
+            tokens = tokens[:max_len]
+        segments, length = self._walk(tokens)
+        self.queried_tokens += len(tokens)
+        if length > 0:
+            self.hits += 1
+            self.hit_tokens += length
+            self._touch(segments[-1][0])
+        else:
+            self.misses += 1
+        return CachedPrefix([(node.keys, node.values, n) for node, n in segments])
+
+    def insert(
+        self,
+        tokens: Sequence[int],
+        keys: List[torch.Tensor],
+        values: List[torch.Tensor],
+    ):
+        """
+        Cache the KV cache of `tokens`,
+        `keys` and `values` are of every layer, `(num_heads, len(tokens), head_dim)`.
+        Only the part not cached yet is copied.
+        """
+        segments, pos = self._walk(tokens)
+        node = self._root
+        if segments:
+            node, n = segments[-1]
+            if n < len(node.tokens):
+                node = node.split(n)
+        if pos < len(tokens):
+            leaf = _RadixNode(
+                tuple(tokens[pos:]),
+                [k[:, pos:].clone() for k in keys],
+                [v[:, pos:].clone() for v in values],
+                node,
+            )
+            node.children[leaf.tokens[0]] = leaf
+            self._memory += leaf.num_bytes
+            node = leaf
+        self._touch(node)
+        self._evict()
+
+    def _leaves(self) -> List[_RadixNode]:
+        leaves, stack = [], list(self._root.children.values())
+        while stack:
+            node = stack.pop()
+            if node.children:
+                stack.extend(node.children.values())
+            else:
+                leaves.append(node)
+        return leaves
+
+    def _evict(self):
+        if self._memory <= self.max_memory:
+            return
+        heap = [(node.last_access, id(node), node) for node in self._leaves()]
+        heapq.heapify(heap)
+        while heap and self._memory > self.max_memory:
+            _, _, node = heapq.heappop(heap)
+            parent = node.parent
+            assert parent is not None
+            del parent.children[node.tokens[0]]
+            self._memory -= node.num_bytes
+            if parent is not self._root and not parent.children:
+                heapq.heappush(heap, (parent.last_access, id(parent), parent))
+        logger.debug("Evicted prefix cache, memory in use: %s bytes", self._memory)
+
+    def clear(self):
+        self._root.children.clear()
+        self._memory = 0
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_tokens": self.hit_tokens,
+            "queried_tokens": self.queried_tokens,
+            "hit_rate": (
+                (self.hit_tokens / self.queried_tokens) if self.queried_tokens else 0.0
+            ),
+            "memory": self._memory,
+        }
+
+
+def build_prefix_kv_cache(prefixes: List[CachedPrefix]) -> Optional[DynamicCache]:
+    """
+    Stack the KV cache of the cached prefixes as the past KV cache of a prefill,
+    each row is padded on the left to the longest prefix.
+    """
+    prefix_len = max((p.length for p in prefixes), default=0)
+    if prefix_len == 0:
+        return None
+    ref_keys, ref_values, _ = next(p for p in prefixes if p.length > 0)._segments[0]
+    key_cache = [
+        k.new_zeros((len(prefixes), k.shape[0], prefix_len, k.shape[2]))
+        for k in ref_keys
+    ]
+    value_cache = [
+        v.new_zeros((len(prefixes), v.shape[0], prefix_len, v.shape[2]))
+        for v in ref_values
+    ]
+    for i, p in enumerate(prefixes):
+        p.copy_to(key_cache, value_cache, i, prefix_len)
+    cache = DynamicCache()
+    for idx, (k, v) in enumerate(zip(key_cache, value_cache)):
+        cache.update(k, v, idx)
+    return cache
+
+
+def compact_kv_cache(
+    cache: DynamicCache, prefix_lens: List[int], seq_lens: List[int]
+) -> DynamicCache:
+    """
+    After prefilling the suffixes, each row of the KV cache is `[PAD][prefix][PAD][suffix]`.
+    Move all the paddings to the left, as if the whole prompts were prefilled.
+    """
+    total_len = cache.key_cache[0].shape[2]
+    prefix_len, max_seq_len = max(prefix_lens), max(seq_lens)
+    index = []
+    for cached_len, seq_len in zip(prefix_lens, seq_lens):
+        suffix_len = seq_len - cached_len
+        index.append(
+            [0] * (max_seq_len - seq_len)
+            + list(range(prefix_len - cached_len, prefix_len))
+            + list(range(total_len - suffix_len, total_len))
+        )
+    index_tensor = torch.as_tensor(index)
+    ret = DynamicCache()
+    for idx in range(len(cache)):
+        k, v = cache.key_cache[idx], cache.value_cache[idx]
+        i = index_tensor.to(k.device)[:, None, :, None].expand(
+            -1, k.shape[1], -1, k.shape[3]
+        )
+        ret.update(torch.gather(k, 2, i), torch.gather(v, 2, i), idx)
+    return ret
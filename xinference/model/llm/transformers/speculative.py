@@ -0,0 +1,283 @@
+# Copyright 2022-2025 XProbe Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+from typing import Dict, List, Sequence, Tuple
+
+import torch
+
+from ...scheduler.request import InferenceRequest
+from .kv_cache import KVCacheArena
+from .utils import _get_tokens_from_logits, convert_to_cache_cls
+
+logger = logging.getLogger(__name__)
+
+
+class SpeculativeProposer:
+    """
+    Propose the draft tokens following the last token of each request,
+    which are verified by one forward of the target model.
+    """
+
+    def propose(self, reqs: List[InferenceRequest], num_tokens: int) -> List[List[int]]:
+        """
+        At most `num_tokens` draft tokens for each request, may be empty.
+        """
+        raise NotImplementedError
+
+    def accept(self, reqs: List[InferenceRequest], num_accepted: List[int]):
+        """
+        Called after the verification with the same requests as `propose`,
+        and how many draft tokens of each request are accepted.
+        """
+
+
+class NgramProposer(SpeculativeProposer):
+    """
+    Prompt lookup, which needs no draft model.
+    Find the latest earlier occurrence of the last n tokens in the prompt and the generated tokens,
+    and propose the tokens following it. Longer n-grams are tried first.
+    It works well when the output copies the input, e.g. summarization, RAG and code editing.
+    """
+
+    def __init__(self, max_ngram: int = 3, min_ngram: int = 1):
+        self.max_ngram = max_ngram
+        self.min_ngram = min_ngram
+        # the latest position following each n-gram, and the number of tokens indexed
+        self._indexes: Dict[
+            InferenceRequest, Tuple[Dict[Tuple[int, ...], int], int]
+        ] = {}
+
+    def _lookup(
+        self, req: InferenceRequest, tokens: Sequence[int], num_tokens: int
+    ) -> List[int]:
+        positions, num_indexed = self._indexes.get(req, ({}, 0))
+        # only index the n-grams followed by a token, so the last n-gram finds an earlier one
+        for end in range(max(num_indexed, self.min_ngram), len(tokens)):
+            for n in range(self.min_ngram, min(self.max_ngram, end) + 1):
+                positions[tuple(tokens[end - n : end])] = end
+        self._indexes[req] = (positions, max(num_indexed, len(tokens)))
+        for n in range(min(self.max_ngram, len(tokens) - 1), self.min_ngram - 1, -1):
+            end = positions.get(tuple(tokens[len(tokens) - n :]))  # type: ignore
+            if end is not None:
+                return list(tokens[end : end + num_tokens])
+        return []
+
+    def propose(self, reqs: List[InferenceRequest], num_tokens: int) -> List[List[int]]:
+        # drop the indexes of finished requests
+        self._indexes = {r: self._indexes[r] for r in reqs if r in self._indexes}
+        return [
+            self._lookup(r, r.prompt_tokens + r.new_tokens, num_tokens) for r in reqs
+        ]
+
+
+class DraftModelProposer(SpeculativeProposer):
+    """
+    Propose greedily with a small draft model, which shares the tokenizer of the target model.
+    The draft model has its own KV cache arena, whose slots follow the requests to propose for.
+    """
+
+    def __init__(self, model, max_batch_size: int, pad_token_id: int = 0):
+        self._model = model
+        self._pad_token_id = pad_token_id
+        self._arena = KVCacheArena(max_batch_size)
+        # number of tokens of each request when proposing
+        self._seq_lens: List[int] = []
+
+    def _prefill(self, reqs: List[InferenceRequest]):
+        # all the tokens but the last one, which is fed when proposing
+        seqs = [r.prompt_tokens + r.new_tokens[:-1] for r in reqs]
+        max_len = max(len(seq) for seq in seqs)
+        padding_lens = [max_len - len(seq) for seq in seqs]
+        input_ids = [
+            [self._pad_token_id] * n + seq for n, seq in zip(padding_lens, seqs)
+        ]
+        attention_mask = torch.as_tensor(
+            [[0] * n + [1] * len(seq) for n, seq in zip(padding_lens, seqs)],
+            device=self._model.device,
+        )
+        out = self._model(
+            input_ids=torch.as_tensor(input_ids, device=self._model.device),
+            attention_mask=attention_mask,
+            position_ids=(attention_mask.cumsum(-1) - 1).clamp(min=0),
+            use_cache=True,
+        )
+        self._arena.admit(reqs, convert_to_cache_cls(out.past_key_values), padding_lens)
+
+    def propose(self, reqs: List[InferenceRequest], num_tokens: int) -> List[List[int]]:
+        if not reqs:
+            return []
+        arena = self._arena
+        requests = set(reqs)
+        arena.reorder([r for r in arena.requests if r in requests])
+        in_arena = set(arena.requests)
+        new_reqs = [r for r in reqs if r not in in_arena]
+        if new_reqs:
+            self._prefill(new_reqs)
+        arena.reorder(reqs)
+
+        seqs = [r.prompt_tokens + r.new_tokens for r in reqs]
+        self._seq_lens = [len(seq) for seq in seqs]
+        lengths = arena.get_lengths()
+        # tokens not in the KV cache of the draft model, at least the last token
+        pending = [seq[n:] for seq, n in zip(seqs, lengths)]
+        drafts: List[List[int]] = [[] for _ in reqs]
+        device = self._model.device
+        for _ in range(num_tokens):
+            query_len = max(len(p) for p in pending)
+            # pad on the right, the KV cache of the paddings is dropped below
+            input_ids = [p + [p[-1]] * (query_len - len(p)) for p in pending]
+            position_ids = [list(range(n, n + query_len)) for n in lengths]
+            out = self._model(
+                input_ids=torch.as_tensor(input_ids, device=device),
+                attention_mask=arena.build_attention_mask(query_len),
+                position_ids=torch.as_tensor(position_ids, device=device),
+                past_key_values=arena,
+                use_cache=True,
+            )
+            lengths = [n + len(p) for n, p in zip(lengths, pending)]
+            arena.truncate(lengths)
+            last = torch.as_tensor([len(p) - 1 for p in pending], device=device)
+            tokens = (
+                out.logits[torch.arange(len(reqs), device=device), last]
+                .argmax(dim=-1)
+                .tolist()
+            )
+            for draft, token in zip(drafts, tokens):
+                draft.append(token)
+            pending = [[token] for token in tokens]
+        return drafts
+
+    def accept(self, reqs: List[InferenceRequest], num_accepted: List[int]):
+        # the KV cache of the accepted draft tokens is kept
+        self._arena.truncate([n + a for n, a in zip(self._seq_lens, num_accepted)])
+
+
+class SpeculativeDecoder:
+    """
+    Decode several tokens of a request by one forward of the target model.
+    The last token and the draft tokens of each request are fed together.
+    The first new token is sampled after the last token as usual,
+    and each following one is sampled only if the previous new token matches the draft,
+    so the new tokens are exactly the ones decoded one by one, with any sampling parameters.
+    The KV cache must be a `KVCacheArena`, the KV cache of the rejected tokens is dropped.
+    """
+
+    def __init__(self, proposer: SpeculativeProposer, num_speculative_tokens: int):
+        self.proposer = proposer
+        self.num_speculative_tokens = num_speculative_tokens
+        self.num_proposed_tokens = 0
+        self.num_accepted_tokens = 0
+        # forwards of the target model, and the rows in them which generate tokens
+        self.num_forwards = 0
+        self.num_decoded_rows = 0
+        self.num_generated_tokens = 0
+
+    def decode(
+        self,
+        model,
+        kv_arena: KVCacheArena,
+        reqs: List[InferenceRequest],
+        generate_configs: List,
+    ) -> List[List[int]]:
+        """
+        Run a forward for `reqs`, which are in the order of the slots of `kv_arena`,
+        return the new tokens of each request. Stopped requests have no new tokens.
+        """
+        active = [i for i, r in enumerate(reqs) if not r.stopped]
+        drafts: List[List[int]] = [[] for _ in reqs]
+        if active:
+            proposed = self.proposer.propose(
+                [reqs[i] for i in active], self.num_speculative_tokens
+            )
+            for i, draft in zip(active, proposed):
+                drafts[i] = draft[: self.num_speculative_tokens]
+
+        query_len = 1 + max(len(d) for d in drafts)
+        input_ids = [
+            [r.new_tokens[-1]] + d + [r.new_tokens[-1]] * (query_len - 1 - len(d))
+            for r, d in zip(reqs, drafts)
+        ]
+        position_ids = [
+            list(
+                range(
+                    r.extra_kwargs["max_position_id"] + 1,
+                    r.extra_kwargs["max_position_id"] + 1 + query_len,
+                )
+            )
+            for r in reqs
+        ]
+        device = kv_arena.key_cache[0].device
+        lengths = kv_arena.get_lengths()
+        out = model(
+            input_ids=torch.as_tensor(input_ids, device=device),
+            attention_mask=kv_arena.build_attention_mask(query_len),
+            position_ids=torch.as_tensor(position_ids, device=device),
+            past_key_values=kv_arena,
+            use_cache=True,
+        )
+        logits = out.logits
+
+        new_tokens: List[List[int]] = [[] for _ in reqs]
+        rows = active
+        for j in range(query_len):
+            if not rows:
+                break
+            tokens = _get_tokens_from_logits(
+                [reqs[i] for i in rows],
+                logits[rows, j : j + 1],
+                [generate_configs[i] for i in rows],
+                [new_tokens[i] for i in rows],
+            )
+            # the rows whose draft token is accepted go on
+            next_rows = []
+            for i, token in zip(rows, tokens):
+                new_tokens[i].append(token)
+                if j < len(drafts[i]) and drafts[i][j] == token:
+                    next_rows.append(i)
+            rows = next_rows
+
+        # keep the KV cache of the last token and the accepted draft tokens
+        num_fed = [max(len(t), 1) for t in new_tokens]
+        kv_arena.truncate([n + m for n, m in zip(lengths, num_fed)])
+        for r, m in zip(reqs, num_fed):
+            r.extra_kwargs["max_position_id"] += m
+        num_accepted = [len(new_tokens[i]) - 1 for i in active]
+        if active:
+            self.proposer.accept([reqs[i] for i in active], num_accepted)
+
+        self.num_proposed_tokens += sum(len(d) for d in drafts)
+        self.num_accepted_tokens += sum(num_accepted)
+        self.num_forwards += 1
+        self.num_decoded_rows += len(active)
+        self.num_generated_tokens += sum(len(t) for t in new_tokens)
+        return new_tokens
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "num_proposed_tokens": self.num_proposed_tokens,
+            "num_accepted_tokens": self.num_accepted_tokens,
+            "num_forwards": self.num_forwards,
+            "acceptance_rate": (
+                (self.num_accepted_tokens / self.num_proposed_tokens)
+                if self.num_proposed_tokens
+                else 0.0
+            ),
+            # tokens a request gets from a forward of the target model, 1 without speculation
+            "tokens_per_forward": (
+                (self.num_generated_tokens / self.num_decoded_rows)
+                if self.num_decoded_rows
+                else 0.0
+            ),
+        }
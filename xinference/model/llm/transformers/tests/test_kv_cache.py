@@ -0,0 +1,139 @@
+# Copyright 2022-2025 XProbe Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+import torch
+
+from ....scheduler.request import InferenceRequest
+from ..kv_cache import KVCacheArena
+
+
+@pytest.fixture(scope="module")
+def tiny_model():
+    from transformers import LlamaConfig, LlamaForCausalLM
+
+    torch.manual_seed(0)
+    config = LlamaConfig(
+        vocab_size=128,
+        hidden_size=32,
+        intermediate_size=64,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        max_position_embeddings=512,
+    )
+    return LlamaForCausalLM(config).eval()
+
+
+@torch.inference_mode()
+def _greedy_generate(model, prompt, num_tokens):
+    out = model(input_ids=torch.as_tensor([prompt]), use_cache=True)
+    tokens = [out.logits[0, -1].argmax().item()]
+    past_key_values = out.past_key_values
+    for _ in range(num_tokens - 1):
+        out = model(
+            input_ids=torch.as_tensor([[tokens[-1]]]),
+            past_key_values=past_key_values,
+            use_cache=True,
+        )
+        tokens.append(out.logits[0, -1].argmax().item())
+        past_key_values = out.past_key_values
+    return tokens
+
+
+@torch.inference_mode()
+def _prefill(model, arena, prompts):
+    reqs = []
+    max_len = max(len(p) for p in prompts)
+    input_ids, attention_mask = [], []
+    for prompt in prompts:
+        r = InferenceRequest("", None, True, "generate", None)
+        r.padding_len = max_len - len(prompt)
+        input_ids.append([0] * r.padding_len + prompt)
+        attention_mask.append([0] * r.padding_len + [1] * len(prompt))
+        reqs.append(r)
+    position_ids = (torch.as_tensor(attention_mask).cumsum(-1) - 1).clamp(min=0)
+    out = model(
+        input_ids=torch.as_tensor(input_ids),
+        attention_mask=torch.as_tensor(attention_mask),
+        position_ids=position_ids,
+        use_cache=True,
+    )
+    for i, r in enumerate(reqs):
+        r.append_new_token(out.logits[i, -1].argmax().item())
+        r.extra_kwargs["position"] = len(prompts[i])
+    arena.admit(reqs, out.past_key_values)
+    for r in reqs:
+        r.kv_cache = arena
+    return reqs
+
+
+@torch.inference_mode()
+def _decode(model, arena):
+    reqs = arena.requests
+    out = model(
+        input_ids=torch.as_tensor([[r.new_tokens[-1]] for r in reqs]),
+        attention_mask=arena.build_attention_mask(),
+        position_ids=torch.as_tensor([[r.extra_kwargs["position"]] for r in reqs]),
+        past_key_values=arena,
+        use_cache=True,
+    )
+    for i, r in enumerate(reqs):
+        r.append_new_token(out.logits[i, -1].argmax().item())
+        r.extra_kwargs["position"] += 1
+
+
+def test_kv_cache_arena(tiny_model):
+    torch.manual_seed(0)
+    prompts = [torch.randint(1, 128, (n,)).tolist() for n in (5, 12, 3, 20)]
+    expected = [_greedy_generate(tiny_model, p, 16) for p in prompts]
+
+    # a small capacity to make the buffers grow
+    arena = KVCacheArena(max_batch_size=3, initial_capacity=4)
+    reqs = _prefill(tiny_model, arena, prompts[:2])
+    for _ in range(3):
+        _decode(tiny_model, arena)
+    # admit a request while others are decoding
+    reqs += _prefill(tiny_model, arena, prompts[2:3])
+    assert arena.requests == reqs
+    with pytest.raises(RuntimeError, match="full"):
+        _prefill(tiny_model, arena, prompts[3:])
+    for _ in range(4):
+        _decode(tiny_model, arena)
+
+    # retire the first request, the last slot is moved to the first one
+    reqs[0].stopped = True
+    arena.release_stopped()
+    assert arena.requests == [reqs[2], reqs[1]]
+    reqs += _prefill(tiny_model, arena, prompts[3:])
+    while any(len(r.new_tokens) < 16 for r in arena.requests):
+        _decode(tiny_model, arena)
+        for r in arena.requests:
+            if len(r.new_tokens) >= 16:
+                r.stopped = True
+        arena.release_stopped()
+    assert arena.requests == []
+    assert arena.capacity >= 36
+
+    assert reqs[0].new_tokens == expected[0][: len(reqs[0].new_tokens)]
+    for r, tokens in zip(reqs[1:], expected[1:]):
+        assert r.new_tokens == tokens
+
+    # the buffers are freed, and allocated again by the next requests
+    arena.free()
+    assert arena.capacity == 0 and len(arena) == 0
+    reqs = _prefill(tiny_model, arena, prompts[:1])
+    assert arena.capacity >= len(prompts[0])
+    with pytest.raises(RuntimeError, match="in use"):
+        arena.free()
@@ -0,0 +1,169 @@
+# Copyright 2022-2025 XProbe Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+import torch
+
+from ..prefix_cache import PrefixCache, build_prefix_kv_cache, compact_kv_cache
+
+
+def _fake_kv(tokens, num_layers=2):
+    # KV of a token is the token id itself, so that the copied KV can be checked
+    t = torch.as_tensor(tokens, dtype=torch.float32)
+    kv = t[None, :, None].expand(2, -1, 3).clone()
+    return [kv] * num_layers, [kv + 0.5] * num_layers
+
+
+def _prefix_of(cache, tokens, max_len=None):
+    m = cache.match(tokens, max_len)
+    keys = [torch.zeros(1, 2, m.length, 3) for _ in range(2)]
+    values = [torch.zeros(1, 2, m.length, 3) for _ in range(2)]
+    m.copy_to(keys, values, 0, m.length)
+    return m.length, keys[1][0, 0, :, 0].tolist(), values[1][0, 0, :, 0].tolist()
+
+
+def test_prefix_cache():
+    cache = PrefixCache(max_memory=1 << 20)
+    assert _prefix_of(cache, [1, 2, 3])[0] == 0
+
+    cache.insert([1, 2, 3, 4, 5], *_fake_kv([1, 2, 3, 4, 5]))
+    # split the edge in the middle
+    cache.insert([1, 2, 3, 7], *_fake_kv([1, 2, 3, 7]))
+    assert cache.memory == 2 * 2 * 2 * 6 * 3 * 4
+
+    assert _prefix_of(cache, [1, 2, 3, 4, 5, 6]) == (
+        5,
+        [1, 2, 3, 4, 5],
+        [1.5, 2.5, 3.5, 4.5, 5.5],
+    )
+    assert _prefix_of(cache, [1, 2, 3, 7]) == (4, [1, 2, 3, 7], [1.5, 2.5, 3.5, 7.5])
+    assert _prefix_of(cache, [1, 2, 3, 4, 6])[0] == 4
+    assert _prefix_of(cache, [1, 2, 3, 4, 5], max_len=4)[0] == 4
+    assert _prefix_of(cache, [2, 3])[0] == 0
+
+    stats = cache.stats()
+    assert stats["hits"] == 4
+    assert stats["misses"] == 2
+    assert stats["hit_tokens"] == 17
+
+
+def test_prefix_cache_eviction():
+    token_bytes = 2 * 2 * 2 * 3 * 4
+    cache = PrefixCache(max_memory=8 * token_bytes)
+    cache.insert([1, 2, 3, 4], *_fake_kv([1, 2, 3, 4]))
+    cache.insert([1, 2, 5, 6], *_fake_kv([1, 2, 5, 6]))
+    assert cache.memory == 6 * token_bytes
+
+    # [1, 2, 3, 4] is the most recently used
+    assert _prefix_of(cache, [1, 2, 3, 4])[0] == 4
+    cache.insert([7, 8, 9], *_fake_kv([7, 8, 9]))
+    assert cache.memory == 7 * token_bytes
+    assert _prefix_of(cache, [1, 2, 5, 6])[0] == 2
+    assert _prefix_of(cache, [1, 2, 3, 4])[0] == 4
+
+    # evict the leaves and then their parent
+    cache.insert([10, 11, 12, 13, 14, 15, 16], *_fake_kv(list(range(10, 17))))
+    assert cache.memory <= 8 * token_bytes
+    assert _prefix_of(cache, [1, 2, 3, 4])[0] == 0
+    assert _prefix_of(cache, [10, 11, 12])[0] == 3
+
+    cache.clear()
+    assert cache.memory == 0
+    assert _prefix_of(cache, [10, 11, 12])[0] == 0
+
+
+@pytest.fixture(scope="module")
+def tiny_model():
+    from transformers import LlamaConfig, LlamaForCausalLM
+
+    torch.manual_seed(0)
+    config = LlamaConfig(
+        vocab_size=128,
+        hidden_size=32,
+        intermediate_size=64,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        max_position_embeddings=512,
+    )
+    return LlamaForCausalLM(config).eval()
+
+
+@torch.inference_mode()
+def _prefill(model, prompts, past_key_values=None, cached_lens=None):
+    """
+    Prefill like `PytorchModel.build_prefill_kwargs_with_cached_prefix`.
+    """
+    cached_lens = cached_lens or [0] * len(prompts)
+    prefix_len = max(cached_lens)
+    suffix_len = max(len(p) - n for p, n in zip(prompts, cached_lens))
+    input_ids, attention_mask, position_ids = [], [], []
+    for prompt, n in zip(prompts, cached_lens):
+        suffix = prompt[n:]
+        padding_len = suffix_len - len(suffix)
+        input_ids.append([0] * padding_len + suffix)
+        attention_mask.append(
+            [0] * (prefix_len - n) + [1] * n + [0] * padding_len + [1] * len(suffix)
+        )
+        position_ids.append([0] * padding_len + list(range(n, len(prompt))))
+    out = model(
+        input_ids=torch.as_tensor(input_ids),
+        attention_mask=torch.as_tensor(attention_mask),
+        position_ids=torch.as_tensor(position_ids),
+        past_key_values=past_key_values,
+        use_cache=True,
+    )
+    return out.logits[:, -1], out.past_key_values
+
+
+def test_prefill_with_prefix_cache(tiny_model):
+    torch.manual_seed(1)
+    system = torch.randint(1, 128, (20,)).tolist()
+    prompts = [
+        system + torch.randint(1, 128, (5,)).tolist(),
+        system[:12] + torch.randint(1, 128, (9,)).tolist(),
+        torch.randint(1, 128, (7,)).tolist(),
+        system + torch.randint(1, 128, (1,)).tolist(),
+    ]
+    expected_logits, expected_cache = _prefill(tiny_model, prompts)
+
+    cache = PrefixCache(max_memory=1 << 30)
+    _, kv = _prefill(tiny_model, [system])
+    cache.insert(system, [k[0] for k in kv.key_cache], [v[0] for v in kv.value_cache])
+
+    matches = [cache.match(p, len(p) - 1) for p in prompts]
+    cached_lens = [m.length for m in matches]
+    assert cached_lens == [20, 12, 0, 20]
+    logits, kv = _prefill(
+        tiny_model, prompts, build_prefix_kv_cache(matches), cached_lens
+    )
+    kv = compact_kv_cache(kv, cached_lens, [len(p) for p in prompts])
+
+    torch.testing.assert_close(logits, expected_logits, rtol=1e-4, atol=1e-4)
+    max_len = max(len(p) for p in prompts)
+    for i, p in enumerate(prompts):
+        padding_len = max_len - len(p)
+        for idx in range(len(kv)):
+            torch.testing.assert_close(
+                kv.key_cache[idx][i, :, padding_len:],
+                expected_cache.key_cache[idx][i, :, padding_len:],
+                rtol=1e-4,
+                atol=1e-4,
+            )
+            torch.testing.assert_close(
+                kv.value_cache[idx][i, :, padding_len:],
+                expected_cache.value_cache[idx][i, :, padding_len:],
+                rtol=1e-4,
+                atol=1e-4,
+            )
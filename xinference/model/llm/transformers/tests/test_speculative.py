@@ -0,0 +1,111 @@
+# Copyright 2022-2025 XProbe Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+import torch
+
+from ....scheduler.request import InferenceRequest
+from ..kv_cache import KVCacheArena
+from ..speculative import DraftModelProposer, NgramProposer, SpeculativeDecoder
+from .test_kv_cache import _greedy_generate
+
+
+def _request(prompt, new_tokens=()):
+    r = InferenceRequest("", None, True, "generate", None)
+    r.prompt_tokens = list(prompt)
+    for token in new_tokens:
+        r.append_new_token(token)
+    return r
+
+
+def test_ngram_proposer():
+    proposer = NgramProposer(max_ngram=3)
+    r = _request([1, 2, 3, 4, 5, 9, 2, 3], [4])
+    # the latest occurrence of the longest n-gram
+    assert proposer.propose([r], 2) == [[5, 9]]
+    r.append_new_token(5)
+    r.append_new_token(7)
+    assert proposer.propose([r], 3) == [[]]
+    r.append_new_token(2)
+    assert proposer.propose([r], 3) == [[3, 4, 5]]
+    assert proposer.propose([_request([1, 1, 1])], 4) == [[1]]
+    assert proposer.propose([_request([1])], 4) == [[]]
+
+
+@pytest.fixture(scope="module")
+def tiny_models():
+    from transformers import LlamaConfig, LlamaForCausalLM
+
+    models = []
+    for seed, num_layers in ((0, 2), (1, 1)):
+        torch.manual_seed(seed)
+        config = LlamaConfig(
+            vocab_size=128,
+            hidden_size=32,
+            intermediate_size=64,
+            num_hidden_layers=num_layers,
+            num_attention_heads=4,
+            num_key_value_heads=2,
+            max_position_embeddings=512,
+        )
+        models.append(LlamaForCausalLM(config).eval())
+    return models
+
+
+@torch.inference_mode()
+def _speculative_generate(model, decoder, prompts, num_tokens):
+    arena = KVCacheArena(max_batch_size=len(prompts))
+    reqs = []
+    for prompt in prompts:
+        out = model(input_ids=torch.as_tensor([prompt]), use_cache=True)
+        r = _request(prompt, [out.logits[0, -1].argmax().item()])
+        r.padding_len = 0
+        r.extra_kwargs["max_position_id"] = len(prompt) - 1
+        arena.admit([r], out.past_key_values)
+        r.kv_cache = arena
+        reqs.append(r)
+    # greedy
+    configs = [(0, 1, False, None, set(), 0.0, 1.0, 1.0, -1)] * len(prompts)
+    while any(len(r.new_tokens) < num_tokens for r in reqs):
+        for r, tokens in zip(reqs, decoder.decode(model, arena, reqs, configs)):
+            for token in tokens:
+                if not r.stopped:
+                    r.append_new_token(token)
+                    r.stopped = len(r.new_tokens) == num_tokens
+    return [r.new_tokens for r in reqs]
+
+
+@pytest.mark.parametrize("proposer", ["ngram", "draft"])
+def test_speculative_decoding(tiny_models, proposer):
+    model, draft_model = tiny_models
+    torch.manual_seed(0)
+    # repeated patterns for the prompt lookup
+    prompts = [torch.randint(1, 128, (n,)).tolist() * 3 for n in (5, 2, 7)]
+    expected = [_greedy_generate(model, p, 24) for p in prompts]
+
+    if proposer == "ngram":
+        decoder = SpeculativeDecoder(NgramProposer(), 4)
+    else:
+        decoder = SpeculativeDecoder(DraftModelProposer(draft_model, 3), 4)
+    assert _speculative_generate(model, decoder, prompts, 24) == expected
+    stats = decoder.stats()
+    assert stats["num_forwards"] < 24
+    assert stats["num_accepted_tokens"] <= stats["num_proposed_tokens"]
+    assert stats["tokens_per_forward"] > 1
+
+    if proposer == "draft":
+        # the target model itself as the draft model accepts almost all the draft tokens
+        decoder = SpeculativeDecoder(DraftModelProposer(model, 3), 4)
+        assert _speculative_generate(model, decoder, prompts, 24) == expected
+        assert decoder.stats()["tokens_per_forward"] > 3
@@ -0,0 +1,195 @@
+# Copyright 2022-2025 XProbe Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+import torch
+
+from ....scheduler.request import InferenceRequest
+from ..utils import (
+    IncrementalDetokenizer,
+    _find_stop_str,
+    _get_token_from_logits,
+    _get_tokens_from_logits,
+    _schedule_prefill_chunks,
+)
+
+TEXTS = [
+    "Once upon a time, there was a very old computer.",
+    "你好，世界！这是一个测试。",
+    "Mixed text 混合文本 with emoji 😀 and   spaces",
+]
+
+
+@pytest.fixture(scope="module")
+def tokenizer():
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    from transformers import PreTrainedTokenizerFast
+
+    # A tiny byte-level BPE tokenizer, most non-ASCII characters are split into bytes.
+    tok = Tokenizer(models.BPE())
+    tok.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tok.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(
+        vocab_size=300,
+        initial_alphabet=pre_tokenizers.ByteLevel.alphabet(),
+        special_tokens=["<eos>"],
+    )
+    tok.train_from_iterator(TEXTS[:1] * 10, trainer)
+    return PreTrainedTokenizerFast(tokenizer_object=tok, eos_token="<eos>")
+
+
+def _decode(tokenizer, token_ids):
+    return tokenizer.decode(
+        token_ids,
+        skip_special_tokens=True,
+        spaces_between_special_tokens=False,
+        clean_up_tokenization_spaces=True,
+    )
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_incremental_detokenizer(tokenizer, text):
+    token_ids = tokenizer.encode(text) + [tokenizer.eos_token_id]
+    detokenizer = IncrementalDetokenizer(tokenizer)
+    for i in range(1, len(token_ids) + 1):
+        output = detokenizer.decode(token_ids[:i])
+        assert "�" not in output
+        assert _decode(tokenizer, token_ids[:i]).startswith(output)
+    assert detokenizer.text == _decode(tokenizer, token_ids)
+
+    # decode several tokens at once
+    detokenizer = IncrementalDetokenizer(tokenizer)
+    for i in range(3, len(token_ids) + 3, 3):
+        detokenizer.decode(token_ids[:i])
+    assert detokenizer.text == _decode(tokenizer, token_ids)
+
+
+@pytest.mark.parametrize("text", TEXTS[1:])
+def test_incremental_detokenizer_final(tokenizer, text):
+    token_ids = tokenizer.encode(text)
+    # the streams stopped in the middle of multi-byte characters
+    ends = [
+        i
+        for i in range(1, len(token_ids))
+        if _decode(tokenizer, token_ids[:i]).endswith("�")
+    ]
+    assert ends
+    for end in ends:
+        detokenizer = IncrementalDetokenizer(tokenizer)
+        for i in range(1, end):
+            detokenizer.decode(token_ids[:i])
+        assert detokenizer.decode(token_ids[:end]) != _decode(
+            tokenizer, token_ids[:end]
+        )
+        # the text held back is flushed when the request stops
+        output = detokenizer.decode(token_ids[:end], final=True)
+        assert output == _decode(tokenizer, token_ids[:end])
+
+
+def test_find_stop_str():
+    assert _find_stop_str("hello world", "world") == (6, "world")
+    assert _find_stop_str("hello world", ["foo", "o w"]) == (4, "o w")
+    assert _find_stop_str("hello world", ["foo"]) == (None, None)
+    # stop string crosses the boundary of the searched text
+    assert _find_stop_str("hello world", "world", 8) == (6, "world")
+    assert _find_stop_str("hello world", "hello", 8) == (None, None)
+
+
+def _make_requests(n, vocab_size):
+    reqs = []
+    for i in range(n):
+        r = InferenceRequest("", None, False, "generate", None)
+        r.prompt_tokens = torch.randint(0, vocab_size, (5 + i,)).tolist()
+        r.append_new_token(i)
+        reqs.append(r)
+    return reqs
+
+
+def _config(temperature=1.0, repetition_penalty=1.0, top_p=1.0, top_k=-1):
+    return (16, 2, False, None, set(), temperature, repetition_penalty, top_p, top_k)
+
+
+def test_get_tokens_from_logits():
+    torch.manual_seed(0)
+    vocab_size = 100
+    logits = torch.randn(4, 3, vocab_size)
+    reqs = _make_requests(4, vocab_size)
+
+    last_logits = logits[:, -1, :]
+    configs = [_config(temperature=0.0)] * 4
+    assert (
+        _get_tokens_from_logits(reqs, logits, configs)
+        == last_logits.argmax(dim=-1).tolist()
+    )
+
+    # greedy with repetition penalty is the same as the per-request path
+    configs = [
+        _config(temperature=0.0, repetition_penalty=1.5),
+        _config(top_p=0.0, repetition_penalty=1.1),
+        _config(temperature=0.0, repetition_penalty=1.2, top_k=5),
+        _config(temperature=0.0, repetition_penalty=3.0),
+    ]
+    expected = [
+        _get_token_from_logits(r, i, logits, *c[5:])
+        for i, (r, c) in enumerate(zip(reqs, configs))
+    ]
+    assert _get_tokens_from_logits(reqs, logits, configs) == expected
+
+    configs = [
+        _config(temperature=0.0),
+        _config(temperature=0.7, top_k=1),
+        _config(temperature=1.3, top_k=3),
+        _config(top_p=0.01),
+    ]
+    for _ in range(20):
+        tokens = _get_tokens_from_logits(reqs, logits, configs)
+        assert tokens[0] == last_logits[0].argmax().item()
+        assert tokens[1] == last_logits[1].argmax().item()
+        assert tokens[2] in last_logits[2].topk(3).indices.tolist()
+        assert tokens[3] == last_logits[3].argmax().item()
+
+    # sampled tokens follow the filtered distribution
+    configs = [_config(top_p=0.9, top_k=50)] * 4
+    probs = last_logits.softmax(dim=-1)
+    for _ in range(20):
+        tokens = _get_tokens_from_logits(reqs, logits, configs)
+        for i, token in enumerate(tokens):
+            sorted_probs, sorted_indices = probs[i].sort(descending=True)
+            rank = sorted_indices.tolist().index(token)
+            assert rank < 50
+            assert sorted_probs[:rank].sum() < 0.9
+
+
+def test_schedule_prefill_chunks():
+    from ..prefix_cache import CachedPrefix
+
+    reqs = []
+    for prompt_len, cached_len in [(10, 8), (30, 0), (5, 0)]:
+        r = InferenceRequest("", None, True, "generate", None)
+        r.prompt_tokens = list(range(prompt_len))
+        kv = [torch.zeros(1, cached_len, 1)]
+        r.cached_prefix = CachedPrefix.from_kv(r.prompt_tokens[:cached_len], kv, kv)
+        reqs.append(r)
+
+    scheduled, prefill_lens = _schedule_prefill_chunks(reqs, None)
+    assert scheduled == reqs
+    assert prefill_lens == [10, 30, 5]
+
+    scheduled, prefill_lens = _schedule_prefill_chunks(reqs, 16)
+    assert scheduled == reqs[:2]
+    assert prefill_lens == [10, 14]
+
+    scheduled, prefill_lens = _schedule_prefill_chunks(reqs, 40)
+    assert scheduled == reqs
+    assert prefill_lens == [10, 30, 5]
@@ -113,6 +113,199 @@ def _get_token_from_logits(
     return token
 
 
+def _apply_batch_repetition_penalty(
+    req_list: List[InferenceRequest],
+    scores: torch.Tensor,
+    penalties: List[float],
+    extra_tokens: Optional[List[List[int]]] = None,
+):
+    """
+    Same as `RepetitionPenaltyLogitsProcessor`, but for the rows with different penalties.
+    """
+    rows = [i for i, p in enumerate(penalties) if p > 1.0]
+    if not rows:
+        return
+    seqs = [
+        req_list[i].prompt_tokens
+        + req_list[i].new_tokens
+        + (extra_tokens[i] if extra_tokens is not None else [])
+        for i in rows
+    ]
+    max_len = max(len(seq) for seq in seqs)
+    # pad with the first token of the sequence, duplicated indexes do not change the result
+    token_ids = torch.as_tensor(
+        [seq + [seq[0]] * (max_len - len(seq)) for seq in seqs], device=scores.device
+    )
+    row_index = torch.as_tensor(rows, device=scores.device)
+    penalty = torch.as_tensor(
+        [penalties[i] for i in rows], dtype=scores.dtype, device=scores.device
+    ).unsqueeze(1)
+    row_scores = scores[row_index]
+    score = torch.gather(row_scores, 1, token_ids)
+    score = torch.where(score < 0, score * penalty, score / penalty)
+    scores[row_index] = row_scores.scatter_(1, token_ids, score)
+
+
+def _get_tokens_from_logits(
+    req_list: List[InferenceRequest],
+    logits: torch.Tensor,
+    generate_configs: List,
+    extra_tokens: Optional[List[List[int]]] = None,
+) -> List[int]:
+    """
+    Sample the next tokens for all the requests in one pass,
+    the row `i` of logits is for `req_list[i]`.
+    Temperature, repetition penalty, top_p and top_k are applied in the same order as
+    `prepare_logits_processor`, with per-row parameters.
+    `extra_tokens[i]` are the tokens sampled after the new tokens of `req_list[i]`,
+    which are not appended yet, they are penalized as well.
+    """
+    temperatures = [c[5] for c in generate_configs]
+    penalties = [c[6] for c in generate_configs]
+    top_ps = [c[7] for c in generate_configs]
+    top_ks = [c[8] for c in generate_configs]
+    greedy = [t < 1e-5 or p < 1e-8 for t, p in zip(temperatures, top_ps)]
+
+    scores = logits[:, -1, :]
+    if all(greedy) and all(p <= 1.0 for p in penalties):
+        # fast path, nothing changes the argmax
+        return torch.argmax(scores, dim=-1).tolist()
+
+    scores = scores.float()
+    device = scores.device
+    if any(not g and t != 1.0 for g, t in zip(greedy, temperatures)):
+        temperature = torch.as_tensor(
+            [1.0 if g else t for g, t in zip(greedy, temperatures)], device=device
+        )
+        scores = scores / temperature.unsqueeze(1)
+    else:
+        # the repetition penalty below is applied inplace
+        scores = scores.clone()
+
+    _apply_batch_repetition_penalty(req_list, scores, penalties, extra_tokens)
+
+    is_greedy = torch.as_tensor(greedy, device=device)
+    # top_p and top_k do not change the argmax, only apply them for the sampled rows
+    need_top_p = any(not g and p < 1.0 for g, p in zip(greedy, top_ps))
+    need_top_k = any(not g and k > 0 for g, k in zip(greedy, top_ks))
+    if not need_top_p and not need_top_k:
+        tokens = torch.argmax(scores, dim=-1)
+        if not all(greedy):
+            sampled = torch.multinomial(torch.softmax(scores, dim=-1), num_samples=1)
+            tokens = torch.where(is_greedy, tokens, sampled.squeeze(1))
+        return tokens.tolist()
+
+    vocab_size = scores.shape[-1]
+    if all(g or k > 0 for g, k in zip(greedy, top_ks)):
+        # every sampled row has top_k, only the top scores need to be sorted
+        window = min(max(k for g, k in zip(greedy, top_ks) if not g), vocab_size)
+        sorted_scores, sorted_indices = torch.topk(scores, window, dim=-1)
+    else:
+        window = vocab_size
+        sorted_scores, sorted_indices = torch.sort(scores, descending=True, dim=-1)
+
+    to_remove = torch.zeros_like(sorted_scores, dtype=torch.bool)
+    if need_top_p:
+        # same as `TopPLogitsWarper`, remove the tokens out of the top_p mass,
+        # but always keep the token with the highest probability
+        top_p = torch.as_tensor(
+            [p if not g and p < 1.0 else 1.0 for g, p in zip(greedy, top_ps)],
+            device=device,
+        ).unsqueeze(1)
+        # normalize with all the scores, since the top scores may be a part of them
+        sorted_probs = torch.exp(
+            sorted_scores - torch.logsumexp(scores, dim=-1, keepdim=True)
+        )
+        # the probability mass of the tokens ranked before
+        cum_probs = sorted_probs.cumsum(dim=-1) - sorted_probs
+        to_remove |= (cum_probs >= top_p) & (top_p < 1.0)
+    if need_top_k:
+        top_k = torch.as_tensor(
+            [
+                min(k, window) if not g and k > 0 else window
+                for g, k in zip(greedy, top_ks)
+            ],
+            device=device,
+        ).unsqueeze(1)
+        # ties with the k-th score are kept, the same as `TopKLogitsWarper`
+        kth_score = torch.gather(sorted_scores, 1, top_k - 1)
+        to_remove |= sorted_scores < kth_score
+    sorted_scores = sorted_scores.masked_fill(to_remove, -float("inf"))
+
+    positions = torch.multinomial(torch.softmax(sorted_scores, dim=-1), num_samples=1)
+    # the first one of the sorted scores is the argmax for the greedy rows
+    positions = positions.squeeze(1).masked_fill(is_greedy, 0)
+    tokens = torch.gather(sorted_indices, 1, positions.unsqueeze(1)).squeeze(1)
+    return tokens.tolist()
+
+
+class IncrementalDetokenizer:
+    """
+    Decode generated tokens incrementally, prefix/read-offset style.
+    Only the tokens after `prefix_offset` are decoded at each step,
+    so the cost per step does not grow with the length of the output.
+    The tokens in `[prefix_offset, read_offset)` are decoded as context,
+    which keeps the leading spaces and merged characters of the new text correct.
+    If the new text ends with "�", the last token is an incomplete UTF-8 sequence,
+    it is held back until the following tokens complete it, or the final decode.
+    """
+
+    def __init__(
+        self,
+        tokenizer,
+        skip_special_tokens: bool = True,
+        spaces_between_special_tokens: bool = False,
+        clean_up_tokenization_spaces: bool = True,
+    ):
+        self._tokenizer = tokenizer
+        self._decode_kwargs = dict(
+            skip_special_tokens=skip_special_tokens,
+            spaces_between_special_tokens=spaces_between_special_tokens,
+            clean_up_tokenization_spaces=clean_up_tokenization_spaces,
+        )
+        self._prefix_offset = 0
+        self._read_offset = 0
+        # all the text decoded so far
+        self.text = ""
+
+    def decode(self, token_ids: List[int], final: bool = False) -> str:
+        """
+        Decode the tokens that have not been read yet and return all the text so far.
+        `token_ids` must be the whole generated sequence, which only grows between calls.
+        With `final`, e.g. when the request stops, the text held back is returned as well.
+        """
+        if len(token_ids) <= self._read_offset:
+            return self.text
+        prefix_text = self._tokenizer.decode(
+            token_ids[self._prefix_offset : self._read_offset], **self._decode_kwargs
+        )
+        new_text = self._tokenizer.decode(
+            token_ids[self._prefix_offset :], **self._decode_kwargs
+        )
+        if len(new_text) > len(prefix_text) and (final or not new_text.endswith("�")):
+            self.text += new_text[len(prefix_text) :]
+            self._prefix_offset = self._read_offset
+            self._read_offset = len(token_ids)
+        return self.text
+
+
+def _find_stop_str(
+    text: str, stop_str, start: int = 0
+) -> Tuple[Optional[int], Optional[str]]:
+    """
+    Find the first stop string that appears in `text[start:]`.
+    Return the position and the stop string, or `(None, None)` if nothing found.
+    """
+    if isinstance(stop_str, str):
+        stop_str = [stop_str]
+    for stop in stop_str:
+        # the stop string may cross the boundary of `start`
+        pos = text.find(stop, max(start - len(stop) + 1, 0))
+        if pos != -1:
+            return pos, stop
+    return None, None
+
+
 def _pad_to_max_length(x: List[int], max_len: int, pad: int) -> List[int]:
     assert len(x) <= max_len
     return [pad] * (max_len - len(x)) + x
@@ -211,6 +404,28 @@ def convert_to_cache_cls(cache) -> DynamicCache:
     return cache
 
 
+def _schedule_prefill_chunks(
+    req_list: List[InferenceRequest], chunked_prefill_size: Optional[int]
+) -> Tuple[List[InferenceRequest], List[int]]:
+    """
+    Pick the requests to prefill in this step, in order, and how many tokens of `prefill_tokens`
+    each one has after this step, so that at most `chunked_prefill_size` tokens are prefilled.
+    """
+    if not chunked_prefill_size:
+        return req_list, [len(r.prefill_tokens) for r in req_list]
+    scheduled, prefill_lens = [], []
+    budget = chunked_prefill_size
+    for r in req_list:
+        if budget <= 0:
+            break
+        start = r.cached_prefix.length
+        end = min(len(r.prefill_tokens), start + budget)
+        budget -= end - start
+        scheduled.append(r)
+        prefill_lens.append(end)
+    return scheduled, prefill_lens
+
+
 @torch.inference_mode()
 def _batch_inference_one_step_internal(
     xinf_model_obj: "PytorchModel",
@@ -237,6 +452,11 @@ def _batch_inference_one_step_internal(
     }
     s_time = time.time()
 
+    kv_arena = xinf_model_obj.get_kv_arena()
+    if kv_arena is not None:
+        # free the slots of requests stopped out of the last step, e.g. aborted
+        kv_arena.release_stopped()
+
     prefill_reqs = []
     prompts = []
     decode_reqs = []
@@ -248,25 +468,46 @@ def _batch_inference_one_step_internal(
             decode_reqs.append(r)
 
     if prompts:  # prefill first
-        prefill_kws = xinf_model_obj.build_prefill_kwargs(prompts, prefill_reqs)
+        # the requests resumed from preemption prefill their generated tokens again,
+        # which are not in the prompts
+        with_cached_prefix = xinf_model_obj.prefill_with_cached_prefix() or any(
+            r.new_tokens for r in prefill_reqs
+        )
+        if with_cached_prefix:
+            # only prefill the tokens not in the prefix cache, at most a chunk in a step
+            xinf_model_obj.prepare_prefill_tokens(prompts, prefill_reqs)
+            prefill_reqs, prefill_lens = _schedule_prefill_chunks(
+                prefill_reqs, xinf_model_obj.get_chunked_prefill_size()
+            )
+            prefill_kws = xinf_model_obj.build_prefill_kwargs_with_cached_prefix(
+                prefill_reqs, prefill_lens
+            )
+        else:
+            prefill_kws = xinf_model_obj.build_prefill_kwargs(prompts, prefill_reqs)
         out = model(**prefill_kws, use_cache=True)
 
-        logits = out.logits
+        logits = out.logits[:, -1:]
         past_key_values = convert_to_cache_cls(out.past_key_values)
-
-        for i, r in enumerate(prefill_reqs):
-            (
-                max_new_tokens,
-                stream_interval,
-                include_usage,
-                stop_str,
-                stop_token_ids,
-                temperature,
-                repetition_penalty,
-                top_p,
-                top_k,
-            ) = generate_config_mapping[r]
-
+        if with_cached_prefix:
+            finished, past_key_values = (
+                xinf_model_obj.finish_prefill_with_cached_prefix(
+                    prefill_reqs, prefill_lens, past_key_values
+                )
+            )
+            # the requests not fully prefilled keep waiting for the next chunk
+            prefill_reqs = [prefill_reqs[i] for i in finished]
+            logits = logits[finished]
+
+        # the requests resumed from preemption already have the next token to decode
+        sampled = [i for i, r in enumerate(prefill_reqs) if not r.new_tokens]
+        sampled_reqs = [prefill_reqs[i] for i in sampled]
+        tokens = _get_tokens_from_logits(
+            sampled_reqs,
+            logits[sampled],
+            [generate_config_mapping[r] for r in sampled_reqs],
+        )
+        for r, token in zip(sampled_reqs, tokens):
+            max_new_tokens = generate_config_mapping[r][0]
             if max_new_tokens == 0:
                 # max_tokens not set, we change it to the possible maximum
                 max_new_tokens = xinf_model_obj.get_context_len() - len(r.prompt_tokens)
@@ -275,40 +516,74 @@ def _batch_inference_one_step_internal(
                 generate_config_mapping[r] = tuple(new_gen_conf)
                 logger.debug("No max_tokens set, setting to: %s", max_new_tokens)
 
-            token = _get_token_from_logits(
-                r, i, logits, temperature, repetition_penalty, top_p, top_k
-            )
-            r.is_prefill = False
             r.append_new_token(token)
+        for r in prefill_reqs:
+            r.is_prefill = False
 
-        if decode_reqs:
+        if not prefill_reqs:
+            # no prompt is fully prefilled in this step
+            pass
+        elif kv_arena is not None:
+            # only write the KV cache of new requests to the free slots
+            kv_arena.admit(prefill_reqs, past_key_values)
+            for r in prefill_reqs:
+                r.kv_cache = kv_arena
+        elif decode_reqs:
             decode_kv = decode_reqs[0].kv_cache
             # prefill and decode kv cache need to be merged at `batch_size` and `seq_len` dimensions.
             merged_kv_cache = xinf_model_obj.merge_kv_cache(decode_kv, past_key_values)
-            for r in valid_req_list:
+            for r in prefill_reqs + decode_reqs:
                 r.kv_cache = merged_kv_cache
             empty_cache()
         else:
-            for r in valid_req_list:
+            for r in prefill_reqs:
                 r.kv_cache = past_key_values
 
-    past_key_values = valid_req_list[0].kv_cache
-    stop_token_mapping: Dict[InferenceRequest, int] = {}
+    if kv_arena is not None:
+        # rows of the batch are in the order of slots
+        valid_req_list = kv_arena.requests
+        past_key_values = kv_arena
+    else:
+        # rows of the batch are the prefilled requests and then the decoding ones
+        valid_req_list = [r for r in valid_req_list if not r.is_prefill]
+        if valid_req_list:
+            past_key_values = valid_req_list[0].kv_cache
+    if not valid_req_list:
+        # all the prompts are still being prefilled
+        return
+    speculative_decoder = xinf_model_obj.get_speculative_decoder()
     output_mapping: Dict[InferenceRequest, str] = {}
     # here, only decode phase, just run some rounds
     for _i in range(decode_round):
-        batch_size, seq_len = get_batch_size_and_seq_len_from_kv_cache(
-            past_key_values, xinf_model_obj
-        )
-        decode_tokens: List[List[int]] = [[r.new_tokens[-1]] for r in valid_req_list]
-        inf_kws = xinf_model_obj.build_decode_kwargs(
-            decode_tokens, valid_req_list, batch_size, seq_len
-        )
-        out = model(**inf_kws, use_cache=True, past_key_values=past_key_values)
-        logits = out.logits
-        past_key_values = convert_to_cache_cls(out.past_key_values)
-
-        for i, r in enumerate(valid_req_list):
+        if speculative_decoder is not None:
+            # verify the draft tokens, several tokens of a request may be accepted in a round
+            round_tokens = speculative_decoder.decode(
+                model,
+                past_key_values,
+                valid_req_list,
+                [generate_config_mapping[r] for r in valid_req_list],
+            )
+        else:
+            batch_size, seq_len = get_batch_size_and_seq_len_from_kv_cache(
+                past_key_values, xinf_model_obj
+            )
+            decode_tokens: List[List[int]] = [
+                [r.new_tokens[-1]] for r in valid_req_list
+            ]
+            inf_kws = xinf_model_obj.build_decode_kwargs(
+                decode_tokens, valid_req_list, batch_size, seq_len
+            )
+            out = model(**inf_kws, use_cache=True, past_key_values=past_key_values)
+            logits = out.logits
+            past_key_values = convert_to_cache_cls(out.past_key_values)
+
+            tokens = _get_tokens_from_logits(
+                valid_req_list,
+                logits,
+                [generate_config_mapping[r] for r in valid_req_list],
+            )
+            round_tokens = [[token] for token in tokens]
+        for r, new_tokens in zip(valid_req_list, round_tokens):
             (
                 max_new_tokens,
                 stream_interval,
@@ -321,14 +596,14 @@ def _batch_inference_one_step_internal(
                 top_k,
             ) = generate_config_mapping[r]
 
-            token = _get_token_from_logits(
-                r, i, logits, temperature, repetition_penalty, top_p, top_k
-            )
             r.kv_cache = past_key_values
-            r.append_new_token(token)
-
+            num_tokens = len(r.new_tokens)
             output = None
-            if not r.stopped:
+            for token in new_tokens:
+                # the tokens after stopping are dropped
+                if r.stopped:
+                    break
+                r.append_new_token(token)
                 stopped = token in stop_token_ids
 
                 if stopped:
@@ -341,45 +616,41 @@ def _batch_inference_one_step_internal(
 
                 # handle stop str
                 if stop_str and r not in output_mapping:
-                    output = tokenizer.decode(
-                        r.new_tokens,
-                        skip_special_tokens=True,
-                        spaces_between_special_tokens=False,
-                        clean_up_tokenization_spaces=True,
-                    )
-                    if isinstance(stop_str, str):
-                        stop_str = [stop_str]
-                    for stop in stop_str:
-                        pos = output.rfind(stop)
-                        if pos != -1:
-                            output = output[:pos]
-                            output_mapping[r] = output
-                            stopped = True
-                            finish_reason = "stop"
-                            break
+                    if r.detokenizer is None:
+                        r.detokenizer = IncrementalDetokenizer(tokenizer)
+                    # only the newly decoded text needs to be searched
+                    searched_len = len(r.detokenizer.text)
+                    output = r.detokenizer.decode(r.new_tokens)
+                    pos, _ = _find_stop_str(output, stop_str, searched_len)
+                    if pos is not None:
+                        output = output[:pos]
+                        output_mapping[r] = output
+                        stopped = True
+                        finish_reason = "stop"
 
                 r.stopped = stopped
                 r.finish_reason = finish_reason
 
-            if r.stopped and r not in stop_token_mapping:
-                stop_token_mapping[r] = _i + 1
-
             if r.stream:
                 """
                 Note that you can't just decode based on the newest r.new_tokens here,
                 which may destroy the integrity of the parsed characters,
                 and at the same time is not good at handling some special characters.
-                So the implementation here is to decode all the tokens that have been generated each time,
-                and then take the slice.
+                So the implementation here is to decode the tokens incrementally with some context tokens,
+                holding back the incomplete characters, and then take the slice.
                 """
-                if r.stopped or len(r.new_tokens) % stream_interval == 0:
-                    if output is None:
-                        output = tokenizer.decode(
-                            r.new_tokens,
-                            skip_special_tokens=True,
-                            spaces_between_special_tokens=False,
-                            clean_up_tokenization_spaces=True,
-                        )
+                if (
+                    r.stopped
+                    or len(r.new_tokens) // stream_interval
+                    > num_tokens // stream_interval
+                ):
+                    if r in output_mapping:
+                        output = output_mapping[r]
+                    elif output is None or r.stopped:
+                        if r.detokenizer is None:
+                            r.detokenizer = IncrementalDetokenizer(tokenizer)
+                        # the text held back is flushed by the final decode
+                        output = r.detokenizer.decode(r.new_tokens, final=r.stopped)
 
                     if r.last_output_length == 0:
                         r.completion.append(bos_flag)
@@ -436,14 +707,11 @@ def _batch_inference_one_step_internal(
             else:
                 # last round, handle non-stream result
                 if r.stopped and _i == decode_round - 1:
-                    invalid_token_num = (
-                        (decode_round - stop_token_mapping[r] + 1)
-                        if r.finish_reason == "stop"
-                        else (decode_round - stop_token_mapping[r])
-                    )
+                    # the stop token is not in the output
+                    invalid_token_num = 1 if r.finish_reason == "stop" else 0
                     outputs = (
                         tokenizer.decode(
-                            r.new_tokens[:-invalid_token_num],
+                            r.new_tokens[: len(r.new_tokens) - invalid_token_num],
                             skip_special_tokens=True,
                             spaces_between_special_tokens=False,
                             clean_up_tokenization_spaces=True,
@@ -465,6 +733,8 @@ def _batch_inference_one_step_internal(
     logger.debug(
         f"Average throughput for a step: {(len(valid_req_list) * decode_round + len(prompts)) / (e_time - s_time)} token/s."
     )
+    if speculative_decoder is not None:
+        logger.debug("Speculative decoding stats: %s", speculative_decoder.stats())
 
 
 def batch_inference_one_step(
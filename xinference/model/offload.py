@@ -0,0 +1,140 @@
+# Copyright 2022-2025 XProbe Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import itertools
+import logging
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import torch
+
+logger = logging.getLogger(__name__)
+
+
+def find_torch_modules(*objs: Any) -> List["torch.nn.Module"]:
+    """
+    The torch modules of the objects, which are modules, diffusers pipelines,
+    or wrappers of a module in `model`, e.g. the models of FlagEmbedding and CrossEncoder.
+    """
+    import torch
+
+    modules: Dict[int, "torch.nn.Module"] = {}
+
+    def _add(obj: Any, depth: int):
+        if obj is None or depth > 2:
+            return
+        if isinstance(obj, torch.nn.Module):
+            modules.setdefault(id(obj), obj)
+            return
+        components = getattr(obj, "components", None)
+        if isinstance(components, dict):
+            for component in components.values():
+                _add(component, depth + 1)
+            return
+        _add(getattr(obj, "model", None), depth + 1)
+
+    for obj in objs:
+        _add(obj, 0)
+    return list(modules.values())
+
+
+class WeightOffloader:
+    """
+    Move the parameters and buffers of torch modules to the host memory,
+    pinned if CUDA is available so that they are copied back fast,
+    and restore them to their devices later.
+    """
+
+    def __init__(self, modules: List["torch.nn.Module"]):
+        self._modules = modules
+        # the offloaded tensors and their devices
+        self._devices: List[Tuple["torch.Tensor", "torch.device"]] = []
+
+    def offload(self) -> int:
+        """
+        Return the bytes offloaded.
+        """
+        import torch
+
+        from ..device_utils import empty_cache
+
+        pin_memory = torch.cuda.is_available()
+        seen = set()
+        nbytes = 0
+        for module in self._modules:
+            for tensor in itertools.chain(module.parameters(), module.buffers()):
+                if id(tensor) in seen or tensor.device.type in ("cpu", "meta"):
+                    continue
+                seen.add(id(tensor))
+                host = torch.empty_like(
+                    tensor.data, device="cpu", pin_memory=pin_memory
+                )
+                host.copy_(tensor.data)
+                self._devices.append((tensor, tensor.device))
+                tensor.data = host
+                nbytes += host.numel() * host.element_size()
+        empty_cache()
+        return nbytes
+
+    def restore(self):
+        import torch
+
+        for tensor, device in self._devices:
+            tensor.data = tensor.data.to(device, non_blocking=True)
+        if self._devices and torch.cuda.is_available():
+            torch.cuda.synchronize()
+        self._devices = []
+
+
+class SleepModelMixin:
+    """
+    Let a model sleep with its weights in the host memory, which frees the device memory,
+    and wake up without loading the weights from disk again.
+    """
+
+    _offloader: Optional[WeightOffloader] = None
+
+    def _get_sleep_targets(self) -> List[Any]:
+        return [getattr(self, "_model", None)]
+
+    def _free_device_caches(self):
+        """
+        Free the caches on the device besides the weights, e.g. the KV cache,
+        which are rebuilt by the requests after waking up.
+        """
+
+    def is_sleeping(self) -> bool:
+        return self._offloader is not None
+
+    def sleep(self):
+        if self._offloader is not None:
+            return
+        modules = find_torch_modules(*self._get_sleep_targets())
+        if not modules:
+            raise ValueError(f"{type(self).__name__} has no torch modules to offload")
+        self._free_device_caches()
+        offloader = WeightOffloader(modules)
+        try:
+            nbytes = offloader.offload()
+        except Exception:
+            offloader.restore()
+            raise
+        self._offloader = offloader
+        logger.info("%.2f MiB of weights are offloaded to host", nbytes / 1024**2)
+
+    def wake(self):
+        if self._offloader is None:
+            return
+        self._offloader.restore()
+        self._offloader = None
@@ -0,0 +1,99 @@
+# Copyright 2022-2025 XProbe Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+from typing import TYPE_CHECKING, List, Optional
+
+from ...types import Rerank
+from ..batch import DEFAULT_BATCH_WAIT_TIME, BatchRequest, RequestBatcher, get_batch_key
+from .core import RerankInput
+
+if TYPE_CHECKING:
+    from .core import RerankModel
+
+# seconds the first request of a batch waits for others to join
+DEFAULT_RERANK_BATCH_WAIT_TIME = DEFAULT_BATCH_WAIT_TIME
+
+
+class RerankBatcher(RequestBatcher):
+    """
+    Merge concurrent `rerank` requests into batches,
+    so that one forward scores the query-document pairs of many small requests.
+
+    A batch holds about `max_batch_size` pairs.
+    The requests with the same arguments are reranked together by `RerankModel.rerank_batch`,
+    and the tokens of a batch are shared among the requests by the length of their pairs.
+    """
+
+    def __init__(
+        self,
+        model: "RerankModel",
+        max_batch_size: int,
+        max_wait_time: float = DEFAULT_RERANK_BATCH_WAIT_TIME,
+    ):
+        super().__init__(max_batch_size, max_wait_time)
+        self._model = model
+
+    async def rerank(
+        self,
+        documents: List[str],
+        query: str,
+        top_n: Optional[int],
+        max_chunks_per_doc: Optional[int],
+        return_documents: Optional[bool],
+        return_len: Optional[bool],
+        **kwargs,
+    ) -> Rerank:
+        kwargs = dict(kwargs, max_chunks_per_doc=max_chunks_per_doc)
+        if not documents or get_batch_key(kwargs) is None:
+            return await self._run_model(
+                self._model.rerank,
+                documents,
+                query,
+                top_n,
+                return_documents=return_documents,
+                return_len=return_len,
+                **kwargs,
+            )
+        future = asyncio.get_running_loop().create_future()
+        inputs = RerankInput(documents, query, top_n, return_documents, return_len)
+        return await self._submit(BatchRequest(inputs, len(documents), kwargs, future))
+
+    async def _run_group(self, reqs: List[BatchRequest]):
+        try:
+            results = await self._run_model(
+                self._model.rerank_batch, [r.inputs for r in reqs], **reqs[0].kwargs
+            )
+        except Exception:
+            # requests in a failed batch are reranked alone,
+            # so that a bad input fails only its own request
+            for r in reqs:
+                if r.future.done():
+                    continue
+                try:
+                    r.future.set_result(
+                        (
+                            await self._run_model(
+                                self._model.rerank_batch, [r.inputs], **r.kwargs
+                            )
+                        )[0]
+                    )
+                except Exception as e:
+                    r.future.set_exception(e)
+            return
+        self.num_batches += 1
+        self._update_stat("batch_size", sum(r.size for r in reqs))
+        for r, result in zip(reqs, results):
+            if not r.future.done():
+                r.future.set_result(result)
@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
 import gc
 import logging
 import os
@@ -19,17 +20,25 @@ import threading
 import uuid
 from collections import defaultdict
 from collections.abc import Sequence
-from typing import Dict, List, Literal, Optional
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, Dict, List, Literal, Optional, Tuple
 
 import numpy as np
 import torch
 import torch.nn as nn
 
 from ...device_utils import empty_cache
-from ...types import Document, DocumentObj, Rerank, RerankTokens
+from ...types import Document, DocumentObj, Meta, Rerank, RerankTokens
+from ..batch import split_tokens
 from ..core import CacheableModelSpec, VirtualEnvSettings
+from ..offload import SleepModelMixin
+from ..shared_weights import SharedWeightsMixin
 from ..utils import ModelInstanceInfoMixin, is_flash_attn_available
-from .utils import preprocess_sentence
+from .score_cache import DEFAULT_SCORE_CACHE_TTL, RerankScoreCache, get_score_key
+from .utils import get_chunk_spans, get_token_batches, preprocess_sentence
+
+if TYPE_CHECKING:
+    from .batch import RerankBatcher
 
 logger = logging.getLogger(__name__)
 
@@ -38,6 +47,17 @@ logger = logging.getLogger(__name__)
 RERANK_MODEL_DESCRIPTIONS: Dict[str, List[Dict]] = defaultdict(list)
 RERANK_EMPTY_CACHE_COUNT = int(os.getenv("XINFERENCE_RERANK_EMPTY_CACHE_COUNT", "10"))
 assert RERANK_EMPTY_CACHE_COUNT > 0
+# tokens of a batch when the free memory of the device is unknown
+DEFAULT_RERANK_BATCH_TOKENS = 16384
+MIN_RERANK_BATCH_TOKENS = 512
+MAX_RERANK_BATCH_TOKENS = 1 << 20
+# fraction of the free memory used by the activations of a batch
+RERANK_BATCH_MEMORY_FRACTION = 0.5
+# activations of a token in the hidden size, a rough upper bound of the peak of a layer
+RERANK_ACTIVATION_FACTOR = 16
+# tokens shared by the adjacent chunks of a document, see `max_chunks_per_doc`
+DEFAULT_RERANK_CHUNK_OVERLAP = 32
+RERANK_CHUNK_POOLINGS = ["max", "mean"]
 
 
 def get_rerank_model_descriptions():
@@ -120,7 +140,16 @@ class _ModelWrapper(nn.Module):
             return getattr(self.model, attr)
 
 
-class RerankModel:
+@dataclass
+class RerankInput:
+    documents: List[str]
+    query: str
+    top_n: Optional[int] = None
+    return_documents: Optional[bool] = None
+    return_len: Optional[bool] = None
+
+
+class RerankModel(SleepModelMixin, SharedWeightsMixin):
     def __init__(
         self,
         model_spec: RerankModelFamilyV2,
@@ -136,12 +165,45 @@ class RerankModel:
         self._model_path = model_path
         self._device = device
         self._model_config = model_config or dict()
+        # tokens of a batch, adapted to the free memory if not set
+        self._max_batch_tokens = self._model_config.pop("max_batch_tokens", None)
+        score_cache_size = self._model_config.pop("score_cache_size", None)
+        score_cache_ttl = self._model_config.pop(
+            "score_cache_ttl", DEFAULT_SCORE_CACHE_TTL
+        )
+        self._score_cache = (
+            RerankScoreCache(int(score_cache_size), float(score_cache_ttl))
+            if score_cache_size
+            else None
+        )
+        self._batcher = self._create_batcher(self._model_config)
+        # the replicas on the same node share the weights on CPU
+        self._share_weights = bool(self._model_config.pop("share_weights", False))
         self._use_fp16 = use_fp16
         self._model = None
+        self._tokenizer = None
         self._counter = 0
         if model_spec.type == "unknown":
             model_spec.type = self._auto_detect_type(model_path)
 
+    def _create_batcher(self, model_config: Dict) -> Optional["RerankBatcher"]:
+        # `max_batch_pairs` > 1 at launch enables merging concurrent requests
+        max_batch_pairs = model_config.pop("max_batch_pairs", None)
+        max_wait_time = model_config.pop("max_batch_wait_time", None)
+        if max_batch_pairs is None or int(max_batch_pairs) <= 1:
+            return None
+        from .batch import DEFAULT_RERANK_BATCH_WAIT_TIME, RerankBatcher
+
+        return RerankBatcher(
+            self,
+            int(max_batch_pairs),
+            (
+                float(max_wait_time)
+                if max_wait_time is not None
+                else DEFAULT_RERANK_BATCH_WAIT_TIME
+            ),
+        )
+
     @staticmethod
     def _get_tokenizer(model_path):
         from transformers import AutoTokenizer
@@ -212,6 +274,7 @@ class RerankModel:
             )
             if self._use_fp16:
                 self._model.model.half()
+            self._tokenizer = self._model.tokenizer
         elif "qwen3" in self._model_spec.model_name.lower():
             # qwen3-reranker
             # now we use transformers
@@ -250,7 +313,7 @@ class RerankModel:
             prefix_tokens = tokenizer.encode(prefix, add_special_tokens=False)
             suffix_tokens = tokenizer.encode(suffix, add_special_tokens=False)
 
-            def process_inputs(pairs):
+            def tokenize_pairs(pairs):
                 inputs = tokenizer(
                     pairs,
                     padding=False,
@@ -258,10 +321,16 @@ class RerankModel:
                     return_attention_mask=False,
                     max_length=max_length - len(prefix_tokens) - len(suffix_tokens),
                 )
-                for i, ele in enumerate(inputs["input_ids"]):
-                    inputs["input_ids"][i] = prefix_tokens + ele + suffix_tokens
+                return [
+                    prefix_tokens + ele + suffix_tokens for ele in inputs["input_ids"]
+                ]
+
+            def pad_inputs(input_ids):
                 inputs = tokenizer.pad(
-                    inputs, padding=True, return_tensors="pt", max_length=max_length
+                    {"input_ids": input_ids},
+                    padding=True,
+                    return_tensors="pt",
+                    max_length=max_length,
                 )
                 for key in inputs:
                     inputs[key] = inputs[key].to(model.device)
@@ -280,7 +349,9 @@ class RerankModel:
                 scores = batch_scores[:, 1].exp().tolist()
                 return scores
 
-            self.process_inputs = process_inputs
+            self._tokenizer = tokenizer
+            self.tokenize_pairs = tokenize_pairs
+            self.pad_inputs = pad_inputs
             self.compute_logits = compute_logits
         else:
             try:
@@ -301,89 +372,227 @@ class RerankModel:
 
                 raise ImportError(f"{error_message}\n\n{''.join(installation_guide)}")
             self._model = FlagReranker(self._model_path, use_fp16=self._use_fp16)
+            self._tokenizer = self._model.tokenizer
         # Wrap transformers model to record number of tokens
         self._model.model = _ModelWrapper(self._model.model)
 
-    def rerank(
-        self,
-        documents: List[str],
-        query: str,
-        top_n: Optional[int],
-        max_chunks_per_doc: Optional[int],
-        return_documents: Optional[bool],
-        return_len: Optional[bool],
-        **kwargs,
-    ) -> Rerank:
+    def _is_cross_encoder(self) -> bool:
+        return (
+            self._model_spec.type == "normal"
+            and "qwen3" not in self._model_spec.model_name.lower()
+        )
+
+    def _get_max_batch_tokens(self) -> int:
+        """
+        The padded tokens of a batch, derived from the free memory of the device,
+        which is checked before every request as other models may share the device.
+        """
+        if self._max_batch_tokens:
+            return int(self._max_batch_tokens)
         assert self._model is not None
-        if max_chunks_per_doc is not None:
-            raise ValueError("rerank hasn't support `max_chunks_per_doc` parameter.")
-        logger.info("Rerank with kwargs: %s, model: %s", kwargs, self._model)
+        model = self._model.model
+        try:
+            param = next(model.parameters())
+        except (AttributeError, StopIteration):
+            return DEFAULT_RERANK_BATCH_TOKENS
+        if param.device.type != "cuda":
+            return DEFAULT_RERANK_BATCH_TOKENS
+        free, _ = torch.cuda.mem_get_info(param.device)
+        config = getattr(model, "config", None)
+        hidden_size = getattr(config, "hidden_size", 1024)
+        token_size = hidden_size * RERANK_ACTIVATION_FACTOR
+        if not self._is_cross_encoder():
+            # LLM-based rerankers compute the logits of the vocabulary
+            token_size += getattr(config, "vocab_size", 0)
+        max_tokens = int(
+            free * RERANK_BATCH_MEMORY_FRACTION / (token_size * param.element_size())
+        )
+        return min(max(max_tokens, MIN_RERANK_BATCH_TOKENS), MAX_RERANK_BATCH_TOKENS)
 
-        pre_query = preprocess_sentence(
-            query, kwargs.get("instruction", None), self._model_spec.model_name
+    def _get_max_length(self) -> Optional[int]:
+        return getattr(self._model_spec, "max_tokens", None) or getattr(
+            self._tokenizer, "model_max_length", None
         )
-        sentence_combinations = [[pre_query, doc] for doc in documents]
-        # reset n tokens
-        self._model.model.n_tokens = 0
-        if (
-            self._model_spec.type == "normal"
-            and "qwen3" not in self._model_spec.model_name.lower()
-        ):
-            logger.debug("Passing processed sentences: %s", sentence_combinations)
-            similarity_scores = self._model.predict(
-                sentence_combinations,
-                convert_to_numpy=False,
-                convert_to_tensor=True,
-                **kwargs,
-            ).cpu()
-            if similarity_scores.dtype == torch.bfloat16:
-                similarity_scores = similarity_scores.float()
-        elif "qwen3" in self._model_spec.model_name.lower():
 
-            def format_instruction(instruction, query, doc):
-                if instruction is None:
-                    instruction = "Given a web search query, retrieve relevant passages that answer the query"
-                output = "<Instruct>: {instruction}\n<Query>: {query}\n<Document>: {doc}".format(
-                    instruction=instruction, query=query, doc=doc
+    def _get_pair_lengths(self, pairs: List[List[str]]) -> List[int]:
+        tokenizer = self._tokenizer
+        assert tokenizer is not None
+        max_length = self._get_max_length()
+        input_ids = tokenizer(
+            [q for q, _ in pairs],
+            [d for _, d in pairs],
+            truncation=max_length is not None,
+            max_length=max_length,
+        )["input_ids"]
+        return [len(ids) for ids in input_ids]
+
+    def _get_query_length(self, query: str, instruction: Optional[str]) -> int:
+        # the tokens of a pair with an empty document
+        if "qwen3" in self._model_spec.model_name.lower():
+            return len(
+                self.tokenize_pairs([self._format_qwen3_pair(query, "", instruction)])[
+                    0
+                ]
+            )
+        pre_query = preprocess_sentence(query, instruction, self._model_spec.model_name)
+        return self._get_pair_lengths([[pre_query, ""]])[0]
+
+    def _chunk_documents(
+        self,
+        query: str,
+        documents: List[str],
+        max_chunks_per_doc: int,
+        overlap: int,
+        instruction: Optional[str],
+    ) -> Tuple[List[str], List[int]]:
+        """
+        Split the documents which do not fit the model with the query
+        into at most `max_chunks_per_doc` overlapping chunks.
+        Return the chunks and the index of the document of each chunk.
+        """
+        max_length = self._get_max_length()
+        if max_length is None:
+            return documents, list(range(len(documents)))
+        chunk_tokens = max_length - self._get_query_length(query, instruction)
+        if chunk_tokens <= 0:
+            raise ValueError(
+                f"The query is too long to rerank, the max length is {max_length} tokens"
+            )
+        overlap = min(overlap, chunk_tokens // 2)
+        tokenizer = self._tokenizer
+        assert tokenizer is not None
+        is_fast = getattr(tokenizer, "is_fast", False)
+        encoded = tokenizer(
+            documents,
+            add_special_tokens=False,
+            return_offsets_mapping=is_fast,
+        )
+        chunks: List[str] = []
+        doc_indices: List[int] = []
+        for i, doc in enumerate(documents):
+            input_ids = encoded["input_ids"][i]
+            spans = get_chunk_spans(
+                len(input_ids), chunk_tokens, overlap, max_chunks_per_doc
+            )
+            if len(spans) == 1 and spans[0][1] == len(input_ids):
+                chunks.append(doc)
+            elif is_fast:
+                offsets = encoded["offset_mapping"][i]
+                chunks.extend(
+                    doc[offsets[start][0] : offsets[end - 1][1]] for start, end in spans
                 )
-                return output
-
-            # reduce memory usage.
-            micro_bs = 4
-            similarity_scores = []
-            for i in range(0, len(documents), micro_bs):
-                sub_docs = documents[i : i + micro_bs]
-                pairs = [
-                    format_instruction(kwargs.get("instruction", None), query, doc)
-                    for doc in sub_docs
+            else:
+                chunks.extend(
+                    tokenizer.decode(input_ids[start:end]) for start, end in spans
+                )
+            doc_indices.extend([i] * (len(chunks) - len(doc_indices)))
+        return chunks, doc_indices
+
+    @staticmethod
+    def _format_qwen3_pair(query: str, doc: str, instruction: Optional[str]) -> str:
+        if instruction is None:
+            instruction = "Given a web search query, retrieve relevant passages that answer the query"
+        return f"<Instruct>: {instruction}\n<Query>: {query}\n<Document>: {doc}"
+
+    def _preprocess_pairs(
+        self, pairs: List[Tuple[str, str]], instruction: Optional[str]
+    ) -> List[List[str]]:
+        pre_queries = {
+            query: preprocess_sentence(query, instruction, self._model_spec.model_name)
+            for query in {query for query, _ in pairs}
+        }
+        return [[pre_queries[query], doc] for query, doc in pairs]
+
+    def _score_pairs(self, pairs: List[Tuple[str, str]], **kwargs) -> List[float]:
+        """
+        Score the query-document pairs.
+        The pairs are sorted by length and packed into batches under the token budget,
+        and the scores are returned in the order of the pairs.
+        """
+        if not pairs:
+            return []
+        kwargs.pop("batch_size", None)
+        instruction = kwargs.get("instruction", None)
+        score_batch: Callable[[List[int]], List[float]]
+        if self._is_cross_encoder():
+            pre_pairs = self._preprocess_pairs(pairs, instruction)
+            lengths = self._get_pair_lengths(pre_pairs)
+
+            def score_batch(batch):
+                batch_pairs = [pre_pairs[i] for i in batch]
+                logger.debug("Passing processed sentences: %s", batch_pairs)
+                scores = self._model.predict(
+                    batch_pairs,
+                    batch_size=len(batch),
+                    convert_to_numpy=False,
+                    convert_to_tensor=True,
+                    **kwargs,
+                )
+                return scores.float().cpu().tolist()
+
+        elif "qwen3" in self._model_spec.model_name.lower():
+            input_ids = self.tokenize_pairs(
+                [
+                    self._format_qwen3_pair(query, doc, instruction)
+                    for query, doc in pairs
                 ]
-                # Tokenize the input texts
-                inputs = self.process_inputs(pairs)
-                similarity_scores.extend(self.compute_logits(inputs))
-        else:
-            # Related issue: https://github.com/xorbitsai/inference/issues/1775
-            similarity_scores = self._model.compute_score(
-                sentence_combinations, **kwargs
             )
+            lengths = [len(ids) for ids in input_ids]
 
-            if not isinstance(similarity_scores, Sequence):
-                similarity_scores = [similarity_scores]
-            elif (
-                isinstance(similarity_scores, list)
-                and len(similarity_scores) > 0
-                and isinstance(similarity_scores[0], Sequence)
-            ):
-                similarity_scores = similarity_scores[0]
+            def score_batch(batch):
+                return self.compute_logits(
+                    self.pad_inputs([input_ids[i] for i in batch])
+                )
 
+        else:
+            pre_pairs = self._preprocess_pairs(pairs, instruction)
+            lengths = self._get_pair_lengths(pre_pairs)
+
+            def score_batch(batch):
+                # Related issue: https://github.com/xorbitsai/inference/issues/1775
+                scores = self._model.compute_score(
+                    [pre_pairs[i] for i in batch], batch_size=len(batch), **kwargs
+                )
+                if not isinstance(scores, Sequence):
+                    scores = [scores]
+                elif (
+                    isinstance(scores, list)
+                    and len(scores) > 0
+                    and isinstance(scores[0], Sequence)
+                ):
+                    scores = scores[0]
+                return scores
+
+        scores = [0.0] * len(pairs)
+        for batch in get_token_batches(lengths, self._get_max_batch_tokens()):
+            for i, score in zip(batch, score_batch(batch)):
+                scores[i] = float(score)
+        return scores
+
+    def _score(self, query: str, documents: List[str], **kwargs) -> List[float]:
+        """
+        Score the documents against the query, in the order of the documents.
+        """
+        return self._score_pairs([(query, doc) for doc in documents], **kwargs)
+
+    def get_score_cache(self) -> Optional[RerankScoreCache]:
+        return self._score_cache
+
+    def get_batcher(self) -> Optional["RerankBatcher"]:
+        return self._batcher
+
+    def _build_result(
+        self, inputs: RerankInput, similarity_scores: List[float], input_len: int
+    ) -> Rerank:
         sim_scores_argsort = list(reversed(np.argsort(similarity_scores)))
-        if top_n is not None:
-            sim_scores_argsort = sim_scores_argsort[:top_n]
-        if return_documents:
+        if inputs.top_n is not None:
+            sim_scores_argsort = sim_scores_argsort[: inputs.top_n]
+        if inputs.return_documents:
             docs = [
                 DocumentObj(
                     index=int(arg),
                     relevance_score=float(similarity_scores[arg]),
-                    document=Document(text=documents[arg]),
+                    document=Document(text=inputs.documents[arg]),
                 )
                 for arg in sim_scores_argsort
             ]
@@ -396,24 +605,113 @@ class RerankModel:
                 )
                 for arg in sim_scores_argsort
             ]
-        if return_len:
-            input_len = self._model.model.n_tokens
+        if inputs.return_len:
             # Rerank Model output is just score or documents
             # while return_documents = True
             output_len = input_len
 
         # api_version, billed_units, warnings
         # is for Cohere API compatibility, set to None
-        metadata = {
-            "api_version": None,
-            "billed_units": None,
-            "tokens": (
+        metadata = Meta(
+            api_version=None,
+            billed_units=None,
+            tokens=(
                 RerankTokens(input_tokens=input_len, output_tokens=output_len)
-                if return_len
+                if inputs.return_len
                 else None
             ),
-            "warnings": None,
-        }
+            warnings=None,
+        )
+        return Rerank(id=str(uuid.uuid1()), results=docs, meta=metadata)
+
+    def rerank_batch(
+        self,
+        inputs: List[RerankInput],
+        max_chunks_per_doc: Optional[int] = None,
+        **kwargs,
+    ) -> List[Rerank]:
+        """
+        Rerank the documents of several queries with the same arguments.
+        The documents not in the score cache of all the queries are scored together,
+        and the tokens are shared among the queries by the length of their pairs.
+        """
+        assert self._model is not None
+        use_score_cache = kwargs.pop("use_score_cache", True)
+        chunk_overlap = int(kwargs.pop("chunk_overlap", DEFAULT_RERANK_CHUNK_OVERLAP))
+        chunk_pooling = kwargs.pop("chunk_pooling", "max")
+        if max_chunks_per_doc is not None and max_chunks_per_doc < 1:
+            raise ValueError("`max_chunks_per_doc` must be a positive integer.")
+        if chunk_pooling not in RERANK_CHUNK_POOLINGS:
+            raise ValueError(
+                f"Unsupported chunk pooling: {chunk_pooling}, "
+                f"must be one of {', '.join(RERANK_CHUNK_POOLINGS)}"
+            )
+        logger.info("Rerank with kwargs: %s, model: %s", kwargs, self._model)
+
+        cache = self._score_cache if use_score_cache else None
+        args = dict(
+            kwargs,
+            max_chunks_per_doc=max_chunks_per_doc,
+            chunk_overlap=chunk_overlap,
+            chunk_pooling=chunk_pooling,
+        )
+        keys: List[List[Tuple[bytes, bytes, bytes]]] = []
+        similarity_scores: List[List[Optional[float]]] = []
+        for inp in inputs:
+            if cache is None:
+                keys.append([])
+                similarity_scores.append([None] * len(inp.documents))
+            else:
+                keys.append(
+                    [
+                        get_score_key(self._model_uid, args, inp.query, d)
+                        for d in inp.documents
+                    ]
+                )
+                similarity_scores.append([cache.get(key) for key in keys[-1]])
+
+        # the chunks of all the documents not cached are scored together,
+        # and the scores of the chunks of a document are pooled
+        pairs: List[Tuple[str, str]] = []
+        # (input index, document index) of each pair
+        owners: List[Tuple[int, int]] = []
+        for i, inp in enumerate(inputs):
+            misses = [j for j, s in enumerate(similarity_scores[i]) if s is None]
+            if not misses:
+                continue
+            documents = [inp.documents[j] for j in misses]
+            if max_chunks_per_doc is None:
+                chunks, doc_indices = documents, list(range(len(documents)))
+            else:
+                chunks, doc_indices = self._chunk_documents(
+                    inp.query,
+                    documents,
+                    max_chunks_per_doc,
+                    chunk_overlap,
+                    kwargs.get("instruction", None),
+                )
+            pairs.extend((inp.query, chunk) for chunk in chunks)
+            owners.extend((i, misses[k]) for k in doc_indices)
+
+        # reset n tokens
+        self._model.model.n_tokens = 0
+        chunk_scores: Dict[Tuple[int, int], List[float]] = defaultdict(list)
+        for owner, score in zip(owners, self._score_pairs(pairs, **kwargs)):
+            chunk_scores[owner].append(score)
+        pool = max if chunk_pooling == "max" else np.mean
+        for (i, j), scores in chunk_scores.items():
+            similarity_scores[i][j] = float(pool(scores))
+            if cache is not None:
+                cache.put(keys[i][j], similarity_scores[i][j])  # type: ignore
+
+        pair_lengths = [0] * len(inputs)
+        for (i, _), (query, doc) in zip(owners, pairs):
+            pair_lengths[i] += len(query) + len(doc)
+        tokens = split_tokens(self._model.model.n_tokens, pair_lengths)
+        results = [
+            self._build_result(inp, similarity_scores[i], tokens[i])  # type: ignore
+            for i, inp in enumerate(inputs)
+        ]
 
         del similarity_scores
         # clear cache if possible
@@ -423,7 +721,57 @@ class RerankModel:
             gc.collect()
             empty_cache()
 
-        return Rerank(id=str(uuid.uuid1()), results=docs, meta=metadata)
+        return results
+
+    def rerank(
+        self,
+        documents: List[str],
+        query: str,
+        top_n: Optional[int],
+        max_chunks_per_doc: Optional[int],
+        return_documents: Optional[bool],
+        return_len: Optional[bool],
+        **kwargs,
+    ) -> Rerank:
+        return self.rerank_batch(
+            [RerankInput(documents, query, top_n, return_documents, return_len)],
+            max_chunks_per_doc,
+            **kwargs,
+        )[0]
+
+    async def async_rerank(
+        self,
+        documents: List[str],
+        query: str,
+        top_n: Optional[int],
+        max_chunks_per_doc: Optional[int],
+        return_documents: Optional[bool],
+        return_len: Optional[bool],
+        **kwargs,
+    ) -> Rerank:
+        """
+        Rerank by the batcher with the documents of other concurrent requests if enabled.
+        """
+        if self._batcher is not None:
+            return await self._batcher.rerank(
+                documents,
+                query,
+                top_n,
+                max_chunks_per_doc,
+                return_documents,
+                return_len,
+                **kwargs,
+            )
+        return await asyncio.to_thread(
+            self.rerank,
+            documents,
+            query,
+            top_n,
+            max_chunks_per_doc,
+            return_documents,
+            return_len,
+            **kwargs,
+        )
 
 
 def create_rerank_model_instance(
@@ -0,0 +1,92 @@
+# Copyright 2022-2025 XProbe Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# seconds a score is cached by default
+DEFAULT_SCORE_CACHE_TTL = 3600
+
+
+def get_score_key(
+    model_uid: str, args: Dict[str, Any], query: str, document: str
+) -> Tuple[bytes, bytes, bytes]:
+    """
+    The key of the score of the query and the document, reranked by the model with the arguments,
+    e.g. the instruction and the chunking of the documents.
+    """
+    args_hash = hashlib.sha256(
+        json.dumps([model_uid, args], sort_keys=True, default=str).encode("utf-8")
+    ).digest()
+    query_hash = hashlib.sha256(query.encode("utf-8")).digest()
+    document_hash = hashlib.sha256(document.encode("utf-8")).digest()
+    return args_hash, query_hash, document_hash
+
+
+class RerankScoreCache:
+    """
+    LRU cache of the relevance scores of query-document pairs,
+    with at most `max_entries` scores, each expiring `ttl` seconds after cached.
+    """
+
+    def __init__(self, max_entries: int, ttl: float = DEFAULT_SCORE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # key -> (score, expiration time)
+        self._scores: "OrderedDict[Tuple[bytes, ...], Tuple[float, float]]" = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def get(self, key: Tuple[bytes, ...]) -> Optional[float]:
+        with self._lock:
+            entry = self._scores.get(key)
+            if entry is not None and entry[1] <= time.monotonic():
+                del self._scores[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._scores.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Tuple[bytes, ...], score: float):
+        with self._lock:
+            self._scores[key] = (score, time.monotonic() + self.ttl)
+            self._scores.move_to_end(key)
+            while len(self._scores) > self.max_entries:
+                self._scores.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "num_entries": len(self._scores),
+        }
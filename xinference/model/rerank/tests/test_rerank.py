@@ -210,3 +210,237 @@ def test_auto_detect_type():
         except EnvironmentError:
             # gated repo, ignore
             continue
+
+
+def test_get_token_batches():
+    from ..utils import get_token_batches
+
+    lengths = [3, 10, 4, 9, 2, 30]
+    batches = get_token_batches(lengths, 20)
+    # the longest first, a too long pair is a batch on its own
+    assert batches == [[5], [1, 3], [2, 0, 4]]
+    assert sorted(i for b in batches for i in b) == list(range(len(lengths)))
+    assert get_token_batches([], 20) == []
+
+
+def test_score_in_token_batches():
+    spec = RerankModelFamilyV2(
+        version=2,
+        model_name="Qwen3-Reranker-0.6B",
+        type="normal",
+        max_tokens=40960,
+        language=["en", "zh"],
+        model_id="Qwen/Qwen3-Reranker-0.6B",
+    )
+    model = RerankModel(spec, "mock", model_config={"max_batch_tokens": 400})
+    batches = []
+
+    def tokenize_pairs(pairs):
+        # a token per character of the document
+        return [list(range(len(p.split("<Document>: ")[1]))) for p in pairs]
+
+    def pad_inputs(input_ids):
+        batches.append([len(ids) for ids in input_ids])
+        return input_ids
+
+    model.tokenize_pairs = tokenize_pairs
+    model.pad_inputs = pad_inputs
+    model.compute_logits = lambda inputs: [len(ids) / 1000 for ids in inputs]
+    documents = ["a" * n for n in [10, 150, 20, 120, 90, 15]]
+    scores = model._score("query", documents)
+    assert scores == [n / 1000 for n in [10, 150, 20, 120, 90, 15]]
+    assert batches == [[150, 120], [90, 20, 15, 10]]
+
+
+def test_get_chunk_spans():
+    from ..utils import get_chunk_spans
+
+    assert get_chunk_spans(5, 10, 2, 3) == [(0, 5)]
+    assert get_chunk_spans(20, 8, 2, 10) == [(0, 8), (6, 14), (12, 20)]
+    # the tokens after the last chunk are dropped
+    assert get_chunk_spans(20, 8, 2, 2) == [(0, 8), (6, 14)]
+    assert get_chunk_spans(0, 8, 2, 2) == [(0, 0)]
+
+
+class _WordTokenizer:
+    is_fast = False
+    model_max_length = 1 << 30
+
+    def __call__(self, texts, add_special_tokens=True, **kwargs):
+        return {"input_ids": [t.split() for t in texts]}
+
+    def decode(self, ids):
+        return " ".join(ids)
+
+
+def _create_mock_qwen3_model(max_tokens, scored, **model_config):
+    """
+    A Qwen3 reranker tokenized by words,
+    which scores a document by the number of "x" in it.
+    """
+    spec = RerankModelFamilyV2(
+        version=2,
+        model_name="Qwen3-Reranker-0.6B",
+        type="normal",
+        max_tokens=max_tokens,
+        language=["en", "zh"],
+        model_id="Qwen/Qwen3-Reranker-0.6B",
+    )
+    model_config.setdefault("max_batch_tokens", 1000)
+    model = RerankModel(spec, "mock", model_config=model_config)
+    model._tokenizer = _WordTokenizer()
+
+    class _Wrapper:
+        n_tokens = 0
+
+    class _Model:
+        model = _Wrapper()
+
+    def compute_logits(inputs):
+        scores = []
+        for ids in inputs:
+            doc = ids[ids.index("<Document>:") + 1 :]
+            scored.append(" ".join(doc))
+            scores.append(doc.count("x") / 10)
+            _Model.model.n_tokens += len(ids)
+        return scores
+
+    model._model = _Model()
+    model.tokenize_pairs = lambda pairs: [p.split() for p in pairs]
+    model.pad_inputs = lambda input_ids: input_ids
+    model.compute_logits = compute_logits
+    return model
+
+
+def test_rerank_chunks():
+    scored = []
+    model = _create_mock_qwen3_model(12, scored)
+    # the pair of the query and an empty document has 8 words, the chunks have 4 words
+    query = "q"
+    instruction = "i j k l"
+    long_doc = "x a b c d e f x x g"
+    results = model.rerank(
+        [long_doc, "x y"],
+        query,
+        None,
+        3,
+        False,
+        True,
+        instruction=instruction,
+        chunk_overlap=1,
+    )
+    assert sorted(scored) == sorted(["x a b c", "c d e f", "f x x g", "x y"])
+    assert [(r["index"], r["relevance_score"]) for r in results["results"]] == [
+        (0, 0.2),
+        (1, 0.1),
+    ]
+    # the tokens of all the chunks scored
+    assert results["meta"]["tokens"]["input_tokens"] == 4 * 8 + 4 * 3 + 2
+
+    scored.clear()
+    results = model.rerank(
+        [long_doc],
+        query,
+        None,
+        2,
+        False,
+        False,
+        instruction=instruction,
+        chunk_overlap=1,
+        chunk_pooling="mean",
+    )
+    assert sorted(scored) == ["c d e f", "x a b c"]
+    assert results["results"][0]["relevance_score"] == pytest.approx(0.05)
+    with pytest.raises(ValueError):
+        model.rerank([long_doc], query, None, 0, False, False)
+
+
+def test_rerank_score_cache():
+    from ..score_cache import RerankScoreCache
+
+    scored = []
+    model = _create_mock_qwen3_model(100, scored, score_cache_size=3)
+    cache = model.get_score_cache()
+    results = model.rerank(["x", "x x", "y"], "q", None, None, False, True)
+    assert [r["index"] for r in results["results"]] == [1, 0, 2]
+    # only the documents not cached are scored
+    scored.clear()
+    results = model.rerank(["x x x", "x x", "y"], "q", None, None, False, True)
+    assert scored == ["x x x"]
+    assert [r["index"] for r in results["results"]] == [0, 1, 2]
+    assert results["results"][0]["relevance_score"] == pytest.approx(0.3)
+    assert results["meta"]["tokens"]["input_tokens"] == len(
+        model._format_qwen3_pair("q", "x x x", None).split()
+    )
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 4
+    # the least recently used one is evicted
+    assert len(cache) == 3 and cache.evictions == 1
+
+    # the instruction is a part of the key
+    scored.clear()
+    model.rerank(["x x"], "q", None, None, False, False, instruction="i")
+    assert scored == ["x x"]
+    # opt out
+    scored.clear()
+    model.rerank(["x x"], "q", None, None, False, False, use_score_cache=False)
+    assert scored == ["x x"]
+
+    # expiration
+    cache = RerankScoreCache(10, ttl=0)
+    cache.put((b"a",), 0.5)
+    assert cache.get((b"a",)) is None
+    assert cache.expirations == 1
+
+
+async def test_rerank_batcher():
+    import asyncio
+
+    scored = []
+    model = _create_mock_qwen3_model(
+        100, scored, max_batch_pairs=8, max_batch_wait_time=0.5
+    )
+    batcher = model.get_batcher()
+    assert batcher is not None
+    compute_logits = model.compute_logits
+    num_forwards = 0
+
+    def counting_compute_logits(inputs):
+        nonlocal num_forwards
+        num_forwards += 1
+        if any("boom" in ids for ids in inputs):
+            raise ValueError("bad document")
+        return compute_logits(inputs)
+
+    model.compute_logits = counting_compute_logits
+    requests = [
+        (["x", "x x"], "q1"),
+        (["y", "x x x", "x"], "q2"),
+        (["x y"], "q3"),
+    ]
+    results = await asyncio.gather(
+        *[
+            model.async_rerank(documents, query, None, None, False, True)
+            for documents, query in requests
+        ]
+    )
+    # the pairs of all the requests are scored in one forward
+    assert num_forwards == 1
+    assert batcher.num_batches == 1 and batcher.batch_size == 6
+    assert [r["index"] for r in results[0]["results"]] == [1, 0]
+    assert [r["index"] for r in results[1]["results"]] == [1, 2, 0]
+    assert results[2]["results"][0]["relevance_score"] == pytest.approx(0.1)
+    assert sum(r["meta"]["tokens"]["input_tokens"] for r in results) == sum(
+        len(model._format_qwen3_pair(q, d, None).split())
+        for documents, q in requests
+        for d in documents
+    )
+
+    # a bad request fails alone
+    results = await asyncio.gather(
+        model.async_rerank(["x"], "q", None, None, False, False),
+        model.async_rerank(["boom"], "q", None, None, False, False),
+        return_exceptions=True,
+    )
+    assert results[0]["results"][0]["relevance_score"] == pytest.approx(0.1)
+    assert isinstance(results[1], ValueError)
+    await batcher.stop()
@@ -11,7 +11,7 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from typing import TYPE_CHECKING, Any
+from typing import TYPE_CHECKING, Any, List, Tuple
 
 if TYPE_CHECKING:
     from .core import RerankModelFamilyV2
@@ -34,3 +34,44 @@ def preprocess_sentence(query: str, instruction: Any, model_name: str) -> str:
             if k.lower() in model_name.lower():
                 return f"{v}{query}"
     return query
+
+
+def get_token_batches(lengths: List[int], max_tokens: int) -> List[List[int]]:
+    """
+    Pack the indices of the pairs of `lengths` tokens into batches, the longest first,
+    so that the pairs of similar lengths are padded together,
+    and the padded tokens of a batch are at most `max_tokens`.
+    A pair longer than `max_tokens` is a batch on its own.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: -lengths[i])
+    batches: List[List[int]] = []
+    batch: List[int] = []
+    for i in order:
+        # the first pair of a batch is the longest, the others are padded to it
+        if batch and lengths[batch[0]] * (len(batch) + 1) > max_tokens:
+            batches.append(batch)
+            batch = []
+        batch.append(i)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def get_chunk_spans(
+    num_tokens: int, chunk_tokens: int, overlap: int, max_chunks: int
+) -> List[Tuple[int, int]]:
+    """
+    The token spans of at most `max_chunks` chunks of a document,
+    each of at most `chunk_tokens` tokens and overlapping the previous one by `overlap` tokens.
+    The tokens after the last chunk are dropped.
+    """
+    stride = max(chunk_tokens - overlap, 1)
+    spans: List[Tuple[int, int]] = []
+    start = 0
+    while len(spans) < max_chunks:
+        end = min(start + chunk_tokens, num_tokens)
+        spans.append((start, end))
+        if end >= num_tokens:
+            break
+        start += stride
+    return spans
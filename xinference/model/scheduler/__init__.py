@@ -14,6 +14,13 @@
 
 from .batch import BatchScheduler
 from .core import AbortRequestMessage
+from .policy import SchedulingPolicy, register_scheduling_policy
 from .request import InferenceRequest
 
-__all__ = ["BatchScheduler", "InferenceRequest", "AbortRequestMessage"]
+__all__ = [
+    "BatchScheduler",
+    "InferenceRequest",
+    "AbortRequestMessage",
+    "SchedulingPolicy",
+    "register_scheduling_policy",
+]
@@ -24,6 +24,7 @@ from .core import (
     XINFERENCE_STREAMING_ERROR_FLAG,
     AbortRequestMessage,
 )
+from .policy import get_scheduling_policy
 from .request import InferenceRequest
 
 logger = logging.getLogger(__name__)
@@ -31,7 +32,7 @@ logger = logging.getLogger(__name__)
 
 class BatchScheduler:
     def __init__(self, model):
-        self._waiting_queue: deque[InferenceRequest] = deque()  # type: ignore
+        self._policy = get_scheduling_policy(model.get_scheduling_policy())
         self._running_queue: deque[InferenceRequest] = deque()  # type: ignore
         self._model = model
         self._id_to_req = {}
@@ -70,7 +71,6 @@ class BatchScheduler:
         if self._model is None:
             return None
         max_num_seqs = self.get_max_num_seqs()
-        # currently, FCFS strategy
         running_list: List[InferenceRequest] = []
         while len(self._running_queue) > 0:
             if len(running_list) == max_num_seqs:
@@ -80,15 +80,65 @@ class BatchScheduler:
             running_list.append(req)
 
         waiting_list: List[InferenceRequest] = []
-        if len(running_list) < max_num_seqs:
-            while len(self._waiting_queue) > 0:
-                req = self._waiting_queue.popleft()
-                self._check_request_aborted(req)
-                waiting_list.append(req)
-                if len(running_list) + len(waiting_list) == max_num_seqs:
-                    break
-        # must waiting_list in front
-        return waiting_list + running_list
+        if self._abort_req_ids:
+            # the aborted requests may wait long behind others, just finish them
+            for req in list(self._policy):
+                if req.request_id in self._abort_req_ids:
+                    self._policy.remove(req)
+                    self._check_request_aborted(req)
+                    waiting_list.append(req)
+        # the order of waiting requests is decided by the scheduling policy
+        while (
+            len(self._policy) > 0
+            and len(running_list) + len(waiting_list) < max_num_seqs
+        ):
+            req = self._policy.pop()
+            self._check_request_aborted(req)
+            waiting_list.append(req)
+        if (
+            len(self._policy) > 0
+            and self._policy.preemptive
+            and self._model.support_preemption()
+        ):
+            self._preempt(running_list, waiting_list)
+        # requests being prefilled must be in front, since they join the batch in front,
+        # and the ones started prefilling by chunks go first
+        prefilling_list = [r for r in running_list if r.is_prefill]
+        decoding_list = [r for r in running_list if not r.is_prefill]
+        return prefilling_list + waiting_list + decoding_list
+
+    def _preempt(
+        self, running_list: List[InferenceRequest], waiting_list: List[InferenceRequest]
+    ):
+        """
+        Preempt running requests for the waiting ones when the batch is full.
+        The KV cache of preempted requests is dropped,
+        and they are prefilled again when they are scheduled later.
+        """
+        while len(self._policy) > 0:
+            req = self._policy.peek()
+            decoding = [r for r in running_list if not r.is_prefill and not r.stopped]
+            victim = self._policy.preempt(decoding, req)
+            if victim is None:
+                break
+            logger.debug(
+                "Preempt request %s for request %s", victim.request_id, req.request_id
+            )
+            batch = [r for r in running_list if r.kv_cache is not None]
+            kv_cache = victim.kv_cache
+            victim.kv_cache = None
+            reduced_kv_cache = self._model.build_reduced_kv_cache(
+                kv_cache, {batch.index(victim)}
+            )
+            for r in batch:
+                if r is not victim:
+                    r.kv_cache = reduced_kv_cache
+            running_list.remove(victim)
+            victim.is_prefill = True
+            victim.padding_len = 0
+            self._policy.remove(req)
+            waiting_list.append(req)
+            self._policy.add(victim)
 
     @staticmethod
     def _empty_cache():
@@ -102,9 +152,16 @@ class BatchScheduler:
         if not req_list:
             return
         self._model.batch_inference(req_list)
+        self._policy.update(req_list)
 
         stopped_batch_indexes = set()
-        for idx, r in enumerate(req_list):
+        # index of the request in the batch of KV cache, which holds the requests
+        # prefilled only, not the ones being prefilled or resumed from preemption
+        batch_idx = -1
+        for r in req_list:
+            in_batch = r.kv_cache is not None and not r.is_prefill
+            if in_batch:
+                batch_idx += 1
             if r.stream:
                 for completion in r.completion:
                     await r.future_or_queue.put(completion)
@@ -113,8 +170,8 @@ class BatchScheduler:
             if not r.stopped:
                 self._running_queue.append(r)
             else:
-                if r.new_tokens:
-                    stopped_batch_indexes.add(idx)
+                if in_batch:
+                    stopped_batch_indexes.add(batch_idx)
                 # set kv_cache to None for collection
                 r.kv_cache = None
                 rid = r.request_id
@@ -148,12 +205,13 @@ class BatchScheduler:
                             )
 
         # Some requests have been completed. Batch size needs to be reduced for kv cache.
-        if stopped_batch_indexes and len(self._running_queue) > 0:
-            kv_cache = self._running_queue[0].kv_cache
+        running_batch = [r for r in self._running_queue if r.kv_cache is not None]
+        if stopped_batch_indexes and running_batch:
+            kv_cache = running_batch[0].kv_cache
             reduced_kv_cache = self._model.build_reduced_kv_cache(
                 kv_cache, stopped_batch_indexes
             )
-            for r in self._running_queue:
+            for r in running_batch:
                 r.kv_cache = reduced_kv_cache
 
         self._empty_cache()
@@ -174,7 +232,7 @@ class BatchScheduler:
             if rid in self._id_to_req:
                 raise KeyError(f"Request id: {rid} has already existed!")
             self._id_to_req[rid] = req
-        self._waiting_queue.append(req)
+        self._policy.add(req)
 
     async def abort_request(self, req_id: str) -> str:
         """
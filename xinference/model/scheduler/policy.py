@@ -0,0 +1,210 @@
+# Copyright 2022-2025 XProbe Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Optional, Type
+
+from .request import InferenceRequest
+
+
+class SchedulingPolicy:
+    """
+    Decide which waiting requests join the batch first,
+    and which running requests are preempted for them when the batch is full.
+    Waiting requests are ordered by `sort_key`, and then by their arrival time.
+    """
+
+    # whether this policy preempts running requests
+    preemptive = False
+
+    def __init__(self):
+        self._waiting: List[InferenceRequest] = []
+
+    def __len__(self) -> int:
+        return len(self._waiting)
+
+    def __iter__(self) -> Iterator[InferenceRequest]:
+        return iter(self._waiting)
+
+    def sort_key(self, req: InferenceRequest) -> Any:
+        """
+        Requests with smaller keys are scheduled first.
+        """
+        return 0
+
+    def _best(self) -> int:
+        return min(
+            range(len(self._waiting)),
+            key=lambda i: (
+                self.sort_key(self._waiting[i]),
+                self._waiting[i].arrival_time,
+            ),
+        )
+
+    def add(self, req: InferenceRequest):
+        """
+        Add a new request, or a running request which is preempted.
+        """
+        self._waiting.append(req)
+
+    def peek(self) -> InferenceRequest:
+        return self._waiting[self._best()]
+
+    def pop(self) -> InferenceRequest:
+        return self._waiting.pop(self._best())
+
+    def remove(self, req: InferenceRequest):
+        self._waiting.remove(req)
+
+    def preempt(
+        self, running: List[InferenceRequest], req: InferenceRequest
+    ) -> Optional[InferenceRequest]:
+        """
+        The running request to preempt for the waiting `req`, None for no preemption.
+        """
+        return None
+
+    def update(self, req_list: List[InferenceRequest]):
+        """
+        Called with the requests of the batch after each step.
+        """
+
+
+class FCFSPolicy(SchedulingPolicy):
+    """
+    First come, first served.
+    """
+
+    def _best(self) -> int:
+        # the preempted requests never come back, so the list is in arrival order
+        return 0
+
+
+class PriorityPolicy(SchedulingPolicy):
+    """
+    Requests with higher `priority` in the generate config are scheduled first,
+    defaults to 0. When the batch is full, the running request with the lowest priority
+    is preempted for a waiting request with a higher one.
+    """
+
+    preemptive = True
+
+    @staticmethod
+    def get_priority(req: InferenceRequest) -> int:
+        if req.generate_config is None:
+            return 0
+        return int(req.generate_config.get("priority") or 0)
+
+    def sort_key(self, req: InferenceRequest) -> Any:
+        return -self.get_priority(req)
+
+    def preempt(
+        self, running: List[InferenceRequest], req: InferenceRequest
+    ) -> Optional[InferenceRequest]:
+        if not running:
+            return None
+        # the lowest priority, and the latest arrived one among them
+        victim = min(running, key=lambda r: (self.get_priority(r), -r.arrival_time))
+        if self.get_priority(victim) < self.get_priority(req):
+            return victim
+        return None
+
+
+class SJFPolicy(SchedulingPolicy):
+    """
+    Shortest expected job first, the job length is expected by `max_tokens`.
+    Requests without `max_tokens` are scheduled last.
+    """
+
+    def sort_key(self, req: InferenceRequest) -> Any:
+        max_tokens = (
+            req.generate_config.get("max_tokens")
+            if req.generate_config is not None
+            else None
+        )
+        return max_tokens or float("inf")
+
+
+class FairSharePolicy(SchedulingPolicy):
+    """
+    Share the batch among the users in the `user` field of the generate config.
+    The request of the user who has been served the fewest tokens is scheduled first.
+    A user becoming active starts from the fewest served tokens of the active users,
+    so that it cannot take the whole batch with the credit of its idle time.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._served_tokens: Dict[str, int] = defaultdict(int)
+        # number of unfinished requests of each user
+        self._active_requests: Dict[str, int] = defaultdict(int)
+        # number of tokens of each request counted in the served tokens
+        self._counted_tokens: Dict[InferenceRequest, int] = {}
+
+    @staticmethod
+    def get_user(req: InferenceRequest) -> str:
+        if req.generate_config is None:
+            return ""
+        return req.generate_config.get("user") or ""
+
+    def sort_key(self, req: InferenceRequest) -> Any:
+        return self._served_tokens[self.get_user(req)]
+
+    def add(self, req: InferenceRequest):
+        user = self.get_user(req)
+        if req not in self._counted_tokens:
+            active = [u for u, n in self._active_requests.items() if n > 0]
+            if self._active_requests[user] == 0 and active:
+                self._served_tokens[user] = max(
+                    self._served_tokens[user],
+                    min(self._served_tokens[u] for u in active),
+                )
+            self._active_requests[user] += 1
+            self._counted_tokens[req] = 0
+        super().add(req)
+
+    def update(self, req_list: List[InferenceRequest]):
+        for r in req_list:
+            if r not in self._counted_tokens:
+                continue
+            user = self.get_user(r)
+            num_tokens = len(r.new_tokens)
+            if num_tokens and r.prompt_tokens is not None:
+                num_tokens += len(r.prompt_tokens)
+            self._served_tokens[user] += num_tokens - self._counted_tokens[r]
+            self._counted_tokens[r] = num_tokens
+            if r.stopped:
+                del self._counted_tokens[r]
+                self._active_requests[user] -= 1
+
+
+SCHEDULING_POLICIES: Dict[str, Type[SchedulingPolicy]] = {
+    "fcfs": FCFSPolicy,
+    "priority": PriorityPolicy,
+    "sjf": SJFPolicy,
+    "fair": FairSharePolicy,
+}
+
+
+def register_scheduling_policy(name: str, policy_cls: Type[SchedulingPolicy]):
+    SCHEDULING_POLICIES[name] = policy_cls
+
+
+def get_scheduling_policy(name: str) -> SchedulingPolicy:
+    if name not in SCHEDULING_POLICIES:
+        raise ValueError(
+            f"Unsupported scheduling policy: {name}, "
+            f"must be one of {', '.join(SCHEDULING_POLICIES)}"
+        )
+    return SCHEDULING_POLICIES[name]()
@@ -13,6 +13,7 @@
 # limitations under the License.
 
 import functools
+import time
 import uuid
 from typing import List, Optional, Tuple
 
@@ -58,10 +59,18 @@ class InferenceRequest:
         self._sanitized_generate_config = None
         # Chunk id for results. In stream mode, all the chunk ids should be same.
         self._stream_chunk_id = str(uuid.uuid4())
+        # For scheduling
+        self.arrival_time = time.time()
         # For calculate attention mask if needed
         self.padding_len = 0
+        # KV cache of the prompt tokens computed before the prefill finishes,
+        # from the prefix cache or the prefilled chunks
+        self.cached_prefix = None
         # Use in stream mode
         self.last_output_length = 0
+        # Incremental detokenizer for new tokens, created by the model when needed.
+        # Use in stream mode and for stop string matching
+        self.detokenizer = None
         # For tool call
         self.tools = None
         # Currently, for storing tool call streaming results.
@@ -144,6 +153,15 @@ class InferenceRequest:
     def new_tokens(self):
         return self._new_tokens
 
+    @property
+    def prefill_tokens(self) -> List[int]:
+        """
+        Tokens whose KV cache is computed by prefill.
+        A preempted request prefills its generated tokens again when resumed,
+        except the last one, which is the input of the next decode.
+        """
+        return self._prompt_tokens + self._new_tokens[:-1]
+
     def append_new_token(self, token: int):
         self._new_tokens.append(token)
 
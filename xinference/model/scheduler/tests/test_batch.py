@@ -0,0 +1,106 @@
+# Copyright 2022-2025 XProbe Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+
+from ..batch import BatchScheduler
+
+
+class MockModel:
+    """
+    Emulates the KV cache of the default batching mode: the cache is the list of its rows,
+    which are the requests fully prefilled in a step and then the decoding ones.
+    A request resumed from preemption is prefilled in 2 steps, as by chunks,
+    and every request in the cache gets a token per step.
+    """
+
+    def __init__(self):
+        self.reduced_rows = []
+
+    def get_scheduling_policy(self):
+        return "priority"
+
+    def get_max_num_seqs(self):
+        return 3
+
+    def support_preemption(self):
+        return True
+
+    def build_reduced_kv_cache(self, cache, skipped_indexes):
+        assert all(0 <= i < len(cache) for i in skipped_indexes)
+        self.reduced_rows.append([cache[i] for i in sorted(skipped_indexes)])
+        return [r for i, r in enumerate(cache) if i not in skipped_indexes]
+
+    def batch_inference(self, req_list):
+        decoding = [r for r in req_list if not r.is_prefill and not r.stopped]
+        for r in decoding:
+            # the cache of a decoding request holds all the decoding requests
+            assert r.kv_cache == decoding
+        prefilled = []
+        for r in req_list:
+            if not r.is_prefill or r.stopped:
+                continue
+            if r.new_tokens and r.cached_prefix is None:
+                # the first chunk of a resumed request
+                r.cached_prefix = "chunk"
+                continue
+            r.cached_prefix = None
+            r.is_prefill = False
+            prefilled.append(r)
+        cache = prefilled + decoding
+        for r in cache:
+            r.kv_cache = cache
+            r.append_new_token(0)
+            if len(r.new_tokens) >= r.generate_config["max_tokens"]:
+                r.stopped = True
+                r.completion = [len(r.new_tokens)]
+
+
+async def test_preempt_resume_stop():
+    model = MockModel()
+    scheduler = BatchScheduler(model)
+    loop = asyncio.get_running_loop()
+
+    async def _add(max_tokens, priority=0):
+        future = loop.create_future()
+        await scheduler.add_request(
+            "", future, "generate", {"max_tokens": max_tokens, "priority": priority}
+        )
+        return future
+
+    futures = [await _add(10), await _add(4), await _add(3)]
+    await scheduler.step()
+    long_req, short_req, victim = scheduler._running_queue
+    # the latest arrived one is preempted for a higher priority
+    futures.append(await _add(2, priority=1))
+    await scheduler.step()
+    assert victim.is_prefill and victim.kv_cache is None
+
+    # the high priority request stops, and the victim resumes in its slot
+    await scheduler.step()
+    assert futures[3].result() == 2
+    # the short request stops while the victim is still being prefilled,
+    # which has tokens but no row in the KV cache
+    await scheduler.step()
+    assert futures[1].result() == 4
+    assert victim.is_prefill and victim.new_tokens
+    assert model.reduced_rows[-1] == [short_req]
+
+    while not all(f.done() for f in futures):
+        await scheduler.step()
+    assert futures[0].result() == 10
+    assert futures[2].result() == 3
+    for rows in model.reduced_rows:
+        assert all(r.stopped for r in rows)
+    assert long_req.kv_cache is None
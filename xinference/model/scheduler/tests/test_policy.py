@@ -0,0 +1,117 @@
+# Copyright 2022-2025 XProbe Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from ..policy import get_scheduling_policy
+from ..request import InferenceRequest
+
+
+def _make_request(arrival_time, **generate_config):
+    r = InferenceRequest("", None, True, "generate", generate_config)
+    r.arrival_time = arrival_time
+    return r
+
+
+def _pop_all(policy):
+    res = []
+    while len(policy) > 0:
+        res.append(policy.pop())
+    return res
+
+
+def test_fcfs_policy():
+    policy = get_scheduling_policy("fcfs")
+    reqs = [_make_request(i, priority=i) for i in range(3)]
+    for r in reqs:
+        policy.add(r)
+    assert policy.peek() is reqs[0]
+    assert _pop_all(policy) == reqs
+    assert policy.preempt(reqs, _make_request(3, priority=10)) is None
+
+
+def test_priority_policy():
+    policy = get_scheduling_policy("priority")
+    reqs = [
+        _make_request(0),
+        _make_request(1, priority=2),
+        _make_request(2, priority=1),
+        _make_request(3, priority=2),
+    ]
+    for r in reqs:
+        policy.add(r)
+    assert _pop_all(policy) == [reqs[1], reqs[3], reqs[2], reqs[0]]
+
+    running = [_make_request(4, priority=1), _make_request(5), _make_request(6)]
+    # the lowest priority, and the latest arrived one among them
+    assert policy.preempt(running, _make_request(7, priority=1)) is running[2]
+    assert policy.preempt(running, _make_request(7)) is None
+    assert policy.preempt([], _make_request(7, priority=1)) is None
+
+
+def test_sjf_policy():
+    policy = get_scheduling_policy("sjf")
+    reqs = [
+        _make_request(0),
+        _make_request(1, max_tokens=512),
+        _make_request(2, max_tokens=16),
+        _make_request(3, max_tokens=512),
+    ]
+    for r in reqs:
+        policy.add(r)
+    assert _pop_all(policy) == [reqs[2], reqs[1], reqs[3], reqs[0]]
+
+
+def test_fair_share_policy():
+    policy = get_scheduling_policy("fair")
+    a = [_make_request(i, user="a") for i in range(3)]
+    b = [_make_request(3 + i, user="b") for i in range(2)]
+    for r in a + b:
+        policy.add(r)
+
+    # user `a` is served 10 tokens, then `b` goes first
+    r = policy.pop()
+    assert r is a[0]
+    r.prompt_tokens = [0] * 8
+    r.append_new_token(1)
+    r.append_new_token(2)
+    policy.update([r])
+    assert policy.pop() is b[0]
+
+    # a new user starts from the fewest served tokens of the active users,
+    # which is 0 of `b`, rather than taking the batch with its idle time
+    c = _make_request(5, user="c")
+    policy.add(c)
+    assert _pop_all(policy) == [b[1], c, a[1], a[2]]
+
+    # all requests of `a` finish, and `a` comes back with its own served tokens,
+    # which are fewer than the ones of `b` but more than the ones of `c`
+    for r in a:
+        r.stopped = True
+    b[0].prompt_tokens = [0] * 99
+    b[0].append_new_token(1)
+    policy.update(a + [b[0]])
+    reqs = [
+        _make_request(6, user="b"),
+        _make_request(7, user="a"),
+        _make_request(8, user="c"),
+    ]
+    for r in reqs:
+        policy.add(r)
+    assert _pop_all(policy) == [reqs[2], reqs[1], reqs[0]]
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        get_scheduling_policy("unknown")
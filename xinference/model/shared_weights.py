@@ -0,0 +1,239 @@
+# Copyright 2022-2025 XProbe Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import ctypes
+import hashlib
+import json
+import logging
+import os
+import sys
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from .offload import find_torch_modules
+
+if TYPE_CHECKING:
+    import torch
+
+logger = logging.getLogger(__name__)
+
+# bytes the offsets of the tensors in a shared weights file are aligned to
+SHARED_WEIGHTS_ALIGNMENT = 64
+# bytes of each tensor hashed to tell apart the weights with the same layout,
+# e.g. the same model with different LoRA adapters
+FINGERPRINT_BYTES = 4096
+
+
+def _get_shared_params(
+    modules: List["torch.nn.Module"],
+) -> List[Tuple[str, "torch.nn.Parameter"]]:
+    # buffers are not shared, since some models update them in place
+    params: Dict[int, Tuple[str, "torch.nn.Parameter"]] = {}
+    for i, module in enumerate(modules):
+        for name, param in module.named_parameters():
+            if param.device.type == "cpu" and param.is_contiguous():
+                params.setdefault(id(param), (f"{i}.{name}", param))
+    return list(params.values())
+
+
+def _get_shared_weights_key(
+    model_path: str, params: List[Tuple[str, "torch.nn.Parameter"]]
+) -> str:
+    layout = [(name, str(p.dtype), list(p.shape)) for name, p in params]
+    h = hashlib.sha256(
+        json.dumps([os.path.abspath(model_path), layout]).encode("utf-8")
+    )
+    for _, p in params:
+        h.update(_as_bytes(p.data.flatten()[: FINGERPRINT_BYTES // p.element_size()]))
+    return h.hexdigest()
+
+
+def _as_bytes(tensor: "torch.Tensor") -> memoryview:
+    import torch
+
+    # numpy has no bfloat16
+    return memoryview(tensor.detach().contiguous().view(torch.uint8).numpy())
+
+
+def _release_free_memory():
+    # the private copies of the weights may be kept in the heap after freed
+    if sys.platform.startswith("linux"):
+        try:
+            ctypes.CDLL("libc.so.6").malloc_trim(0)
+        except (OSError, AttributeError):
+            pass
+
+
+def _lock_shared(path: str) -> Optional[int]:
+    """
+    Open the file with a shared lock, which is held while the file is mapped,
+    None if the file is removed before locked, or locks are not supported.
+    """
+    if os.name != "posix":
+        return None
+    import fcntl
+
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return None
+    fcntl.flock(fd, fcntl.LOCK_SH)
+    try:
+        if os.stat(path).st_ino == os.fstat(fd).st_ino:
+            return fd
+    except FileNotFoundError:
+        pass
+    os.close(fd)
+    return None
+
+
+def _remove_if_unused(path: str) -> bool:
+    """
+    Remove the file if no process holds a shared lock on it.
+    """
+    if os.name != "posix":
+        return False
+    import fcntl
+
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        if os.stat(path).st_ino != os.fstat(fd).st_ino:
+            return False
+        os.remove(path)
+        return True
+    except OSError:
+        # locked by the other processes mapping it, or removed already
+        return False
+    finally:
+        os.close(fd)
+
+
+class SharedWeightsFile:
+    """
+    A shared weights file mapped by this process, which holds a shared lock on it until released,
+    so that the last process releasing the file removes it.
+    """
+
+    def __init__(self, path: str, size: int, fd: Optional[int]):
+        self.path = path
+        self.size = size
+        self._fd = fd
+
+    def release(self):
+        if self._fd is None:
+            return
+        os.close(self._fd)
+        self._fd = None
+        if _remove_if_unused(self.path):
+            logger.info("Shared weights file %s is removed", self.path)
+
+
+def _write_shared_file(
+    path: str,
+    params: List[Tuple[str, "torch.nn.Parameter"]],
+    offsets: List[int],
+    size: int,
+) -> Optional[int]:
+    # written to a temporary file first, so other replicas never map a partial file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        for (_, p), offset in zip(params, offsets):
+            f.seek(offset)
+            f.write(_as_bytes(p.data))
+        f.truncate(size)
+    if os.path.exists(path) and os.path.getsize(path) == size:
+        # written by another replica in the meantime
+        os.remove(tmp_path)
+        return _lock_shared(path)
+    # locked before it's visible, so it's never removed as unused before mapped
+    fd = _lock_shared(tmp_path)
+    os.replace(tmp_path, path)
+    return fd
+
+
+def share_cpu_weights(
+    modules: List["torch.nn.Module"], model_path: str, directory: str
+) -> Optional[SharedWeightsFile]:
+    """
+    Replace the CPU parameters of the modules by the ones in a read-only memory-mapped file
+    under `directory`, which is written by the first replica on the node and mapped by the others,
+    so the replicas share one copy of the weights in the page cache.
+    The pages are mapped copy-on-write, a replica writing its weights only changes its own copy.
+    Return the file mapped, which is removed when all the replicas release it,
+    None if there are no CPU weights.
+    """
+    import torch
+
+    params = _get_shared_params(modules)
+    if not params:
+        return None
+    offsets = []
+    size = 0
+    for _, p in params:
+        offsets.append(size)
+        nbytes = p.numel() * p.element_size()
+        size += -(-nbytes // SHARED_WEIGHTS_ALIGNMENT) * SHARED_WEIGHTS_ALIGNMENT
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{_get_shared_weights_key(model_path, params)}.bin")
+    written = os.path.exists(path) and os.path.getsize(path) == size
+    fd = _lock_shared(path) if written else None
+    if fd is None and (not written or os.name == "posix"):
+        # not written yet, or removed by the last replica before locked
+        fd = _write_shared_file(path, params, offsets, size)
+    storage = torch.UntypedStorage.from_file(path, shared=False, nbytes=size)
+    for (_, p), offset in zip(params, offsets):
+        p.data = torch.empty(0, dtype=p.dtype).set_(
+            storage, offset // p.element_size(), p.shape
+        )
+    _release_free_memory()
+    logger.info("%.2f MiB of weights are shared by %s", size / 1024**2, path)
+    return SharedWeightsFile(path, size, fd)
+
+
+class SharedWeightsMixin:
+    """
+    Let the replicas of a model on the same node share one copy of the weights on CPU,
+    enabled by `share_weights` at launch.
+    """
+
+    _share_weights: bool = False
+    _shared_weights_file: Optional[SharedWeightsFile] = None
+
+    def _get_shared_weights_targets(self) -> List[Any]:
+        return [getattr(self, "_model", None)]
+
+    def share_weights(self, directory: Optional[str] = None) -> int:
+        if not self._share_weights:
+            return 0
+        if directory is None:
+            from ..constants import XINFERENCE_CACHE_DIR
+
+            directory = os.path.join(XINFERENCE_CACHE_DIR, "shared_weights")
+        modules = find_torch_modules(*self._get_shared_weights_targets())
+        shared = share_cpu_weights(modules, getattr(self, "_model_path"), directory)
+        if shared is None:
+            return 0
+        self._shared_weights_file = shared
+        return shared.size
+
+    def release_shared_weights(self):
+        """
+        Called when the model is terminated, the file is removed by the last replica.
+        """
+        if self._shared_weights_file is not None:
+            self._shared_weights_file.release()
+            self._shared_weights_file = None
@@ -0,0 +1,82 @@
+# Copyright 2022-2025 XProbe Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+import torch
+
+from ..offload import SleepModelMixin, WeightOffloader, find_torch_modules
+
+
+class MockWrapper:
+    def __init__(self, model):
+        self.model = model
+
+
+class MockPipeline:
+    def __init__(self, **components):
+        self.components = components
+
+
+class MockSleepModel(SleepModelMixin):
+    def __init__(self, model):
+        self._model = model
+        self.num_cache_frees = 0
+
+    def _free_device_caches(self):
+        self.num_cache_frees += 1
+
+
+def test_find_torch_modules():
+    encoder = torch.nn.Linear(4, 4)
+    decoder = torch.nn.Linear(4, 4)
+    assert find_torch_modules(encoder) == [encoder]
+    assert find_torch_modules(MockWrapper(encoder)) == [encoder]
+    # the components shared by pipelines are found once
+    pipeline = MockPipeline(encoder=encoder, decoder=decoder, scheduler=object())
+    assert find_torch_modules(
+        pipeline, MockPipeline(encoder=encoder), None, object()
+    ) == [encoder, decoder]
+
+
+def test_sleep_model():
+    model = MockSleepModel(torch.nn.Linear(4, 4))
+    model.sleep()
+    assert model.is_sleeping()
+    assert model.num_cache_frees == 1
+    # sleeping again is a no-op
+    model.sleep()
+    assert model.num_cache_frees == 1
+    model.wake()
+    assert not model.is_sleeping()
+
+    with pytest.raises(ValueError):
+        MockSleepModel(object()).sleep()
+    assert not MockSleepModel(object()).is_sleeping()
+
+
+@pytest.mark.skipif(not torch.cuda.is_available(), reason="CUDA is not available")
+def test_offload_weights():
+    module = torch.nn.Linear(1024, 1024).cuda()
+    weight = module.weight.detach().cpu().clone()
+    allocated = torch.cuda.memory_allocated()
+
+    offloader = WeightOffloader([module])
+    assert offloader.offload() == (1024 * 1024 + 1024) * 4
+    assert module.weight.device.type == "cpu"
+    assert module.weight.is_pinned()
+    assert torch.cuda.memory_allocated() < allocated
+
+    offloader.restore()
+    assert module.weight.device.type == "cuda"
+    assert torch.equal(module.weight.detach().cpu(), weight)
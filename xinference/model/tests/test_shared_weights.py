@@ -0,0 +1,114 @@
+# Copyright 2022-2025 XProbe Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+
+import psutil
+import pytest
+import torch
+
+from ..shared_weights import SharedWeightsMixin, share_cpu_weights
+
+
+def _create_model(seed: int = 0, num_layers: int = 4, dim: int = 1024):
+    torch.manual_seed(seed)
+    return torch.nn.Sequential(*[torch.nn.Linear(dim, dim) for _ in range(num_layers)])
+
+
+class MockModel(SharedWeightsMixin):
+    def __init__(self, model_path: str, share_weights: bool):
+        self._model_path = model_path
+        self._model = _create_model()
+        self._share_weights = share_weights
+
+
+def test_share_cpu_weights(tmp_path):
+    directory = str(tmp_path / "shared")
+    model = _create_model()
+    expected = {k: v.clone() for k, v in model.state_dict().items()}
+    x = torch.randn(2, 1024)
+    y = model(x)
+
+    shared = share_cpu_weights([model], "/models/mock", directory)
+    assert shared.size == sum(p.numel() * p.element_size() for p in model.parameters())
+    assert len(os.listdir(directory)) == 1
+    for k, v in model.state_dict().items():
+        assert torch.equal(v, expected[k])
+    assert torch.allclose(model(x), y)
+
+    # the same weights are mapped from the same file
+    other = _create_model()
+    other_shared = share_cpu_weights([other], "/models/mock", directory)
+    assert other_shared.path == shared.path
+    assert len(os.listdir(directory)) == 1
+    # a replica writing its weights only changes its own copy
+    with torch.no_grad():
+        other[0].weight.zero_()
+    assert torch.equal(model[0].weight, expected["0.weight"])
+
+    # different weights, e.g. with LoRA adapters, are not mixed up
+    share_cpu_weights([_create_model(seed=1)], "/models/mock", directory)
+    assert len(os.listdir(directory)) == 2
+
+    assert MockModel("/models/mock", False).share_weights(directory) == 0
+
+
+@pytest.mark.skipif(os.name != "posix", reason="File locks are only used on POSIX")
+def test_release_shared_weights(tmp_path):
+    directory = str(tmp_path / "shared")
+    replicas = [MockModel("/models/mock", True) for _ in range(2)]
+    for model in replicas:
+        assert model.share_weights(directory) > 0
+    assert len(os.listdir(directory)) == 1
+
+    # the file is removed by the last replica released
+    replicas[0].release_shared_weights()
+    assert len(os.listdir(directory)) == 1
+    replicas[1].release_shared_weights()
+    replicas[1].release_shared_weights()
+    assert os.listdir(directory) == []
+    # the weights are still mapped
+    assert torch.equal(replicas[0]._model[0].weight, replicas[1]._model[0].weight)
+
+    # and written again for the next replica
+    assert MockModel("/models/mock", True).share_weights(directory) > 0
+    assert len(os.listdir(directory)) == 1
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="PSS is only available on Linux")
+def test_shared_weights_memory(tmp_path):
+    directory = str(tmp_path / "shared")
+    process = psutil.Process()
+    num_replicas = 4
+    # 4 layers of 2048 x 2048 float32, 64 MiB
+    model_size = 4 * 2048 * 2048 * 4
+
+    def _memory() -> int:
+        # the proportional RSS, which counts the pages shared by N mappings 1 / N each
+        return process.memory_full_info().pss
+
+    start = _memory()
+    replicas = []
+    for _ in range(num_replicas):
+        model = MockModel("/models/mock", True)
+        model._model = _create_model(dim=2048)
+        model.share_weights(directory)
+        # touch all the weights
+        for p in model._model.parameters():
+            p.sum()
+        replicas.append(model)
+    growth = _memory() - start
+    # the replicas hold one copy of the weights instead of `num_replicas`
+    assert growth < 1.5 * model_size
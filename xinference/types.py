@@ -71,8 +71,9 @@ class EmbeddingUsage(TypedDict):
 class EmbeddingData(TypedDict):
     index: int
     object: str
-    # support sparse embedding
-    embedding: Union[List[float], Dict[str, float]]
+    # support sparse embedding, and the encoded embedding of `encoding_format`
+    # base64 or binary
+    embedding: Union[List[float], Dict[str, float], str, bytes]
 
 
 class Embedding(TypedDict):
@@ -116,7 +117,7 @@ class RerankTokens(TypedDict):
 class Meta(TypedDict):
     api_version: Optional[ApiVersion]
     billed_units: Optional[BilledUnit]
-    tokens: RerankTokens
+    tokens: Optional[RerankTokens]
     warnings: Optional[List[str]]
 
 
@@ -263,6 +264,8 @@ class PytorchGenerateConfig(TypedDict, total=False):
     lora_name: Optional[str]
     stream_options: Optional[Union[dict, None]]
     request_id: Optional[str]
+    priority: Optional[int]
+    user: Optional[str]
 
 
 class CogagentGenerateConfig(PytorchGenerateConfig, total=False):
@@ -290,6 +293,15 @@ class PytorchModelConfig(TypedDict, total=False):
     gptq_act_order: bool
     trust_remote_code: bool
     max_num_seqs: int
+    batching_mode: NotRequired[str]
+    enable_prefix_caching: NotRequired[bool]
+    prefix_cache_max_memory: NotRequired[float]
+    chunked_prefill_size: NotRequired[Optional[int]]
+    scheduling_policy: NotRequired[str]
+    speculative_decoding: NotRequired[Optional[str]]
+    num_speculative_tokens: NotRequired[int]
+    speculative_draft_model_path: NotRequired[Optional[str]]
+    speculative_ngram_size: NotRequired[int]
     enable_tensorizer: Optional[bool]
     reasoning_content: bool
     min_pixels: NotRequired[int]
@@ -298,6 +310,7 @@ class PytorchModelConfig(TypedDict, total=False):
     context_length: NotRequired[int]
     torch_dtype: NotRequired[str]
     enable_flash_attn: NotRequired[bool]
+    share_weights: NotRequired[bool]
 
 
 def get_pydantic_model_from_method(
@@ -365,6 +378,7 @@ class CreateCompletionTorch(BaseModel):
     top_k: int = top_k_field
     lora_name: Optional[str]
     request_id: Optional[str]
+    priority: Optional[int]
     chat_template_kwargs: Optional[Union[str, Dict[str, Any]]]
 
 